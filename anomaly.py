@@ -0,0 +1,278 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+
+from vitals import MAX_DEVICES, SIGNALS
+
+# Streaming anomaly detection on the vitals stream. Every device has a row in preallocated
+# arrays holding, per signal, a ring of its last `window` readings with running sum and sum of
+# squares (rolling mean/variance in O(1) per reading), an EWMA mean and variance, and a reference
+# reading for rate-of-change checks. A reading is anomalous when it is
+#   - outside the physiological LIMITS,
+#   - more than z_threshold rolling standard deviations from the rolling mean,
+#   - more than z_threshold EWMA standard deviations from the EWMA, or
+#   - changing faster than MAX_RATE per second since a reference reading RATE_SPAN to about
+#     twice that old (a candidate reading replaces the reference once it is RATE_SPAN old), so
+#     a single noisy step between consecutive readings is not mistaken for a trend.
+# The statistical checks need min_samples readings first. Readings of 0 or less are treated as
+# missing: the ESP32 sensors report 0 while no finger is on them.
+# A batch is processed in rounds holding at most one reading per device, so each round is a
+# handful of array operations however many devices are posting.
+# At most max_devices are tracked: a new device past that takes over the row of the one that
+# posted least recently, which starts learning again from scratch if it comes back.
+
+LIMITS = {
+    'heartRate': (40.0, 150.0),
+    'spo2': (90.0, 100.5),
+    'body_temperature': (35.0, 39.5),
+    'ambient_temperature': (-np.inf, np.inf),
+}
+MAX_RATE = {'heartRate': 20.0, 'spo2': 3.0, 'body_temperature': 0.1, 'ambient_temperature': 0.5}
+RATE_SPAN = 3.0  # seconds; minimum age of the reading a rate is measured against
+RATE_MAX_GAP = 10.0  # seconds; no rate check across longer gaps
+ALERT_HOLD = 10.0  # seconds an alert stays active after its last anomalous reading
+ALERTS_FILE = 'logs/vitals_alerts.json'
+CHECK_INTERVAL = 0.2
+LIMIT, ROLLING, EWMA, RATE = 1, 2, 4, 8
+REASONS = {LIMIT: 'outside physiological range', ROLLING: 'far from rolling mean',
+           EWMA: 'far from recent trend', RATE: 'changing too fast'}
+
+
+class VitalsAnomalyDetector:
+    def __init__(self, window=120, min_samples=20, z_threshold=4.0, ewma_alpha=0.1, capacity=16,
+                 signals=SIGNALS, max_devices=MAX_DEVICES):
+        self.signals = list(signals)
+        self.window = window
+        self.min_samples = min_samples
+        self.z_threshold = z_threshold
+        self.alpha = ewma_alpha
+        self.max_devices = max_devices
+        self.lo = np.array([LIMITS.get(s, (-np.inf, np.inf))[0] for s in self.signals])
+        self.hi = np.array([LIMITS.get(s, (-np.inf, np.inf))[1] for s in self.signals])
+        self.max_rate = np.array([MAX_RATE.get(s, np.inf) for s in self.signals])
+        self.index = OrderedDict()  # device -> row, least recently seen first
+        self.rows_used = 0
+        self.evicted = 0
+        self.capacity = 0
+        self._alloc(min(capacity, max_devices))
+
+    def _alloc(self, capacity):
+        n = len(self.signals)
+        grow = capacity - self.capacity
+
+        def extend(name, shape, fill):
+            new = np.full((grow,) + shape, fill, dtype=np.float64)
+            cur = getattr(self, name, None)
+            setattr(self, name, new if cur is None else np.concatenate([cur, new]))
+
+        extend('buf', (self.window, n), np.nan)
+        extend('count', (n,), 0.0)
+        extend('sum', (n,), 0.0)
+        extend('sumsq', (n,), 0.0)
+        extend('ewma', (n,), np.nan)
+        extend('ewvar', (n,), 0.0)
+        extend('ref_v', (n,), np.nan)
+        extend('ref_t', (n,), np.nan)
+        extend('cand_v', (n,), np.nan)
+        extend('cand_t', (n,), np.nan)
+        pos = np.zeros(grow, dtype=np.int64)
+        self.pos = pos if self.capacity == 0 else np.concatenate([self.pos, pos])
+        self.capacity = capacity
+
+    def _rows(self, devices):
+        # devices: distinct, at most max_devices of them.
+        rows = []
+        for device in devices:
+            row = self.index.get(device)
+            if row is not None:
+                self.index.move_to_end(device)
+            elif self.rows_used < self.max_devices:
+                row = self.index[device] = self.rows_used
+                self.rows_used += 1
+            else:
+                _, row = self.index.popitem(last=False)
+                self.index[device] = row
+                self._reset(row)
+                self.evicted += 1
+            rows.append(row)
+        if self.rows_used > self.capacity:
+            self._alloc(min(max(self.rows_used, 2 * self.capacity), self.max_devices))
+        return np.array(rows, dtype=np.int64)
+
+    def _reset(self, row):
+        self.buf[row] = np.nan
+        self.count[row] = self.sum[row] = self.sumsq[row] = self.ewvar[row] = 0.0
+        self.ewma[row] = self.ref_v[row] = self.ref_t[row] = self.cand_v[row] = self.cand_t[row] = np.nan
+        self.pos[row] = 0
+
+    def update(self, devices, ts, x):
+        # One round: distinct devices, ts (k,), readings x (k, n_signals) with NaN for missing.
+        # Returns a (k, n_signals) array: 0 for normal readings, else a bit mask of REASONS.
+        r = self._rows(devices)
+        x = np.where(x > 0, x, np.nan)
+        valid = ~np.isnan(x)
+        ts = ts[:, None]
+
+        # Checks against the statistics before this reading.
+        with np.errstate(invalid='ignore', divide='ignore'):
+            count = self.count[r]
+            mean = self.sum[r] / count
+            std = np.sqrt(np.maximum(self.sumsq[r] / count - mean ** 2, 0.0))
+            warm = count >= self.min_samples
+            z = np.abs(x - mean) / np.maximum(std, 1e-6)
+            ez = np.abs(x - self.ewma[r]) / np.maximum(np.sqrt(self.ewvar[r]), 1e-6)
+            dt = ts - self.ref_t[r]
+            rate = np.abs(x - self.ref_v[r]) / np.maximum(dt, 1e-3)
+        reasons = np.zeros(x.shape, dtype=np.int64)
+        reasons |= np.where(valid & ((x < self.lo) | (x > self.hi)), LIMIT, 0)
+        reasons |= np.where(valid & warm & (z > self.z_threshold), ROLLING, 0)
+        reasons |= np.where(valid & warm & (ez > self.z_threshold), EWMA, 0)
+        reasons |= np.where(valid & (dt >= RATE_SPAN) & (dt <= RATE_MAX_GAP) & (rate > self.max_rate), RATE, 0)
+
+        # O(1) window update: drop the reading falling out of the ring, add the new one.
+        pos = self.pos[r]
+        old = self.buf[r, pos]
+        had = ~np.isnan(old)
+        self.count[r] -= had
+        self.sum[r] -= np.where(had, old, 0.0)
+        self.sumsq[r] -= np.where(had, old * old, 0.0)
+        self.buf[r, pos] = x
+        self.count[r] += valid
+        self.sum[r] += np.where(valid, x, 0.0)
+        self.sumsq[r] += np.where(valid, x * x, 0.0)
+        self.pos[r] = (pos + 1) % self.window
+        wrapped = r[self.pos[r] == 0]
+        if len(wrapped):
+            # Recomputed exactly once per lap of the ring, so rounding errors cannot pile up.
+            self.sum[wrapped] = np.nansum(self.buf[wrapped], axis=1)
+            self.sumsq[wrapped] = np.nansum(self.buf[wrapped] ** 2, axis=1)
+
+        ewma = self.ewma[r]
+        first = valid & np.isnan(ewma)
+        diff = np.where(valid, x - ewma, 0.0)
+        step = self.alpha * diff
+        self.ewvar[r] = np.where(first, 0.0, np.where(valid, (1 - self.alpha) * (self.ewvar[r] + diff * step),
+                                                      self.ewvar[r]))
+        self.ewma[r] = np.where(first, x, np.where(valid, ewma + step, ewma))
+        with np.errstate(invalid='ignore'):
+            promote = valid & (ts - self.cand_t[r] >= RATE_SPAN)
+        take = promote | (valid & np.isnan(self.cand_t[r]))
+        self.ref_v[r] = np.where(promote, self.cand_v[r], self.ref_v[r])
+        self.ref_t[r] = np.where(promote, self.cand_t[r], self.ref_t[r])
+        self.cand_v[r] = np.where(take, x, self.cand_v[r])
+        self.cand_t[r] = np.where(take, ts, self.cand_t[r])
+        return reasons
+
+
+def describe(mask):
+    return ', '.join(text for bit, text in REASONS.items() if mask & bit)
+
+
+# Runs the detector off the request path: /post only appends to a list, and a background thread
+# scores what arrived every CHECK_INTERVAL. Active alerts (per device and signal) are written to
+# ALERTS_FILE whenever they change; main.py adds them to status.txt and the dashboard shows them.
+class VitalsMonitor:
+    def __init__(self, detector=None, alerts_file=ALERTS_FILE, hold=ALERT_HOLD, interval=CHECK_INTERVAL):
+        self.detector = detector or VitalsAnomalyDetector()
+        self.alerts_file = alerts_file
+        self.hold = hold
+        self.interval = interval
+        self.pending = []
+        self.lock = threading.Lock()
+        self.active = {}  # (device, signal) -> {value, reason, since, last}
+        self.readings = 0
+        self.anomalies = 0
+        self.lag = 0.0  # arrival -> checked, last batch
+        self._write_alerts()
+        self._thread = threading.Thread(target=self._run, name='vitals-monitor', daemon=True)
+        self._thread.start()
+
+    def submit(self, rows):
+        with self.lock:
+            self.pending.extend(rows)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.check()
+            except Exception as e:
+                print("[SERVER] Vitals check failed:", e)
+
+    def check(self, now=None):
+        with self.lock:
+            rows, self.pending = self.pending, []
+        now = time.time() if now is None else now
+        changed = False
+        if rows:
+            changed = self._process(rows)
+        expired = [key for key, alert in self.active.items() if now - alert['last'] > self.hold]
+        for key in expired:
+            del self.active[key]
+        if changed or expired:
+            self._write_alerts()
+
+    def _process(self, rows):
+        signals = self.detector.signals
+        devices, ts, values = [], [], []
+        for row in rows:
+            devices.append(row.get('device_id', ''))
+            ts.append(_float(row.get('ts')))
+            values.append([_float(row.get(s)) for s in signals])
+        now = time.time()
+        ts = np.array(ts)
+        ts = np.where(np.isnan(ts), now, ts)
+        values = np.array(values, dtype=np.float64).reshape(len(rows), len(signals))
+        self.readings += len(rows)
+        self.lag = now - ts.min()
+        # Round k holds the k-th reading of every device in this batch.
+        seen = {}
+        rounds = np.empty(len(rows), dtype=np.int64)
+        for i, d in enumerate(devices):
+            rounds[i] = seen[d] = seen.get(d, -1) + 1
+        changed = False
+        step = self.detector.max_devices
+        for k in range(int(rounds.max()) + 1):
+            round_sel = np.flatnonzero(rounds == k)
+            for lo in range(0, len(round_sel), step):
+                changed |= self._update(round_sel[lo:lo + step], devices, ts, values)
+        return changed
+
+    def _update(self, sel, devices, ts, values):
+        signals = self.detector.signals
+        changed = False
+        reasons = self.detector.update([devices[i] for i in sel], ts[sel], values[sel])
+        for j, s in zip(*np.nonzero(reasons)):
+            i = sel[j]
+            key = (devices[i], signals[s])
+            value, reason = float(values[i, s]), describe(reasons[j, s])
+            alert = self.active.get(key)
+            if alert is None:
+                alert = self.active[key] = {'since': float(ts[i])}
+                print(f"[SERVER] Vitals alert: {devices[i] or 'device'} {signals[s]} = {value:g} ({reason})")
+            # Only `last` moving on is not worth a rewrite of the alerts file.
+            changed |= alert.get('value') != value or alert.get('reason') != reason
+            alert.update(value=value, reason=reason, last=float(ts[i]))
+            self.anomalies += 1
+        return changed
+
+    def alerts(self):
+        return [dict(device=device, signal=signal, **alert) for (device, signal), alert in sorted(self.active.items())]
+
+    def _write_alerts(self):
+        if not self.alerts_file or not os.path.isdir(os.path.dirname(self.alerts_file) or '.'):
+            return
+        tmp = self.alerts_file + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'updated': time.time(), 'alerts': self.alerts()}, f)
+        os.replace(tmp, self.alerts_file)
+
+
+def _float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float('nan')
@@ -0,0 +1,97 @@
+import time
+from collections import deque
+import numpy as np
+
+
+# Groups incoming rows into micro-batches for the model. A batch is released when
+#   - enough rows are pending to fill the target size (floods get full batches),
+#   - the input has gone quiet (a lone row is scored immediately), or
+#   - the oldest pending row has waited out the latency budget.
+# The target size is capped by max_batch_size and by how many rows the model can score
+# within half the latency budget, estimated from the observed per-row cost.
+class MicroBatcher:
+    def __init__(self, max_batch_size=1024, latency_budget=0.05, ewma_alpha=0.2):
+        self.max_batch_size = max_batch_size
+        self.latency_budget = latency_budget
+        self.ewma_alpha = ewma_alpha
+        self._chunks = deque()  # [keys, X, arrival_time]
+        self.pending = 0
+        self.row_cost = None  # seconds per row, EWMA
+        self.batches = 0
+        self.rows = 0
+        self.last_size = 0
+        self.last_wait = 0.0
+        self.last_run = 0.0
+        self.avg_wait = 0.0
+        self.avg_run = 0.0
+        self.max_wait = 0.0
+
+    def add(self, keys, X, now=None):
+        if not len(keys):
+            return
+        self._chunks.append([list(keys), X, time.monotonic() if now is None else now])
+        self.pending += len(keys)
+
+    def target_size(self):
+        if not self.row_cost:
+            return self.max_batch_size
+        return int(max(1, min(self.max_batch_size, 0.5 * self.latency_budget / self.row_cost)))
+
+    def oldest_wait(self, now=None):
+        if not self._chunks:
+            return 0.0
+        return (time.monotonic() if now is None else now) - self._chunks[0][2]
+
+    def ready(self, input_idle=False, now=None):
+        if not self.pending:
+            return False
+        return (self.pending >= self.target_size() or input_idle
+                or self.oldest_wait(now) >= self.latency_budget)
+
+    def take(self, now=None):
+        now = time.monotonic() if now is None else now
+        n = min(self.pending, self.target_size())
+        waited = now - self._chunks[0][2]
+        keys, parts = [], []
+        while len(keys) < n:
+            chunk = self._chunks[0]
+            need = n - len(keys)
+            if len(chunk[0]) <= need:
+                self._chunks.popleft()
+                keys.extend(chunk[0])
+                parts.append(chunk[1])
+            else:
+                keys.extend(chunk[0][:need])
+                parts.append(chunk[1][:need])
+                chunk[0] = chunk[0][need:]
+                chunk[1] = chunk[1][need:]
+        self.pending -= n
+        X = parts[0] if len(parts) == 1 else np.concatenate(parts)
+        return keys, X, waited
+
+    def record(self, size, waited, run_time):
+        a = self.ewma_alpha
+        cost = run_time / max(size, 1)
+        self.row_cost = cost if self.row_cost is None else (1 - a) * self.row_cost + a * cost
+        self.avg_wait = waited if not self.batches else (1 - a) * self.avg_wait + a * waited
+        self.avg_run = run_time if not self.batches else (1 - a) * self.avg_run + a * run_time
+        self.max_wait = max(self.max_wait, waited)
+        self.batches += 1
+        self.rows += size
+        self.last_size = size
+        self.last_wait = waited
+        self.last_run = run_time
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "rows": self.rows,
+            "pending": self.pending,
+            "target_batch_size": self.target_size(),
+            "last_batch_size": self.last_size,
+            "last_wait_ms": self.last_wait * 1000,
+            "last_run_ms": self.last_run * 1000,
+            "avg_wait_ms": self.avg_wait * 1000,
+            "avg_run_ms": self.avg_run * 1000,
+            "max_wait_ms": self.max_wait * 1000,
+        }
@@ -0,0 +1,142 @@
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+# Compares the inference backends of rtp.py. Each backend runs in its own child process so
+# that import time and peak RSS are measured from a clean interpreter. Decisions of every
+# backend are compared with the first one listed (the float32 reference).
+#
+#   python bench_inference.py                      # keras and numpy, dbn_iomt_ids.h5
+#   python bench_inference.py --model combined_model.h5 --rows 200000
+#   python bench_inference.py --backends numpy,int8,float16   # after quantize.py
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SAMPLE_CSV = os.path.join(BASE_DIR, 'logs/network_features_preprocessed.csv')
+
+
+def load_inputs(n_rows, n_features, seed=0):
+    import numpy as np
+    if os.path.exists(SAMPLE_CSV):
+        # Feature columns by name, as rtp.py reads them: the file also carries flow and timing columns.
+        from itertools import islice
+        from rtp import parse_rows
+        with open(SAMPLE_CSV, newline='') as f:
+            header = f.readline()
+            _, X, _ = parse_rows(list(islice(f, n_rows)), header)
+        if len(X):
+            reps = -(-n_rows // len(X))
+            return np.tile(X, (reps, 1))[:n_rows]
+    return np.random.default_rng(seed).normal(size=(n_rows, n_features)).astype(np.float32)
+
+
+def child(backend, model_path, n_rows, batch_sizes, out_path):
+    t0 = time.perf_counter()
+    sys.path.insert(0, BASE_DIR)
+    from rtp import load_model
+    model = load_model(model_path, backend)
+    startup_s = time.perf_counter() - t0
+
+    import numpy as np
+    n_features = getattr(model, 'input_dim', None) or model.get_weights()[0].shape[0]
+    X = load_inputs(n_rows, n_features)
+    model.predict(X[:8], verbose=0)  # warm-up (graph tracing for Keras)
+
+    throughput = {}
+    latency_ms = {}
+    for bs in batch_sizes:
+        runs = max(1, min(n_rows // bs, 2000))
+        t = time.perf_counter()
+        for i in range(runs):
+            model.predict(X[(i * bs) % max(1, n_rows - bs):][:bs], verbose=0)
+        elapsed = time.perf_counter() - t
+        throughput[bs] = runs * bs / elapsed
+        latency_ms[bs] = elapsed / runs * 1000
+
+    decisions = np.argmax(model.predict(X, verbose=0), axis=1)
+    np.save(out_path + '.npy', decisions)
+    with open(out_path, 'w') as f:
+        json.dump({
+            'backend': backend,
+            'startup_s': startup_s,
+            'model_bytes': os.path.getsize(getattr(model, 'path', None) or model_path),
+            'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            'rows_per_s': throughput,
+            'batch_latency_ms': latency_ms,
+        }, f)
+
+
+def run_backend(backend, args):
+    out_path = os.path.join(args.workdir, f'bench_{backend}.json')
+    cmd = [sys.executable, os.path.abspath(__file__), '--child', backend, '--model', args.model,
+           '--rows', str(args.rows), '--batch-sizes', ','.join(map(str, args.batch_sizes)),
+           '--workdir', args.workdir]
+    t = time.perf_counter()
+    proc = subprocess.run(cmd)
+    if proc.returncode != 0:
+        print(f"[BENCH] {backend} backend failed (exit {proc.returncode})")
+        return None
+    with open(out_path) as f:
+        result = json.load(f)
+    result['wall_s'] = time.perf_counter() - t
+    result['decisions_file'] = out_path + '.npy'
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare rtp.py inference backends')
+    parser.add_argument('--model', default=os.path.join(BASE_DIR, 'dbn_iomt_ids.h5'))
+    parser.add_argument('--backends', default='keras,numpy')
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument('--batch-sizes', type=lambda s: [int(x) for x in s.split(',')], default=[1, 32, 1024])
+    parser.add_argument('--workdir', default='/tmp')
+    parser.add_argument('--json', help='write the comparison to this file')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.model, args.rows, args.batch_sizes,
+              os.path.join(args.workdir, f'bench_{args.child}.json'))
+        return
+
+    import numpy as np
+    results = {}
+    for backend in args.backends.split(','):
+        result = run_backend(backend, args)
+        if result:
+            results[backend] = result
+
+    print(f"\nModel: {args.model}, {args.rows} rows")
+    print(f"{'backend':<8} {'startup s':>10} {'peak RSS MB':>12} " +
+          ' '.join(f"{'rows/s @' + str(bs):>14}" for bs in args.batch_sizes))
+    for backend, r in results.items():
+        print(f"{backend:<8} {r['startup_s']:>10.2f} {r['peak_rss_mb']:>12.1f} " +
+              ' '.join(f"{r['rows_per_s'][str(bs)]:>14.0f}" for bs in args.batch_sizes))
+    print(f"{'backend':<8} " + ' '.join(f"{'ms/batch @' + str(bs):>14}" for bs in args.batch_sizes))
+    for backend, r in results.items():
+        print(f"{backend:<8} " + ' '.join(f"{r['batch_latency_ms'][str(bs)]:>14.3f}" for bs in args.batch_sizes))
+
+    if len(results) >= 2:
+        names = list(results)
+        ref = np.load(results[names[0]]['decisions_file'])
+        for name in names[1:]:
+            d = np.load(results[name]['decisions_file'])
+            agreement = float(np.mean(d == ref))
+            # What the monitor acts on: malicious (any class but 0) vs normal.
+            alert_agreement = float(np.mean((d != 0) == (ref != 0)))
+            print(f"{name} vs {names[0]}: argmax agreement {agreement * 100:.3f}% ({int(np.sum(d != ref))} differ), "
+                  f"alert agreement {alert_agreement * 100:.3f}%, model {results[name]['model_bytes'] / 1024:.0f} KiB "
+                  f"vs {results[names[0]]['model_bytes'] / 1024:.0f} KiB")
+            results[name]['argmax_agreement'] = agreement
+            results[name]['alert_agreement'] = alert_agreement
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
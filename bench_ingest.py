@@ -0,0 +1,136 @@
+import argparse
+import http.client
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+# Sustained-ingest benchmark for rts.py: N simulated ESP32s post readings for a fixed time,
+# either one reading per /post or batches through /post_batch. By default the rts app is
+# served in-process (writing to a temp CSV); --host/--port target a running rts.py instead.
+#
+#   python bench_ingest.py --devices 200 --batch 20 --seconds 20
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def reading(device_id):
+    return {
+        "device_id": device_id,
+        "heartRate": round(random.uniform(60, 120), 1),
+        "spo2": round(random.uniform(92, 100), 1),
+        "body_temperature": round(random.uniform(36.0, 37.8), 2),
+        "ambient_temperature": round(random.uniform(20, 28), 2),
+    }
+
+
+def device_loop(host, port, device_id, batch, interval, stop, results):
+    conn = http.client.HTTPConnection(host, port, timeout=10)
+    latencies = []
+    sent = errors = 0
+    while not stop.is_set():
+        if batch > 1:
+            path = "/post_batch"
+            body = json.dumps({"device_id": device_id, "readings": [reading(device_id) for _ in range(batch)]})
+        else:
+            path = "/post"
+            body = json.dumps(reading(device_id))
+        t = time.perf_counter()
+        try:
+            conn.request("POST", path, body, {"Content-Type": "application/json"})
+            resp = conn.getresponse()
+            resp.read()
+            if resp.status == 200:
+                sent += max(batch, 1)
+            else:
+                errors += 1
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            conn.close()
+            conn = http.client.HTTPConnection(host, port, timeout=10)
+        latencies.append(time.perf_counter() - t)
+        if interval:
+            time.sleep(max(0.0, interval - (time.perf_counter() - t)))
+    conn.close()
+    results.append((sent, errors, latencies))
+
+
+def serve_in_process(csv_path):
+    sys.path.insert(0, BASE_DIR)
+    from werkzeug.serving import make_server, WSGIRequestHandler
+    import rts
+    rts.writer = rts.BufferedCsvWriter(csv_path)
+    WSGIRequestHandler.protocol_version = "HTTP/1.1"  # keep-alive, like a real client would use
+    server = make_server("127.0.0.1", 0, rts.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, rts.writer
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark sensor ingestion in rts.py')
+    parser.add_argument('--devices', type=int, default=100)
+    parser.add_argument('--batch', type=int, default=10, help='readings per request (1 = /post)')
+    parser.add_argument('--rate', type=float, default=0, help='requests/s per device (0 = as fast as possible)')
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--host')
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--json', help='write the results to this file')
+    args = parser.parse_args()
+
+    server = writer = None
+    csv_path = None
+    if args.host:
+        host, port = args.host, args.port
+    else:
+        csv_path = os.path.join(tempfile.mkdtemp(), 'livedata.csv')
+        server, writer = serve_in_process(csv_path)
+        host, port = "127.0.0.1", server.server_port
+
+    stop = threading.Event()
+    results = []
+    interval = 1.0 / args.rate if args.rate else 0
+    threads = [threading.Thread(target=device_loop,
+                                args=(host, port, f"esp32-{i:03d}", args.batch, interval, stop, results))
+               for i in range(args.devices)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    sent = sum(r[0] for r in results)
+    errors = sum(r[1] for r in results)
+    latencies = sorted(l for r in results for l in r[2])
+    summary = {
+        "devices": args.devices,
+        "batch": args.batch,
+        "seconds": elapsed,
+        "readings": sent,
+        "readings_per_s": sent / elapsed,
+        "requests_per_s": len(latencies) / elapsed,
+        "errors": errors,
+        "latency_ms_p50": statistics.median(latencies) * 1000 if latencies else None,
+        "latency_ms_p99": latencies[int(len(latencies) * 0.99) - 1] * 1000 if latencies else None,
+    }
+    if writer is not None:
+        writer.flush()
+        summary["rows_written"] = writer.written
+        server.shutdown()
+
+    print(f"{args.devices} devices, {args.batch} reading(s)/request, {elapsed:.1f}s: "
+          f"{summary['readings_per_s']:.0f} readings/s, {summary['requests_per_s']:.0f} requests/s, "
+          f"p50 {summary['latency_ms_p50']:.1f} ms, p99 {summary['latency_ms_p99']:.1f} ms, {errors} errors")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
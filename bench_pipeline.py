@@ -0,0 +1,381 @@
+import argparse
+import json
+import os
+import re
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import synth
+
+# Pipeline benchmark on synthetic traffic (no tcpdump, network or ESP32; tshark is required).
+#
+#   inproc  runs extract -> preprocess -> predict -> detect as library calls over a synthetic
+#           pcap as fast as possible and reports per-stage throughput (plus sensor ingest).
+#   e2e     launches rtf.py, rtc.py and rtp.py as real processes in a scratch directory, appends
+#           packets to the capture at --pps and measures packet -> decision latency (p50/p99),
+#           attack start -> alert delay, per-stage throughput and child CPU/RSS. A list of rates
+#           (--pps 500,2000,8000) finds where lag starts to build up.
+#
+#   python bench_pipeline.py inproc --packets 50000 --mix benign=0.7,syn_flood=0.3
+#   python bench_pipeline.py e2e --pps 1000,4000 --seconds 20 --transport shm
+#
+# Results are saved as JSON under bench_results/ (with the git revision) for comparison.
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(BASE_DIR, 'bench_results')
+ROW_RE = re.compile(r"^Row (\d+): (ALERT: Malicious|Normal).*src_ip: ?(\S*)")
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR, text=True,
+                              stdout=subprocess.PIPE, stderr=subprocess.DEVNULL).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def own_usage():
+    r = resource.getrusage(resource.RUSAGE_SELF)
+    return {'cpu_s': r.ru_utime + r.ru_stime, 'peak_rss_mb': r.ru_maxrss / 1024}
+
+
+def proc_usage(pid):
+    # CPU seconds and peak RSS of a live child from /proc (Linux).
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            stat = f.read().rsplit(')', 1)[1].split()
+        with open(f'/proc/{pid}/status') as f:
+            hwm = next((int(line.split()[1]) for line in f if line.startswith('VmHWM')), 0)
+    except OSError:
+        return None
+    ticks = os.sysconf('SC_CLK_TCK')
+    return {'cpu_s': (int(stat[11]) + int(stat[12])) / ticks, 'peak_rss_mb': hwm / 1024}
+
+
+def detection_engine():
+    import detection
+    return detection.DetectionEngine(
+        window_seconds=detection.DETECT_WINDOW_SECONDS, window_size=detection.DETECT_WINDOW_SIZE,
+        min_count=detection.DETECT_MIN_COUNT, min_ratio=detection.DETECT_MIN_RATIO,
+        min_rate=detection.DETECT_MIN_RATE)
+
+
+def timed(results, name, rows, fn, *args):
+    t = time.perf_counter()
+    out = fn(*args)
+    elapsed = time.perf_counter() - t
+    results[name] = {'rows': rows, 'seconds': elapsed, 'rows_per_s': rows / elapsed if elapsed else None}
+    return out
+
+
+def run_inproc(args, workdir):
+    import numpy as np
+    from pcapstream import PcapTail
+    import rtf
+    from scaling import RunningScaler
+    from rtp import load_model
+
+    pcap = os.path.join(workdir, 'synthetic.pcap')
+    labels = synth.write_pcap(pcap, args.packets, pps=args.pps[0], mix=args.mix,
+                              attack_start=args.attack_start, seed=args.seed)
+    stages = {}
+
+    def extract():
+        tail = PcapTail(pcap)
+        rows = []
+        while True:
+            chunk, n = tail.read_new(args.chunk_bytes)
+            if not n:
+                return rows
+            rows.extend(rtf.extract_rows(chunk))
+
+    rows = timed(stages, 'extract', len(labels), extract)
+
+    def preprocess():
+        scaler = RunningScaler(len(rtf.fields) - 1)
+        out = []
+        for i in range(0, len(rows), args.batch):
+            X = rtf.rows_to_array(rows[i:i + args.batch])
+            scaler.partial_fit(X)
+            out.append(scaler.transform(X))
+        return np.concatenate(out) if out else np.zeros((0, len(rtf.fields) - 1), np.float32)
+
+    X = timed(stages, 'preprocess', len(rows), preprocess)
+    model = timed(stages, 'model_load', 1, load_model, args.model, args.backend)
+
+    def predict():
+        return np.concatenate([np.argmax(model.predict(X[i:i + args.batch], verbose=0), axis=1)
+                               for i in range(0, len(X), args.batch)]) if len(X) else np.zeros(0, int)
+
+    decisions = timed(stages, 'predict', len(X), predict)
+
+    def detect():
+        engine = detection_engine()
+        alerts = {}
+        for i, (row, malicious) in enumerate(zip(rows, decisions.tolist())):
+            t = i / args.pps[0]  # traffic time
+            if engine.update(row[0], bool(malicious), t):
+                alerts.setdefault(row[0], t)
+        return alerts
+
+    alerts = timed(stages, 'detect', len(rows), detect)
+    attack_ips = sorted({ip for kind, ip in labels if kind != 'benign' and ip})
+    result = {
+        'mode': 'inproc',
+        'packets': len(labels),
+        'rows_extracted': len(rows),
+        'stages': stages,
+        'end_to_end_rows_per_s': len(rows) / sum(s['seconds'] for k, s in stages.items() if k != 'model_load'),
+        'malicious_ratio': float(np.mean(decisions)) if len(decisions) else None,
+        'alerts': {ip: {'traffic_time_s': t} for ip, t in alerts.items()},
+        'missed_attackers': [ip for ip in attack_ips if ip not in alerts],
+        'sensor_ingest': bench_sensor_ingest(args, workdir),
+        'usage': own_usage(),
+    }
+    return result
+
+
+def bench_sensor_ingest(args, workdir):
+    try:
+        import rts
+    except ImportError as e:
+        return {'skipped': str(e)}
+    rts.writer = rts.BufferedCsvWriter(os.path.join(workdir, 'livedata.csv'))
+    client = rts.app.test_client()
+    batches = list(synth.sensor_readings(args.sensor_devices, args.sensor_batch, args.seed))
+    t = time.perf_counter()
+    for device_id, readings in batches:
+        client.post('/post_batch', json={'device_id': device_id, 'readings': readings})
+    rts.writer.flush()
+    elapsed = time.perf_counter() - t
+    n = sum(len(r) for _, r in batches)
+    return {'devices': args.sensor_devices, 'readings': n, 'seconds': elapsed,
+            'readings_per_s': n / elapsed if elapsed else None, 'rows_written': rts.writer.written}
+
+
+class PacedCapture:
+    # Appends synthetic packets to a growing pcap at a fixed rate, remembering when each was written.
+    def __init__(self, path, args, pps):
+        self.path = path
+        self.packets = list(synth.generate(int(args.seconds * pps), pps=pps, mix=args.mix,
+                                           attack_start=args.attack_start, seed=args.seed))
+        self.pps = pps
+        self.written_at = []
+        self.attack_started_at = None
+        self.done = threading.Event()
+
+    def run(self):
+        with open(self.path, 'wb') as f:
+            writer = synth.PcapWriter(f)
+            f.flush()
+            start = time.monotonic()
+            i = 0
+            while i < len(self.packets):
+                due = int((time.monotonic() - start) * self.pps) + 1
+                now = time.monotonic()
+                while i < min(due, len(self.packets)):
+                    ts, kind, ip, frame = self.packets[i]
+                    writer.write(ts, frame)
+                    self.written_at.append(now)
+                    if kind != 'benign' and self.attack_started_at is None:
+                        self.attack_started_at = now
+                    i += 1
+                f.flush()
+                time.sleep(0.005)
+        self.done.set()
+
+
+class StageCounter:
+    # Tracks how many records a stage has produced over time (CSV rows or ring write cursor).
+    def __init__(self, name, path=None, ring=None):
+        self.name = name
+        self.path = path
+        self.ring = ring
+        self.count = 0
+        self.first = self.last = None
+        self._offset = 0
+        self._lines = 0
+
+    def poll(self, now):
+        if self.ring is not None:
+            count = self.ring.written
+        else:
+            try:
+                with open(self.path, 'rb') as f:
+                    f.seek(self._offset)
+                    data = f.read()
+                end = data.rfind(b'\n') + 1
+                self._offset += end
+                self._lines += data[:end].count(b'\n')
+            except FileNotFoundError:
+                pass
+            count = max(0, self._lines - 1)  # minus the header
+        if count > self.count:
+            self.first = self.first or now
+            self.last = now
+            self.count = count
+
+    def summary(self):
+        span = (self.last - self.first) if self.first and self.last and self.last > self.first else None
+        return {'rows': self.count, 'rows_per_s': self.count / span if span else None}
+
+
+def run_e2e_rate(args, workdir, pps):
+    logs = os.path.join(workdir, 'logs')
+    shutil.rmtree(logs, ignore_errors=True)
+    os.makedirs(logs)
+    env = dict(os.environ, IDS_TRANSPORT=args.transport, IDS_MODEL_BACKEND=args.backend,
+               IDS_MODEL_PATH=os.path.abspath(args.model), PYTHONUNBUFFERED='1')
+    rings = []
+    if args.transport == 'shm':
+        from shmring import ShmRing, FEATURES_RING, SCALED_RING
+        import rtf
+        rings = [ShmRing.create(FEATURES_RING, 65536, len(rtf.fields) - 1),
+                 ShmRing.create(SCALED_RING, 65536, len(rtf.fields) - 1)]
+    capture = PacedCapture(os.path.join(logs, 'esp32_traffic.pcap'), args, pps)
+    feeder = threading.Thread(target=capture.run, daemon=True)
+    feeder.start()
+    while not os.path.exists(capture.path):
+        time.sleep(0.01)
+
+    procs = {name: subprocess.Popen([sys.executable, os.path.join(BASE_DIR, script)], cwd=workdir, env=env,
+                                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+             for name, script in (('predict', 'rtp.py'), ('preprocess', 'rtc.py'), ('extract', 'rtf.py'))}
+    if rings:
+        counters = [StageCounter('extract', ring=rings[0]), StageCounter('preprocess', ring=rings[1])]
+    else:
+        counters = [StageCounter('extract', os.path.join(logs, 'network_features.csv')),
+                    StageCounter('preprocess', os.path.join(logs, 'network_features_preprocessed.csv'))]
+
+    from tailing import FileTail
+    log = FileTail(os.path.join(logs, 'prediction_output.log'))
+    engine = detection_engine()
+    latencies = []
+    alerts = {}
+    decided = 0
+    usage = {}
+    deadline = None
+    while True:
+        lines = log.read_lines()
+        now = time.monotonic()
+        for line in lines:
+            m = ROW_RE.match(line)
+            if not m:
+                continue
+            row, malicious, ip = int(m.group(1)), m.group(2) != 'Normal', m.group(3)
+            decided += 1
+            if row <= len(capture.written_at):
+                latencies.append(now - capture.written_at[row - 1])
+            if engine.update(ip, malicious, now) and ip not in alerts and capture.attack_started_at:
+                alerts[ip] = now - capture.attack_started_at
+        for c in counters:
+            c.poll(now)
+        for name, p in procs.items():
+            u = proc_usage(p.pid)
+            if u:
+                usage[name] = u
+        if capture.done.is_set():
+            deadline = deadline or now + args.drain_timeout
+            if decided >= len(capture.packets) or now > deadline:
+                break
+        if not lines:
+            time.sleep(0.01)
+
+    for p in procs.values():
+        p.terminate()
+    for p in procs.values():
+        try:
+            p.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            p.kill()
+    for ring in rings:
+        ring.close()
+
+    stages = {c.name: c.summary() for c in counters}
+    stages['predict'] = {'rows': decided}
+    return {
+        'pps': pps,
+        'packets': len(capture.packets),
+        'decided': decided,
+        'backlog_at_end': len(capture.packets) - decided,
+        'latency_ms_p50': (percentile(latencies, 50) or 0) * 1000,
+        'latency_ms_p99': (percentile(latencies, 99) or 0) * 1000,
+        'latency_ms_max': max(latencies) * 1000 if latencies else None,
+        'alert_delay_s': alerts,
+        'stages': stages,
+        'children': usage,
+    }
+
+
+def run_e2e(args, workdir):
+    runs = []
+    for pps in args.pps:
+        print(f"[BENCH] e2e at {pps:g} packets/s for {args.seconds:g}s ({args.transport} transport)...")
+        r = run_e2e_rate(args, workdir, pps)
+        print(f"[BENCH]   {r['decided']}/{r['packets']} decided, p50 {r['latency_ms_p50']:.1f} ms, "
+              f"p99 {r['latency_ms_p99']:.1f} ms, backlog {r['backlog_at_end']}")
+        runs.append(r)
+    return {'mode': 'e2e', 'transport': args.transport, 'runs': runs}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the rtf -> rtc -> rtp -> monitor pipeline')
+    parser.add_argument('mode', choices=['inproc', 'e2e'])
+    parser.add_argument('--packets', type=int, default=20000, help='inproc: packets to generate')
+    parser.add_argument('--pps', type=lambda s: [float(x) for x in s.split(',')], default=[1000.0])
+    parser.add_argument('--seconds', type=float, default=10, help='e2e: capture length per rate')
+    parser.add_argument('--mix', type=synth.parse_mix, default={'benign': 0.7, 'syn_flood': 0.2, 'http_flood': 0.1})
+    parser.add_argument('--attack-start', type=float, default=2.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--model', default=os.path.join(BASE_DIR, 'dbn_iomt_ids.h5'))
+    parser.add_argument('--backend', default='numpy', choices=['numpy', 'keras'])
+    parser.add_argument('--transport', default='file', choices=['file', 'shm'])
+    parser.add_argument('--batch', type=int, default=1024)
+    parser.add_argument('--chunk-bytes', type=int, default=4 * 1024 * 1024)
+    parser.add_argument('--drain-timeout', type=float, default=30)
+    parser.add_argument('--sensor-devices', type=int, default=200)
+    parser.add_argument('--sensor-batch', type=int, default=50)
+    parser.add_argument('--output', help='JSON file (default: bench_results/pipeline-<mode>-<time>.json)')
+    args = parser.parse_args()
+
+    sys.path.insert(0, BASE_DIR)
+    if not shutil.which('tshark'):
+        sys.exit("tshark is required for feature extraction")
+    workdir = tempfile.mkdtemp(prefix='ids-bench-')
+    try:
+        result = run_inproc(args, workdir) if args.mode == 'inproc' else run_e2e(args, workdir)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    result.update({
+        'revision': git_revision(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'config': {k: v for k, v in vars(args).items()},
+    })
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"pipeline-{args.mode}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(output, 'w') as f:
+        json.dump(result, f, indent=2)
+    if args.mode == 'inproc':
+        for name, s in result['stages'].items():
+            rate = f"{s['rows_per_s']:.0f} rows/s" if s['rows_per_s'] else '-'
+            print(f"[BENCH] {name:<11} {s['seconds'] * 1000:9.1f} ms  {rate}")
+    print(f"[BENCH] Results written to {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,207 @@
+import heapq
+import math
+import os
+import queue
+import subprocess
+import threading
+import time
+
+SET_NAME = "ids_blocked"
+
+
+# Applies blocks through one hash:ip ipset matched by a single iptables rule, so lookups stay
+# O(1) however many addresses are blocked. A batch of changes is one `ipset restore` call.
+class IpsetBackend:
+    def __init__(self, set_name=SET_NAME, sudo=True):
+        self.set_name = set_name
+        self.prefix = ["sudo"] if sudo else []
+
+    def _run(self, args, input=None):
+        return subprocess.run(self.prefix + args, input=input, text=True,
+                              stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+
+    def setup(self):
+        self._run(["ipset", "create", self.set_name, "hash:ip", "timeout", "0", "-exist"])
+        rule = ["INPUT", "-m", "set", "--match-set", self.set_name, "src", "-j", "DROP"]
+        if self._run(["iptables", "-C"] + rule).returncode != 0:
+            self._run(["iptables", "-I", rule[0], "1"] + rule[1:])
+
+    def apply(self, adds, removes):
+        # timeout 0 means permanent, so round short TTLs up to a whole second
+        lines = [f"add {self.set_name} {ip} timeout {math.ceil(ttl) if ttl else 0}" for ip, ttl in adds]
+        lines += [f"del {self.set_name} {ip}" for ip in removes]
+        result = self._run(["ipset", "restore", "-exist"], input="\n".join(lines) + "\n")
+        if result.returncode != 0:
+            print(f"[BLOCK] ipset restore failed: {result.stdout.strip()}")
+        return result.returncode == 0
+
+    def persist(self):
+        # netfilter-persistent saves the ipset (ipset-persistent plugin) and the iptables rule.
+        self._run(["netfilter-persistent", "save"])
+
+
+# Records what would be run instead of touching the firewall; for tests and non-root runs.
+class DryRunBackend:
+    def __init__(self, verbose=True):
+        self.verbose = verbose
+        self.blocked = set()
+        self.calls = []
+
+    def setup(self):
+        self.calls.append(("setup",))
+
+    def apply(self, adds, removes):
+        self.calls.append(("apply", list(adds), list(removes)))
+        self.blocked.update(ip for ip, _ in adds)
+        self.blocked.difference_update(removes)
+        if self.verbose:
+            print(f"[BLOCK] (dry run) +{[ip for ip, _ in adds]} -{list(removes)}")
+        return True
+
+    def persist(self):
+        self.calls.append(("persist",))
+
+
+BACKENDS = {"ipset": IpsetBackend, "dry-run": DryRunBackend}
+
+
+# Background blocking worker. block()/unblock() only enqueue, so the monitor loop never waits
+# on the firewall. The worker applies whatever has queued up within batch_interval as a single
+# backend call, expires TTL'd blocks, keeps blocked_file (or the event store's blocks table)
+# in sync for rtp.py and the dashboard, and persists the firewall at most once per
+# persist_debounce seconds.
+class Blocker:
+    def __init__(self, backend, blocked_file=None, batch_interval=0.2, persist_debounce=5.0,
+                 default_ttl=0, store=None):
+        self.backend = backend
+        self.blocked_file = blocked_file
+        self.store = store
+        self.batch_interval = batch_interval
+        self.persist_debounce = persist_debounce
+        self.default_ttl = default_ttl
+        self.blocked = {}  # ip -> expiry (time.time()) or None for permanent
+        self._expiries = []  # heap of (expiry, ip)
+        self._queue = queue.Queue()
+        self._persist_due = None
+        self._stop = threading.Event()
+        self._thread = None
+        self.batches = 0
+        self._load()
+
+    def _load(self):
+        if self.store is not None:
+            now = time.time()
+            for ip, expiry in self.store.blocks().items():
+                if expiry is None or expiry > now:
+                    self.blocked[ip] = expiry
+                    if expiry:
+                        heapq.heappush(self._expiries, (expiry, ip))
+            return
+        if self.blocked_file and os.path.exists(self.blocked_file):
+            with open(self.blocked_file) as f:
+                for line in f:
+                    if line.strip():
+                        self.blocked[line.strip()] = None
+
+    def start(self):
+        self.backend.setup()
+        # Re-add what was blocked before the restart, in case the ipset did not survive it
+        # (reboot without a persisted set, set flushed); TTL'd entries keep their remaining time.
+        now = time.time()
+        restored = [(ip, expiry - now if expiry else 0) for ip, expiry in self.blocked.items()
+                    if expiry is None or expiry > now]
+        if restored:
+            self.backend.apply(restored, [])
+            print(f"[BLOCK] Restored {len(restored)} block(s)")
+        self._thread = threading.Thread(target=self._run, name="blocker", daemon=True)
+        self._thread.start()
+        return self
+
+    def block(self, ip, ttl=None):
+        self._queue.put(("add", ip, self.default_ttl if ttl is None else ttl))
+
+    def unblock(self, ip):
+        self._queue.put(("del", ip, None))
+
+    def is_blocked(self, ip):
+        return ip in self.blocked
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+        self._apply_pending()
+        if self._persist_due is not None:
+            self.backend.persist()
+            self._persist_due = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                item = self._queue.get(timeout=self._next_wakeup())
+            except queue.Empty:
+                item = None
+            if item is not None:
+                # Let a burst of blocks accumulate into one batch.
+                time.sleep(self.batch_interval)
+            self._apply_pending([item] if item else [])
+            if self._persist_due is not None and time.monotonic() >= self._persist_due:
+                self.backend.persist()
+                self._persist_due = None
+
+    def _next_wakeup(self):
+        waits = [1.0]
+        if self._expiries:
+            waits.append(self._expiries[0][0] - time.time())
+        if self._persist_due is not None:
+            waits.append(self._persist_due - time.monotonic())
+        return max(0.01, min(waits))
+
+    def _apply_pending(self, items=()):
+        items = list(items)
+        while True:
+            try:
+                items.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        adds, removes = {}, set()
+        for op, ip, ttl in items:
+            if op == "add":
+                adds[ip] = ttl
+                removes.discard(ip)
+            else:
+                removes.add(ip)
+                adds.pop(ip, None)
+        now = time.time()
+        while self._expiries and self._expiries[0][0] <= now:
+            expiry, ip = heapq.heappop(self._expiries)
+            if self.blocked.get(ip) == expiry:
+                # The kernel drops the ipset entry itself; only our bookkeeping needs updating.
+                del self.blocked[ip]
+                removes.add(ip)
+        adds = {ip: ttl for ip, ttl in adds.items() if ip not in self.blocked or ttl}
+        if not adds and not removes:
+            return
+        self.backend.apply(list(adds.items()), sorted(removes))
+        self.batches += 1
+        for ip in removes:
+            self.blocked.pop(ip, None)
+        for ip, ttl in adds.items():
+            expiry = now + ttl if ttl else None
+            self.blocked[ip] = expiry
+            if expiry:
+                heapq.heappush(self._expiries, (expiry, ip))
+        self._write_blocked_file()
+        if self.store is not None:
+            self.store.update_blocks({ip: self.blocked[ip] for ip in adds}, removes, now)
+        if self._persist_due is None:
+            self._persist_due = time.monotonic() + self.persist_debounce
+        print(f"[BLOCK] Applied {len(adds)} block(s), {len(removes)} unblock(s); {len(self.blocked)} blocked")
+
+    def _write_blocked_file(self):
+        if not self.blocked_file:
+            return
+        tmp = self.blocked_file + ".tmp"
+        with open(tmp, "w") as f:
+            f.writelines(ip + "\n" for ip in self.blocked)
+        os.replace(tmp, self.blocked_file)
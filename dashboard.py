@@ -1,8 +1,24 @@
-from flask import Flask, render_template_string, jsonify
-import pandas as pd
+from flask import Flask, Response, render_template_string, jsonify, request
+import csv
+import json
 import os
+import threading
+import time
+from tailing import FileTail
+import metrics
+from vitals import VitalsStore, SIGNALS
 
 app = Flask(__name__)
+STATUS_FILE = 'logs/status.txt'
+SENSOR_FILE = 'logs/livedata.csv'
+BLOCKED_FILE = 'logs/blocked_ips.txt'
+VITALS_ALERTS_FILE = 'logs/vitals_alerts.json'  # active physiological alerts from rts.py
+# "sqlite": status and blocklist are read from the event store (see eventstore.py).
+EVENTS = os.environ.get('IDS_EVENTS', 'text')
+WATCH_INTERVAL = 0.05  # seconds between file checks; changes reach browsers within this
+SSE_KEEPALIVE = 15
+ALERT_PAGE_MAX = 500
+VITALS_BACKFILL_BYTES = 4 * 1024 * 1024  # of livedata.csv read into the charts at start-up
 
 @app.route('/')
 def dashboard():
@@ -22,6 +38,7 @@ def dashboard():
         .bodytemp { color: #e65100; }
         .ambtemp { color: #0097a7; }
         .time { color: #555; }
+        #vitals-alert { color: #c62828; font-weight: bold; font-size: 1.1em; display: none; }
         .benign { color: green; font-size: 2.2em; text-align: center; font-weight: bold; margin-top: 60px;}
         .malicious { color: red; font-size: 2.2em; text-align: center; font-weight: bold; margin-top: 60px; animation: blink 1s linear infinite; letter-spacing: 2px; }
         .averted { color: #1565c0; background: #e3f2fd; font-size: 2.2em; text-align: center; font-weight: bold; margin-top: 60px; animation: blinkblue 1s linear infinite; letter-spacing: 2px; }
@@ -50,6 +67,10 @@ def dashboard():
             overflow-y: auto;
             max-height: 300px;
         }
+        .vitals { margin: 0 40px; padding: 20px 30px; background: #fff; border-radius: 12px; box-shadow: 0 0 10px #ccc; }
+        .vitals h2 { text-align: center; margin: 0 0 10px 0; }
+        #vitals-controls { text-align: center; margin-bottom: 10px; }
+        #vitals-chart { width: 100%; height: 320px; }
         #blocked-ips-btn {
             display: block;
             margin: 0 auto;
@@ -78,12 +99,26 @@ def dashboard():
             <div class="reading spo2" id="spo2">SpO₂: -- %</div>
             <div class="reading bodytemp" id="bodytemp">Body Temp: -- °C</div>
             <div class="reading ambtemp" id="ambtemp">Ambient Temp: -- °C</div>
+            <div id="vitals-alert"></div>
         </div>
         <div class="status">
             <h2>Network Status</h2>
             <div id="status" class="benign">Benign (Normal Traffic)</div>
         </div>
     </div>
+    <div class="vitals">
+        <h2>Vitals History</h2>
+        <div id="vitals-controls">
+            <select id="vitals-device"></select>
+            <select id="vitals-window">
+                <option value="300">5 minutes</option>
+                <option value="3600" selected>1 hour</option>
+                <option value="86400">24 hours</option>
+                <option value="604800">7 days</option>
+            </select>
+        </div>
+        <canvas id="vitals-chart"></canvas>
+    </div>
     <button id="blocked-ips-btn" onclick="toggleBlockedIps()">Show Blocked Devices</button>
     <div id="blocked-ips-box"></div>
     <audio id="alert-audio" src="/static/alert.mp3" style="display:none;"></audio>
@@ -149,18 +184,20 @@ def dashboard():
             }, 4000); // Show blue for 4 seconds then green
         }
 
+        function renderBlockedIps(data) {
+            let box = document.getElementById('blocked-ips-box');
+            if (data.length === 0) {
+                box.innerHTML = "<i>No devices have been blocked yet.</i>";
+            } else {
+                box.innerHTML = "<b>Blocked Devices:</b><br>" +
+                    data.map(ip => "<span style='color:#1565c0'>" + ip + "</span>").join("<br>");
+            }
+        }
+
         function updateBlockedIps() {
             fetch('/blocked_ips')
                 .then(r => r.json())
-                .then(data => {
-                    let box = document.getElementById('blocked-ips-box');
-                    if (data.length === 0) {
-                        box.innerHTML = "<i>No devices have been blocked yet.</i>";
-                    } else {
-                        box.innerHTML = "<b>Blocked Devices:</b><br>" +
-                            data.map(ip => "<span style='color:#1565c0'>" + ip + "</span>").join("<br>");
-                    }
-                });
+                .then(renderBlockedIps);
         }
 
         function toggleBlockedIps() {
@@ -176,98 +213,505 @@ def dashboard():
             }
         }
 
+        function applyStatus(status) {
+            status = status.trim();
+            let statusDiv = document.getElementById('status');
+            if (status === "Halted") {
+                statusDiv.textContent = "ALERT! MALICIOUS ATTACK DETECTED! BLOCKING DEVICE.....";
+                statusDiv.className = "malicious";
+                attackOngoing = true;
+                bluePlayed = false;
+                if (soundEnabled) {
+                    playAlertSoundLoop();
+                }
+            } else if (status.toLowerCase().includes("danger averted")) {
+                if (attackOngoing) {
+                    showAvertedStatus();
+                    attackOngoing = false;
+                }
+            } else {
+                statusDiv.textContent = "Benign (Normal Traffic)";
+                statusDiv.className = "benign";
+                stopAlertSoundLoop();
+                attackOngoing = false;
+                bluePlayed = false;
+            }
+            lastStatus = status;
+        }
+
+        function applySensor(data) {
+            document.getElementById('time').textContent = "Time: " + data.time;
+            document.getElementById('hr').textContent = "Heart Rate: " + data.heartRate + " bpm";
+            document.getElementById('spo2').textContent = "SpO₂: " + data.spo2 + " %";
+            document.getElementById('bodytemp').textContent = "Body Temp: " + data.body_temperature + " °C";
+            document.getElementById('ambtemp').textContent = "Ambient Temp: " + data.ambient_temperature + " °C";
+        }
+
+        function applyVitalsAlerts(alerts) {
+            let box = document.getElementById('vitals-alert');
+            box.style.display = alerts.length ? "block" : "none";
+            box.replaceChildren(...alerts.map(a => {
+                const line = document.createElement("div");
+                line.textContent = "\u26A0 " + (a.device || "sensor") + ": " + a.signal + " " +
+                                   a.value + " (" + a.reason + ")";
+                return line;
+            }));
+        }
+
         function updateDashboard() {
             fetch('/status')
                 .then(r => r.text())
-                .then(status => {
-                    status = status.trim();
-                    let statusDiv = document.getElementById('status');
-                    if (status === "Halted") {
-                        statusDiv.textContent = "ALERT! MALICIOUS ATTACK DETECTED! BLOCKING DEVICE.....";
-                        statusDiv.className = "malicious";
-                        attackOngoing = true;
-                        bluePlayed = false;
-                        if (soundEnabled) {
-                            playAlertSoundLoop();
-                        }
-                    } else if (status.toLowerCase().includes("danger averted")) {
-                        if (attackOngoing) {
-                            showAvertedStatus();
-                            attackOngoing = false;
-                        }
-                    } else {
-                        statusDiv.textContent = "Benign (Normal Traffic)";
-                        statusDiv.className = "benign";
-                        stopAlertSoundLoop();
-                        attackOngoing = false;
-                        bluePlayed = false;
-                    }
-                    lastStatus = status;
-                });
+                .then(applyStatus);
 
             fetch('/sensor')
                 .then(r => r.json())
-                .then(data => {
-                    document.getElementById('time').textContent = "Time: " + data.time;
-                    document.getElementById('hr').textContent = "Heart Rate: " + data.heartRate + " bpm";
-                    document.getElementById('spo2').textContent = "SpO₂: " + data.spo2 + " %";
-                    document.getElementById('bodytemp').textContent = "Body Temp: " + data.body_temperature + " °C";
-                    document.getElementById('ambtemp').textContent = "Ambient Temp: " + data.ambient_temperature + " °C";
+                .then(applySensor);
+
+            fetch('/vitals_alerts')
+                .then(r => r.json())
+                .then(applyVitalsAlerts);
+        }
+
+        // The server pushes every change over one Server-Sent Events stream; browsers without
+        // EventSource fall back to polling.
+        if (window.EventSource) {
+            let lastState = {};
+            const events = new EventSource('/events');
+            events.addEventListener('state', function(e) {
+                let state = JSON.parse(e.data);
+                if (state.status !== lastState.status || state.status_version !== lastState.status_version) {
+                    applyStatus(state.status);
+                }
+                applySensor(state.sensor);
+                applyVitalsAlerts(state.vitals_alerts);
+                if (document.getElementById('blocked-ips-box').style.display === "block") {
+                    renderBlockedIps(state.blocked_ips);
+                }
+                lastState = state;
+            });
+        } else {
+            setInterval(updateDashboard, 2000);
+            updateDashboard();
+        }
+
+        // Vitals charts: one lane per signal, each scaled to its own range. The server returns
+        // about one point per pixel column, whatever the window.
+        const VITALS = [["heartRate", "Heart Rate", "#1976d2"], ["spo2", "SpO₂", "#43a047"],
+                        ["body_temperature", "Body Temp", "#e65100"], ["ambient_temperature", "Ambient Temp", "#0097a7"]];
+
+        function drawVitals(data) {
+            const canvas = document.getElementById('vitals-chart');
+            canvas.width = canvas.clientWidth;
+            canvas.height = canvas.clientHeight;
+            const ctx = canvas.getContext('2d');
+            ctx.clearRect(0, 0, canvas.width, canvas.height);
+            const lane = canvas.height / VITALS.length;
+            const x = t => (t - data.start) / (data.end - data.start) * canvas.width;
+            ctx.font = "12px Arial";
+            VITALS.forEach(([key, label, color], i) => {
+                const s = data.signals[key];
+                const top = i * lane;
+                ctx.fillStyle = "#555";
+                ctx.fillText(label, 4, top + 14);
+                if (!s || !s.t.length) return;
+                const lo = s.v ? s.v : s.min, hi = s.v ? s.v : s.max;
+                const vals = lo.concat(hi).filter(v => v !== null);
+                let min = Math.min(...vals), max = Math.max(...vals);
+                if (max === min) { min -= 1; max += 1; }
+                const y = v => top + lane - 6 - (v - min) / (max - min) * (lane - 24);
+                ctx.fillText(max.toFixed(1) + " / " + min.toFixed(1), canvas.width - 90, top + 14);
+                ctx.strokeStyle = color;
+                ctx.fillStyle = color;
+                ctx.beginPath();
+                s.t.forEach((t, j) => {
+                    if (s.v) {
+                        j ? ctx.lineTo(x(t), y(s.v[j])) : ctx.moveTo(x(t), y(s.v[j]));
+                    } else {
+                        ctx.moveTo(x(t), y(s.min[j]));
+                        ctx.lineTo(x(t), y(s.max[j]));
+                    }
                 });
+                ctx.stroke();
+            });
         }
-        setInterval(updateDashboard, 2000);
-        updateDashboard();
+
+        function updateVitals() {
+            const deviceSelect = document.getElementById('vitals-device');
+            fetch('/api/vitals/devices').then(r => r.json()).then(devices => {
+                const current = deviceSelect.value;
+                // Device ids come from the sensors: set them as text, never as markup.
+                deviceSelect.replaceChildren(...devices.map(d => {
+                    const option = document.createElement("option");
+                    option.value = option.textContent = d.device;
+                    return option;
+                }));
+                if (devices.some(d => d.device === current)) deviceSelect.value = current;
+                if (!devices.length) return;
+                const window_s = document.getElementById('vitals-window').value;
+                const points = document.getElementById('vitals-chart').clientWidth;
+                const method = window_s > 3600 ? "minmax" : "lttb";
+                fetch('/api/vitals?device=' + encodeURIComponent(deviceSelect.value) + '&window=' + window_s +
+                      '&points=' + points + '&method=' + method)
+                    .then(r => r.json())
+                    .then(drawVitals);
+            });
+        }
+        document.getElementById('vitals-window').addEventListener('change', updateVitals);
+        document.getElementById('vitals-device').addEventListener('change', updateVitals);
+        setInterval(updateVitals, 5000);
+        updateVitals();
     </script>
 </body>
 </html>
 """)
 
+EMPTY_SENSOR = {
+    "time": "--",
+    "heartRate": "--",
+    "spo2": "--",
+    "body_temperature": "--",
+    "ambient_temperature": "--"
+}
+
+
+def tail_lines(path, block):
+    # Complete lines among the last `block` bytes of path.
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        f.seek(max(0, size - block))
+        lines = f.read().splitlines()
+    if size > block:
+        lines = lines[1:]  # probably cut in the middle
+    return [line.decode(errors='replace') for line in lines]
+
+
+def last_line(path, block=4096):
+    lines = tail_lines(path, block)
+    return lines[-1] if lines else ''
+
+
+def _float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float('nan')
+
+
+# Latest status, sensor reading and blocklist, kept in memory and refreshed by one watcher
+# thread. Files are only re-read when their mtime/size changes; livedata.csv is tailed from
+# its last offset. With the event store, status and blocklist are re-read only when another
+# process has committed to it. Every change bumps the version and wakes the SSE streams, which
+# all share the same pre-serialised payload.
+class LatestState:
+    def __init__(self, status_file=STATUS_FILE, sensor_file=SENSOR_FILE, blocked_file=BLOCKED_FILE, store=None):
+        self.status_file = status_file
+        self.blocked_file = blocked_file
+        self.store = store
+        self._status_stamp = None
+        self.sensor_tail = FileTail(sensor_file, header=True)
+        self.status = "Normal"
+        self.status_version = 0
+        self.sensor = dict(EMPTY_SENSOR)
+        self.blocked_ips = []
+        self.vitals_alerts = []
+        self.vitals = VitalsStore()
+        self.version = 0
+        self.payload = self._serialise()
+        self.cond = threading.Condition()
+        self._stamps = {}
+
+    def _changed(self, path):
+        try:
+            st = os.stat(path)
+            stamp = (st.st_ino, st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            stamp = None
+        if self._stamps.get(path, ()) == stamp:
+            return False
+        self._stamps[path] = stamp
+        return True
+
+    def _serialise(self):
+        return json.dumps({
+            "version": self.version,
+            "status": self.status,
+            "status_version": self.status_version,
+            "sensor": self.sensor,
+            "blocked_ips": self.blocked_ips,
+            "vitals_alerts": self.vitals_alerts,
+        })
+
+    def _sensor_row(self, line):
+        columns = next(csv.reader([self.sensor_tail.header or '']))
+        row = next(csv.reader([line]), [])
+        values = dict(zip(columns, row))
+        return {key: values.get(key, '--') or '--' for key in EMPTY_SENSOR}
+
+    def _add_vitals(self, lines, now=None):
+        # Rows carry their time in the ts column (files written before it existed use arrival time).
+        now = time.time() if now is None else now
+        col = {name: i for i, name in enumerate(next(csv.reader([self.sensor_tail.header or ''])))}
+        ts_col, device_col = col.get('ts'), col.get('device_id')
+        signal_cols = [col.get(name) for name in SIGNALS]
+        by_device = {}
+        for row in csv.reader(lines):
+            if not row:
+                continue
+            ts = _float(row[ts_col]) if ts_col is not None and ts_col < len(row) else now
+            device = row[device_col] if device_col is not None and device_col < len(row) else ''
+            entry = by_device.setdefault(device, ([], []))
+            entry[0].append(now if ts != ts else ts)
+            entry[1].append([_float(row[c]) if c is not None and c < len(row) else float('nan') for c in signal_cols])
+        for device, (ts, values) in by_device.items():
+            self.vitals.add(device, ts, values)
+
+    def _refresh_store(self):
+        if not self.store.changed():
+            return False
+        changed = False
+        status, stamp = self.store.status()
+        if status is not None and stamp != self._status_stamp:
+            self._status_stamp = stamp
+            self.status = status.split('\n')[0]
+            self.status_version += 1
+            changed = True
+        blocked = list(self.store.blocks())
+        if blocked != self.blocked_ips:
+            self.blocked_ips = blocked
+            changed = True
+        return changed
+
+    def refresh(self):
+        changed = False
+        if self.store is not None:
+            changed = self._refresh_store()
+        elif self._changed(self.status_file):
+            try:
+                with open(self.status_file) as f:
+                    # The network status; a second line, if any, lists physiological alerts.
+                    status = f.read().strip().split('\n')[0]
+            except OSError:
+                status = "Normal"
+            # Bumped even when the text repeats, so a second attack still replays the alert.
+            self.status = status
+            self.status_version += 1
+            changed = True
+        if self.store is None and self._changed(self.blocked_file):
+            try:
+                with open(self.blocked_file) as f:
+                    self.blocked_ips = [line.strip() for line in f if line.strip()]
+            except OSError:
+                self.blocked_ips = []
+            changed = True
+        if self._changed(VITALS_ALERTS_FILE):
+            try:
+                with open(VITALS_ALERTS_FILE) as f:
+                    self.vitals_alerts = json.load(f)['alerts']
+            except (OSError, ValueError, KeyError):
+                self.vitals_alerts = []
+            changed = True
+        if self.sensor_tail.inode is None and os.path.exists(self.sensor_tail.path):
+            # First look: jump to the end and take the last row instead of reading history.
+            self.sensor_tail.seek_end()
+            line = last_line(self.sensor_tail.path)
+            if line and line != self.sensor_tail.header:
+                self.sensor = self._sensor_row(line)
+                changed = True
+            if 'ts' in next(csv.reader([self.sensor_tail.header or ''])):
+                # Recent history for the charts (without a ts column it could not be placed in time).
+                self._add_vitals([l for l in tail_lines(self.sensor_tail.path, VITALS_BACKFILL_BYTES)
+                                  if l != self.sensor_tail.header])
+        else:
+            lines = self.sensor_tail.read_lines()
+            if lines:
+                self.sensor = self._sensor_row(lines[-1])
+                self._add_vitals(lines)
+                changed = True
+        if changed:
+            with self.cond:
+                self.version += 1
+                self.payload = self._serialise()
+                self.cond.notify_all()
+
+    def watch(self, interval=WATCH_INTERVAL):
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"[DASHBOARD] Refresh failed: {e}")
+            time.sleep(interval)
+
+    def wait(self, version, timeout):
+        with self.cond:
+            self.cond.wait_for(lambda: self.version != version, timeout)
+            return self.version, self.payload
+
+
+def open_store():
+    if EVENTS != 'sqlite':
+        return None
+    from eventstore import EventStore, EVENTS_DB
+    return EventStore(EVENTS_DB)
+
+
+state = LatestState(store=open_store())
+
+
+@app.route('/events')
+def events():
+    def stream():
+        version = -1
+        while True:
+            new_version, payload = state.wait(version, SSE_KEEPALIVE)
+            if new_version == version:
+                yield ": keepalive\n\n"
+                continue
+            version = new_version
+            yield f"event: state\ndata: {payload}\n\n"
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/status')
 def status():
-    try:
-        with open('logs/status.txt', 'r') as f:
-            return f.read().strip()
-    except:
-        return "Normal"
+    return state.status
 
 @app.route('/sensor')
 def sensor():
-    try:
-        df = pd.read_csv('logs/livedata.csv')
-        if df.empty:
-            return jsonify({
-                "time": "--",
-                "heartRate": "--",
-                "spo2": "--",
-                "body_temperature": "--",
-                "ambient_temperature": "--"
-            })
-        last = df.iloc[-1]
-        return jsonify({
-            "time": str(last.get('time', '--')),
-            "heartRate": str(last.get('heartRate', '--')),
-            "spo2": str(last.get('spo2', '--')),
-            "body_temperature": str(last.get('body_temperature', '--')),
-            "ambient_temperature": str(last.get('ambient_temperature', '--'))
-        })
-    except:
-        return jsonify({
-            "time": "--",
-            "heartRate": "--",
-            "spo2": "--",
-            "body_temperature": "--",
-            "ambient_temperature": "--"
-        })
+    return jsonify(state.sensor)
+
+@app.route('/vitals_alerts')
+def vitals_alerts():
+    return jsonify(state.vitals_alerts)
 
 @app.route('/blocked_ips')
 def blocked_ips():
+    return jsonify(state.blocked_ips)
+
+# Analytics over the event store's rollups (IDS_EVENTS=sqlite). Ranges are given as start/end
+# (epoch seconds) or as a window in seconds ending now; the store picks minute, hour or day
+# rollups so no query scans more than a few hundred buckets per source.
+
+def _analytics_store():
+    if state.store is None:
+        return None, (jsonify({"error": "analytics need the event store (run with IDS_EVENTS=sqlite)"}), 404)
+    return state.store, None
+
+def _time_range(default_window=3600.0):
+    end = request.args.get('end', type=float) or time.time()
+    start = request.args.get('start', type=float)
+    if start is None:
+        start = end - request.args.get('window', default_window, type=float)
+    return start, end
+
+@app.route('/api/timeline')
+def api_timeline():
+    store, error = _analytics_store()
+    if error:
+        return error
+    start, end = _time_range()
+    if end <= start:
+        return jsonify({"error": "end must be after start"}), 400
+    max_buckets = min(request.args.get('buckets', 720, type=int), 2000)
+    seconds, rows = store.timeline(start, end, request.args.get('src_ip'), max_buckets)
+    return jsonify({"start": start, "end": end, "bucket_seconds": seconds,
+                    "buckets": [{"t": t, "malicious": m, "benign": b} for t, m, b in rows]})
+
+@app.route('/api/top_sources')
+def api_top_sources():
+    store, error = _analytics_store()
+    if error:
+        return error
+    start, end = _time_range()
+    order = request.args.get('order', 'malicious')
+    if order not in ('malicious', 'packets'):
+        return jsonify({"error": "order must be malicious or packets"}), 400
+    n = max(1, min(request.args.get('n', 10, type=int), 100))
+    blocked = store.blocked_ips()
+    return jsonify({"start": start, "end": end, "sources": [
+        {"src_ip": ip, "malicious": m, "benign": b, "packets": m + b,
+         "malicious_ratio": m / (m + b) if m + b else 0.0, "blocked": ip in blocked}
+        for ip, m, b in store.top_sources(start, end, n, order)]})
+
+@app.route('/api/alerts')
+def api_alerts():
+    store, error = _analytics_store()
+    if error:
+        return error
+    limit = max(1, min(request.args.get('limit', 50, type=int), ALERT_PAGE_MAX))
+    rows = store.alerts_page(request.args.get('before_id', type=int), limit,
+                             request.args.get('src_ip'), request.args.get('kind'))
+    return jsonify({
+        "alerts": [{"id": i, "ts": ts, "src_ip": ip, "kind": kind, "detail": detail}
+                   for i, ts, ip, kind, detail in rows],
+        # Pass as before_id for the next (older) page; null on the last page.
+        "next_before_id": rows[-1][0] if len(rows) == limit else None,
+    })
+
+@app.route('/api/sources/<ip>')
+def api_source(ip):
+    store, error = _analytics_store()
+    if error:
+        return error
+    start, end = _time_range(86400.0)
+    malicious, benign = store.source_counts(ip, start, end)
+    return jsonify({"src_ip": ip, "start": start, "end": end, "malicious": malicious, "benign": benign,
+                    "blocked": ip in store.blocked_ips(),
+                    "alerts": [{"id": i, "ts": ts, "kind": kind, "detail": detail}
+                               for i, ts, _, kind, detail in store.alerts_page(None, 20, ip)]})
+
+@app.route('/api/vitals/devices')
+def api_vitals_devices():
+    return jsonify(state.vitals.summary())
+
+@app.route('/api/vitals')
+def api_vitals():
+    device = request.args.get('device')
+    if device is None:
+        devices = state.vitals.summary()
+        if not devices:
+            return jsonify({"error": "no vitals received yet"}), 404
+        device = devices[0]["device"]
+    method = request.args.get('method', 'lttb')
+    if method not in ('lttb', 'minmax'):
+        return jsonify({"error": "method must be lttb or minmax"}), 400
+    signals = request.args.get('signals')
+    signals = signals.split(',') if signals else None
+    if signals and not set(signals) <= set(SIGNALS):
+        return jsonify({"error": f"signals must be among {', '.join(SIGNALS)}"}), 400
+    start, end = _time_range()
+    series = state.vitals.series(device, start, end, request.args.get('points', 300, type=int), method, signals)
+    if series is None:
+        return jsonify({"error": f"unknown device {device}"}), 404
+    return jsonify(series)
+
+_metric_snapshots = {}  # path -> (mtime_ns, snapshot)
+
+def read_metric_snapshots(directory=metrics.METRICS_DIR):
+    # Stage snapshots written by metrics.Registry.export; re-parsed only when a file changes.
+    snapshots = []
     try:
-        with open('logs/blocked_ips.txt', 'r') as f:
-            ips = [line.strip() for line in f if line.strip()]
-        return jsonify(ips)
-    except:
-        return jsonify([])
+        names = sorted(n for n in os.listdir(directory) if n.endswith('.json'))
+    except FileNotFoundError:
+        return snapshots
+    for name in names:
+        path = os.path.join(directory, name)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+            cached = _metric_snapshots.get(path)
+            if cached is None or cached[0] != mtime:
+                with open(path) as f:
+                    cached = _metric_snapshots[path] = (mtime, json.load(f))
+        except (OSError, ValueError):
+            continue
+        snapshots.append(cached[1])
+    return snapshots
+
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.render_prometheus(read_metric_snapshots()), mimetype='text/plain; version=0.0.4')
 
 if __name__ == "__main__":
     print('Web dashboard running on http://<pi_ip>:8050')
+    threading.Thread(target=state.watch, daemon=True).start()
     app.run(host='0.0.0.0', port=8050, debug=False)
@@ -0,0 +1,124 @@
+import os
+import time
+from collections import OrderedDict, deque
+
+# Detection and blocking settings shared by the live monitor (main.py) and replay.py.
+# A src_ip is flagged when, among its last DETECT_WINDOW_SIZE predictions within
+# DETECT_WINDOW_SECONDS, there are at least DETECT_MIN_COUNT, of which DETECT_MIN_RATIO are
+# malicious, arriving at DETECT_MIN_RATE malicious/s or more.
+DETECT_WINDOW_SECONDS = float(os.environ.get("IDS_DETECT_WINDOW_SECONDS", "10"))
+DETECT_WINDOW_SIZE = int(os.environ.get("IDS_DETECT_WINDOW_SIZE", "500"))
+DETECT_MIN_COUNT = int(os.environ.get("IDS_DETECT_MIN_COUNT", "100"))
+DETECT_MIN_RATIO = float(os.environ.get("IDS_DETECT_MIN_RATIO", "0.9"))
+DETECT_MIN_RATE = float(os.environ.get("IDS_DETECT_MIN_RATE", "5"))
+RED_HOLD = 3  # seconds a flagged source is shown red before it is blocked
+BLOCK_TTL = int(os.environ.get("IDS_BLOCK_TTL", "0"))  # seconds; 0 blocks until unblocked
+
+
+class SourceWindow:
+    __slots__ = ("events", "count", "malicious", "last_seen", "flagged")
+
+    def __init__(self):
+        self.events = deque()  # (timestamp, is_malicious, weight)
+        self.count = 0
+        self.malicious = 0
+        self.last_seen = 0.0
+        self.flagged = False
+
+
+# Per-source sliding-window detector. Every src_ip keeps the decisions of its last
+# window_size predictions that are also younger than window_seconds, with a running malicious
+# count, so one update costs amortised O(1) (each event is appended and expired once).
+# A prediction for a flow (IDS_FLOWS=1) counts as many times as the flow has packets.
+# A source is flagged when, inside its window,
+#   - it has at least min_count predictions,
+#   - at least min_ratio of them are malicious, and
+#   - malicious predictions arrive at min_rate per second or more.
+# Sources are kept in least-recently-seen order; idle or excess ones are evicted from the front.
+class DetectionEngine:
+    def __init__(self, window_seconds=10.0, window_size=500, min_count=50, min_ratio=0.9,
+                 min_rate=0.0, idle_timeout=120.0, max_sources=50000, exclude=()):
+        self.window_seconds = window_seconds
+        self.window_size = window_size
+        self.min_count = min_count
+        self.min_ratio = min_ratio
+        self.min_rate = min_rate
+        self.idle_timeout = idle_timeout
+        self.max_sources = max_sources
+        self.exclude = set(exclude)
+        self.sources = OrderedDict()
+        self.evicted = 0
+
+    def _expire(self, src, now):
+        cutoff = now - self.window_seconds
+        q = src.events
+        # Drop the oldest events while the rest still fill the window, or once they are too old.
+        while q and (src.count - q[0][2] >= self.window_size or q[0][0] < cutoff):
+            _, was_malicious, weight = q.popleft()
+            src.count -= weight
+            if was_malicious:
+                src.malicious -= weight
+
+    def update(self, ip, is_malicious, now=None, weight=1):
+        # Returns True when this prediction makes ip cross the thresholds (again).
+        if not ip or ip in self.exclude:
+            return False
+        now = time.monotonic() if now is None else now
+        src = self.sources.get(ip)
+        if src is None:
+            src = self.sources[ip] = SourceWindow()
+            if len(self.sources) > self.max_sources:
+                self.sources.popitem(last=False)
+                self.evicted += 1
+        else:
+            self.sources.move_to_end(ip)
+        src.last_seen = now
+        src.events.append((now, is_malicious, weight))
+        src.count += weight
+        if is_malicious:
+            src.malicious += weight
+        self._expire(src, now)
+
+        if not self._over_threshold(src):
+            src.flagged = False  # dropped back below: may be flagged again later
+            return False
+        if src.flagged:
+            return False
+        src.flagged = True
+        return True
+
+    def _over_threshold(self, src):
+        count = src.count
+        if count < self.min_count or not src.malicious:
+            return False
+        if src.malicious < self.min_ratio * count:
+            return False
+        return src.malicious / self.window_seconds >= self.min_rate
+
+    def evict_idle(self, now=None):
+        now = time.monotonic() if now is None else now
+        cutoff = now - self.idle_timeout
+        n = 0
+        while self.sources:
+            ip, src = next(iter(self.sources.items()))
+            if src.last_seen >= cutoff:
+                break
+            self.sources.popitem(last=False)
+            n += 1
+        self.evicted += n
+        return n
+
+    def forget(self, ip, exclude=True):
+        # Drop ip's window, e.g. once it has been blocked; excluded IPs are never flagged again.
+        self.sources.pop(ip, None)
+        if exclude:
+            self.exclude.add(ip)
+
+    def flagged(self):
+        return [ip for ip, src in self.sources.items() if src.flagged]
+
+    def stats(self, ip):
+        src = self.sources.get(ip)
+        if src is None:
+            return None
+        return {"count": src.count, "malicious": src.malicious, "flagged": src.flagged}
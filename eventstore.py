@@ -0,0 +1,304 @@
+import os
+import sqlite3
+import threading
+import time
+
+# Embedded event store for IDS_EVENTS=sqlite: predictions, alerts, the blocklist and the
+# current status live in one SQLite database in WAL mode instead of prediction_output.log,
+# blocked_ips.txt and status.txt. rtp.py inserts each scored batch in one transaction, main.py
+# reads new predictions by id and records alerts, blocks and status, and the dashboard reads
+# from it; WAL lets all of them do so concurrently without blocking readers.
+#
+# Per-row predictions are indexed by time and by src_ip, and counted into per-minute, per-hour
+# and per-day, per-source rollups as they are inserted. Prediction and alert rows older than
+# RETENTION_SECONDS are deleted in small batches, so the tables stay bounded while the rollups
+# keep the long-term history. Analytics queries read the coarsest rollup that still gives enough buckets for the
+# range asked for, so their cost depends on the range and not on how much history is stored.
+# PRAGMA data_version tells a reader cheaply whether another process has committed since it
+# last looked, so cached views (blocklist, status) are only re-queried after a change.
+
+EVENTS_DB = 'logs/events.db'
+RETENTION_SECONDS = float(os.environ.get('IDS_EVENT_RETENTION', str(24 * 3600)))
+ROLLUP_RETENTION_SECONDS = float(os.environ.get('IDS_ROLLUP_RETENTION', str(90 * 24 * 3600)))
+PRUNE_INTERVAL = 60.0
+PRUNE_BATCH = 20000
+# (level, seconds per bucket); rollup_<level> has one row per bucket and source, keyed by
+# <level> = int(ts // seconds). Minute rows expire after ROLLUP_RETENTION_SECONDS, the rest stay.
+ROLLUP_LEVELS = [('minute', 60), ('hour', 3600), ('day', 86400)]
+MAX_BUCKETS = 720
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS predictions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,  -- never reused after pruning, so readers can follow by id
+    ts REAL NOT NULL,
+    src_ip TEXT NOT NULL,
+    malicious INTEGER NOT NULL,
+    weight INTEGER NOT NULL DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS predictions_ts ON predictions (ts);
+CREATE INDEX IF NOT EXISTS predictions_src_ts ON predictions (src_ip, ts);
+CREATE TABLE IF NOT EXISTS alerts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts REAL NOT NULL,
+    src_ip TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    detail TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS alerts_ts ON alerts (ts);
+CREATE INDEX IF NOT EXISTS alerts_src_ts ON alerts (src_ip, ts);
+CREATE INDEX IF NOT EXISTS alerts_src_id ON alerts (src_ip, id);
+CREATE INDEX IF NOT EXISTS alerts_kind_id ON alerts (kind, id);
+CREATE TABLE IF NOT EXISTS blocks (
+    src_ip TEXT PRIMARY KEY,
+    blocked_at REAL NOT NULL,
+    expires_at REAL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS status (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    value TEXT NOT NULL,
+    ts REAL NOT NULL
+);
+""" + "".join(f"""
+CREATE TABLE IF NOT EXISTS rollup_{level} (
+    {level} INTEGER NOT NULL,
+    src_ip TEXT NOT NULL,
+    malicious INTEGER NOT NULL DEFAULT 0,
+    benign INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY ({level}, src_ip)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS rollup_{level}_src ON rollup_{level} (src_ip, {level});
+""" for level, _ in ROLLUP_LEVELS)
+
+
+def rollup_level(start, end, max_buckets=MAX_BUCKETS, oldest_minute=None):
+    # Finest level that covers [start, end) in at most max_buckets buckets (and, for minutes,
+    # that still holds data from start).
+    for level, seconds in ROLLUP_LEVELS:
+        if level == 'minute' and oldest_minute is not None and start < oldest_minute:
+            continue
+        if (end - start) / seconds <= max_buckets:
+            return level, seconds
+    return ROLLUP_LEVELS[-1]
+
+
+def _bucket_range(start, end, seconds):
+    # Buckets overlapping [start, end).
+    return int(start // seconds), int(-(-end // seconds))
+
+
+class EventStore:
+    # One connection per process, shared by its threads under a lock.
+    def __init__(self, path=EVENTS_DB, retention=RETENTION_SECONDS, rollup_retention=ROLLUP_RETENTION_SECONDS):
+        self.path = path
+        self.retention = retention
+        self.rollup_retention = rollup_retention
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.db = sqlite3.connect(path, timeout=10, isolation_level=None, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')  # durable at checkpoints; a crash loses at most the last commits
+        self.db.executescript(SCHEMA)
+        self._backfill()
+        self.lock = threading.Lock()
+        self._last_prune = 0.0
+        self._seen_version = None
+        self._blocked = None
+
+    def _backfill(self):
+        # Databases created before the hour/day rollups existed: derive them from the minutes.
+        # Checked inside the write transaction, so stages starting together backfill once.
+        self.db.execute('BEGIN IMMEDIATE')
+        for level, seconds in ROLLUP_LEVELS[1:]:
+            if self.db.execute(f'SELECT 1 FROM rollup_{level} LIMIT 1').fetchone():
+                continue
+            self.db.execute(f'INSERT INTO rollup_{level} ({level}, src_ip, malicious, benign) '
+                            f'SELECT minute * 60 / {seconds}, src_ip, SUM(malicious), SUM(benign) '
+                            f'FROM rollup_minute GROUP BY minute * 60 / {seconds}, src_ip')
+        self.db.execute('COMMIT')
+
+    def _level(self, start, end, max_buckets):
+        return rollup_level(start, end, max_buckets, time.time() - self.rollup_retention)
+
+    def _write(self, statements):
+        # statements: [(sql, params or [params...])], run in one IMMEDIATE transaction.
+        with self.lock:
+            self.db.execute('BEGIN IMMEDIATE')
+            try:
+                for sql, params in statements:
+                    if isinstance(params, list):
+                        self.db.executemany(sql, params)
+                    else:
+                        self.db.execute(sql, params)
+                self.db.execute('COMMIT')
+            except BaseException:
+                self.db.execute('ROLLBACK')
+                raise
+
+    def _query(self, sql, params=()):
+        with self.lock:
+            return self.db.execute(sql, params).fetchall()
+
+    def data_version(self):
+        with self.lock:
+            return self.db.execute('PRAGMA data_version').fetchone()[0]
+
+    def changed(self):
+        # True when another connection has committed since the last call.
+        version = self.data_version()
+        if version == self._seen_version:
+            return False
+        self._seen_version = version
+        return True
+
+    # -- predictions -------------------------------------------------------------------------
+
+    def add_predictions(self, decisions, now=None):
+        # decisions: [(src_ip, is_malicious, weight)], all stamped with the same time.
+        if not decisions:
+            return
+        now = time.time() if now is None else now
+        counts = {}
+        for ip, mal, weight in decisions:
+            c = counts.setdefault(ip, [0, 0])
+            c[0 if mal else 1] += weight
+        statements = [('INSERT INTO predictions (ts, src_ip, malicious, weight) VALUES (?, ?, ?, ?)',
+                       [(now, ip, int(mal), weight) for ip, mal, weight in decisions])]
+        for level, seconds in ROLLUP_LEVELS:
+            bucket = int(now // seconds)
+            statements.append((
+                f'INSERT INTO rollup_{level} ({level}, src_ip, malicious, benign) VALUES (?, ?, ?, ?) '
+                f'ON CONFLICT ({level}, src_ip) DO UPDATE SET '
+                'malicious = malicious + excluded.malicious, benign = benign + excluded.benign',
+                [(bucket, ip, c[0], c[1]) for ip, c in counts.items()]))
+        self._write(statements)
+        if now - self._last_prune >= PRUNE_INTERVAL:
+            self._last_prune = now
+            self.prune(now)
+
+    def last_prediction_id(self):
+        rows = self._query("SELECT seq FROM sqlite_sequence WHERE name = 'predictions'")
+        return rows[0][0] if rows else 0
+
+    def predictions_since(self, last_id, limit=10000):
+        # [(id, ts, src_ip, malicious, weight)] after last_id, oldest first.
+        return self._query('SELECT id, ts, src_ip, malicious, weight FROM predictions WHERE id > ? ORDER BY id LIMIT ?',
+                           (last_id, limit))
+
+    def predictions(self, start, end, src_ip=None, limit=1000):
+        if src_ip is None:
+            return self._query('SELECT id, ts, src_ip, malicious, weight FROM predictions '
+                               'WHERE ts >= ? AND ts < ? ORDER BY ts DESC LIMIT ?', (start, end, limit))
+        return self._query('SELECT id, ts, src_ip, malicious, weight FROM predictions '
+                           'WHERE src_ip = ? AND ts >= ? AND ts < ? ORDER BY ts DESC LIMIT ?',
+                           (src_ip, start, end, limit))
+
+    def source_counts(self, src_ip, start, end):
+        # (malicious, benign) for one source over [start, end), to the resolution of the rollup read.
+        level, seconds = self._level(start, end, MAX_BUCKETS)
+        row = self._query(f'SELECT COALESCE(SUM(malicious), 0), COALESCE(SUM(benign), 0) FROM rollup_{level} '
+                          f'WHERE src_ip = ? AND {level} >= ? AND {level} < ?',
+                          (src_ip,) + _bucket_range(start, end, seconds))
+        return tuple(row[0])
+
+    def timeline(self, start, end, src_ip=None, max_buckets=MAX_BUCKETS):
+        # (seconds per bucket, [(bucket start, malicious, benign)]) over [start, end); buckets
+        # without traffic are left out.
+        level, seconds = self._level(start, end, max_buckets)
+        first, last = _bucket_range(start, end, seconds)
+        if src_ip is None:
+            rows = self._query(f'SELECT {level}, SUM(malicious), SUM(benign) FROM rollup_{level} '
+                               f'WHERE {level} >= ? AND {level} < ? GROUP BY {level} ORDER BY {level}',
+                               (first, last))
+        else:
+            rows = self._query(f'SELECT {level}, malicious, benign FROM rollup_{level} '
+                               f'WHERE src_ip = ? AND {level} >= ? AND {level} < ? ORDER BY {level}',
+                               (src_ip, first, last))
+        return seconds, [(b * seconds, m, n) for b, m, n in rows]
+
+    def top_sources(self, start, end, n=10, order='malicious', max_buckets=MAX_BUCKETS):
+        # [(src_ip, malicious, benign)] over [start, end), most malicious (or most packets) first.
+        level, seconds = self._level(start, end, max_buckets)
+        key = 'SUM(malicious)' if order == 'malicious' else 'SUM(malicious) + SUM(benign)'
+        return self._query(f'SELECT src_ip, SUM(malicious), SUM(benign) FROM rollup_{level} '
+                           f'WHERE {level} >= ? AND {level} < ? GROUP BY src_ip ORDER BY {key} DESC, src_ip LIMIT ?',
+                           _bucket_range(start, end, seconds) + (n,))
+
+    def prune(self, now=None):
+        # Deletes in batches so the write lock is never held for long.
+        now = time.time() if now is None else now
+        deleted = 0
+        for table in ('predictions', 'alerts'):
+            while True:
+                with self.lock:
+                    cur = self.db.execute(f'DELETE FROM {table} WHERE id IN '
+                                          f'(SELECT id FROM {table} WHERE ts < ? ORDER BY ts LIMIT ?)',
+                                          (now - self.retention, PRUNE_BATCH))
+                deleted += cur.rowcount
+                if cur.rowcount < PRUNE_BATCH:
+                    break
+        with self.lock:
+            self.db.execute('DELETE FROM rollup_minute WHERE minute < ?', (int((now - self.rollup_retention) // 60),))
+        return deleted
+
+    # -- alerts, blocks, status --------------------------------------------------------------
+
+    def add_alert(self, src_ip, kind, detail='', now=None):
+        self._write([('INSERT INTO alerts (ts, src_ip, kind, detail) VALUES (?, ?, ?, ?)',
+                      (time.time() if now is None else now, src_ip, kind, detail))])
+
+    def alerts(self, start, end, src_ip=None, limit=1000):
+        if src_ip is None:
+            return self._query('SELECT id, ts, src_ip, kind, detail FROM alerts '
+                               'WHERE ts >= ? AND ts < ? ORDER BY ts DESC LIMIT ?', (start, end, limit))
+        return self._query('SELECT id, ts, src_ip, kind, detail FROM alerts '
+                           'WHERE src_ip = ? AND ts >= ? AND ts < ? ORDER BY ts DESC LIMIT ?',
+                           (src_ip, start, end, limit))
+
+    def alerts_page(self, before_id=None, limit=50, src_ip=None, kind=None):
+        # Newest first, keyset-paginated: pass the last id of a page as before_id for the next.
+        where, params = [], []
+        if before_id is not None:
+            where.append('id < ?')
+            params.append(before_id)
+        if src_ip is not None:
+            where.append('src_ip = ?')
+            params.append(src_ip)
+        if kind is not None:
+            where.append('kind = ?')
+            params.append(kind)
+        sql = 'SELECT id, ts, src_ip, kind, detail FROM alerts'
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        return self._query(sql + ' ORDER BY id DESC LIMIT ?', params + [limit])
+
+    def update_blocks(self, adds, removes, now=None):
+        # adds: {ip: expiry (time.time()) or None}; removes: iterable of ips.
+        now = time.time() if now is None else now
+        self._write([
+            ('DELETE FROM blocks WHERE src_ip = ?', [(ip,) for ip in removes]),
+            ('INSERT OR REPLACE INTO blocks (src_ip, blocked_at, expires_at) VALUES (?, ?, ?)',
+             [(ip, now, expiry) for ip, expiry in adds.items()]),
+        ])
+
+    def blocks(self):
+        # {ip: expiry or None}
+        return dict(self._query('SELECT src_ip, expires_at FROM blocks ORDER BY blocked_at'))
+
+    def blocked_ips(self):
+        # Re-queried only after a commit by another process (the blocker lives in main.py).
+        version = self.data_version()
+        if self._blocked is None or version != self._blocked[0]:
+            self._blocked = (version, set(self.blocks()))
+        return self._blocked[1]
+
+    def set_status(self, value, now=None):
+        self._write([('INSERT OR REPLACE INTO status (id, value, ts) VALUES (1, ?, ?)',
+                      (value, time.time() if now is None else now))])
+
+    def status(self):
+        # (value, time it was set), or (None, 0.0) before the monitor has written one.
+        rows = self._query('SELECT value, ts FROM status WHERE id = 1')
+        return tuple(rows[0]) if rows else (None, 0.0)
+
+    def close(self):
+        with self.lock:
+            self.db.close()
@@ -0,0 +1,292 @@
+import argparse
+import csv
+import json
+import os
+import tempfile
+import time
+import zlib
+
+# Each client process trains single-threaded; without this every worker would start a full
+# BLAS thread pool and the clients would fight over the same cores.
+for _var in ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS'):
+    os.environ.setdefault(_var, '1')
+
+import numpy as np
+from multiprocessing import get_context
+
+from npinfer import ACTIVATIONS, load_h5_model, save_h5_weights
+from updates import CODECS, LoopbackServer, compress, send_update
+
+# Offline federated averaging. The captured features are split between simulated gateways
+# (by source IP by default, so each one sees its own devices), every gateway trains the current
+# global model on its partition in a worker process, and the updates are averaged weighted by
+# sample count (FedAvg). The result is written to combined_model.h5 with the layout of the
+# starting model, so rtp.py loads it with either backend.
+# Gateways upload weight deltas to a loopback aggregation server in the (optionally compressed)
+# format of updates.py, so the bytes per round are what a real link would carry.
+#
+#   python federated.py --clients 4 --rounds 10 --epochs 2
+#   python federated.py --data labelled.csv --label-column label --compare-serial
+#   python federated.py --codec topk-int8 --topk 0.02 --compare-baseline
+#
+# Rows without a label column are labelled by the starting model (self-training), which only
+# makes sense for adapting to local traffic; use a labelled capture to actually train.
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_CSV = os.path.join(BASE_DIR, 'logs/network_features_preprocessed.csv')
+INIT_MODEL = os.path.join(BASE_DIR, 'dbn_iomt_ids.h5')
+OUTPUT_MODEL = os.path.join(BASE_DIR, 'combined_model.h5')
+
+# Derivative of each hidden activation, in terms of its output a = act(z).
+DERIVATIVES = {
+    'sigmoid': lambda a: a * (1.0 - a),
+    'tanh': lambda a: 1.0 - a * a,
+    'relu': lambda a: (a > 0).astype(a.dtype),
+    'linear': lambda a: 1.0,
+    None: lambda a: 1.0,
+}
+
+
+def load_dataset(path, label_column='label'):
+    from rtp import parse_rows
+    with open(path, newline='') as f:
+        header = f.readline()
+        lines = f.readlines()
+    src_ips, X, _ = parse_rows(lines, header)
+    columns = next(csv.reader([header]))
+    y = None
+    if label_column in columns:
+        col = columns.index(label_column)
+        y = np.array([int(float(row[col])) for row in csv.reader(lines) if row], dtype=np.int64)
+    return src_ips, X, y
+
+
+def partition(src_ips, n_clients, mode='ip', seed=0):
+    # "ip": all rows of a source go to the same gateway (non-IID, like real deployments).
+    # "iid": a random even split.
+    if mode == 'ip':
+        owner = np.array([zlib.crc32(ip.encode()) % n_clients for ip in src_ips], dtype=np.int64)
+    elif mode == 'iid':
+        owner = np.random.default_rng(seed).permutation(len(src_ips)) % n_clients
+    else:
+        raise ValueError(f"Unknown partition mode: {mode}")
+    return [np.flatnonzero(owner == c) for c in range(n_clients)]
+
+
+def model_params(model):
+    # (kernel, bias) float64 pairs and activation names of a NumpyModel, checked for training.
+    params, acts = [], []
+    for name, kernel, bias, _, act_name in model.layers:
+        if act_name not in DERIVATIVES and act_name != 'softmax':
+            raise ValueError(f"Layer {name}: activation {act_name} is not supported for training")
+        params.append((kernel.astype(np.float64),
+                       np.zeros(kernel.shape[1]) if bias is None else bias.astype(np.float64)))
+        acts.append(act_name)
+    if acts[-1] != 'softmax' or 'softmax' in acts[:-1]:
+        raise ValueError("Training needs a softmax output layer (and no softmax elsewhere)")
+    return params, acts
+
+
+def forward(params, acts, X):
+    h = [X]
+    for (kernel, bias), act in zip(params, acts):
+        h.append(ACTIVATIONS[act](h[-1] @ kernel + bias))
+    return h
+
+
+def cross_entropy(probs, y):
+    return float(-np.log(np.clip(probs[np.arange(len(y)), y], 1e-12, None)).mean()) if len(y) else 0.0
+
+
+def train_local(params, acts, X, y, epochs=1, lr=0.05, batch_size=64, seed=0):
+    # Mini-batch SGD on softmax cross-entropy; returns the new params and the final loss.
+    rng = np.random.default_rng(seed)
+    params = [(k.copy(), b.copy()) for k, b in params]
+    n = len(X)
+    for _ in range(epochs):
+        order = rng.permutation(n)
+        for start in range(0, n, batch_size):
+            idx = np.sort(order[start:start + batch_size])
+            h = forward(params, acts, np.asarray(X[idx], dtype=np.float64))
+            delta = h[-1]
+            delta[np.arange(len(idx)), y[idx]] -= 1.0
+            delta /= len(idx)
+            for layer in range(len(params) - 1, -1, -1):
+                kernel, bias = params[layer]
+                grad_k = h[layer].T @ delta
+                grad_b = delta.sum(axis=0)
+                if layer:
+                    delta = (delta @ kernel.T) * DERIVATIVES[acts[layer - 1]](h[layer])
+                kernel -= lr * grad_k
+                bias -= lr * grad_b
+    loss = cross_entropy(forward(params, acts, np.asarray(X, dtype=np.float64))[-1], np.asarray(y)) if n else 0.0
+    return params, loss
+
+
+def flatten(params):
+    return [t for pair in params for t in pair]
+
+
+def run_client(task):
+    # Worker entry point: trains on the client's memory-mapped partition, then uploads the
+    # encoded weight delta to the aggregation server. Error-feedback residuals persist between
+    # rounds in the scratch directory, since any worker may pick up any client.
+    client, params, acts, data_dir, cfg, seed, round_no, address = task
+    X = np.load(os.path.join(data_dir, f'client{client}_X.npy'), mmap_mode='r')
+    y = np.load(os.path.join(data_dir, f'client{client}_y.npy'))
+    t = time.perf_counter()
+    new_params, loss = train_local(params, acts, X, y, cfg['epochs'], cfg['lr'], cfg['batch_size'], seed)
+    train_s = time.perf_counter() - t
+    delta = [(new - old).astype(np.float32) for new, old in zip(flatten(new_params), flatten(params))]
+    residual_path = os.path.join(data_dir, f'client{client}_residual.npz')
+    residual = None
+    if cfg['error_feedback'] and os.path.exists(residual_path):
+        with np.load(residual_path) as f:
+            residual = [f[f'arr_{i}'] for i in range(len(delta))]
+    message, residual = compress(delta, cfg['codec'], cfg['topk'], residual, len(X), round_no)
+    if cfg['error_feedback']:
+        np.savez(residual_path, *residual)
+    send_update(address, message)
+    return client, len(X), loss, train_s, len(message)
+
+
+def accuracy(params, acts, X, y):
+    if not len(y):
+        return None
+    return float((forward(params, acts, np.asarray(X, dtype=np.float64))[-1].argmax(axis=1) == y).mean())
+
+
+def run_rounds(params, acts, clients, data_dir, cfg, args, pool):
+    for name in os.listdir(data_dir):
+        if name.endswith('_residual.npz'):
+            os.remove(os.path.join(data_dir, name))
+    server = LoopbackServer()
+    history = []
+    try:
+        for r in range(args.rounds):
+            tasks = [(c, params, acts, data_dir, cfg, args.seed + 1000 * r + c, r + 1, server.address)
+                     for c in clients]
+            t = time.perf_counter()
+            results = pool.map(run_client, tasks) if pool else [run_client(task) for task in tasks]
+            wall = time.perf_counter() - t
+            mean_delta, stats = server.aggregate()
+            params = [(k + mean_delta[2 * i], b + mean_delta[2 * i + 1]) for i, (k, b) in enumerate(params)]
+            client_s = [s for _, _, _, s, _ in results]
+            history.append({
+                'round': r + 1,
+                'wall_s': wall,
+                'client_s': client_s,
+                'loss': sum(loss * n for _, n, loss, _, _ in results) / sum(n for _, n, _, _, _ in results),
+                'parallelism': sum(client_s) / wall if wall else None,
+                'upload_bytes': stats['bytes'],
+            })
+    finally:
+        server.close()
+    return params, history
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Federated averaging over simulated IoMT gateways')
+    parser.add_argument('--data', default=DATA_CSV)
+    parser.add_argument('--label-column', default='label')
+    parser.add_argument('--init', default=INIT_MODEL, help='starting global model (also the h5 template)')
+    parser.add_argument('--output', default=OUTPUT_MODEL)
+    parser.add_argument('--clients', type=int, default=4)
+    parser.add_argument('--workers', type=int, default=0, help='worker processes (0 = one per client, capped at CPUs)')
+    parser.add_argument('--partition', choices=['ip', 'iid'], default='ip')
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--epochs', type=int, default=1, help='local epochs per round')
+    parser.add_argument('--lr', type=float, default=0.05)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--holdout', type=float, default=0.1, help='fraction of rows kept for evaluation')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--codec', choices=CODECS, default='float32', help='update encoding (see updates.py)')
+    parser.add_argument('--topk', type=float, default=0.01, help='fraction of each tensor sent by the topk codecs')
+    parser.add_argument('--no-error-feedback', action='store_true')
+    parser.add_argument('--compare-serial', action='store_true', help='rerun the rounds in one process for the speedup')
+    parser.add_argument('--compare-baseline', action='store_true',
+                        help='rerun the rounds with uncompressed float32 updates for bytes and accuracy')
+    parser.add_argument('--json', help='write the per-round report to this file')
+    args = parser.parse_args()
+
+    model = load_h5_model(args.init)
+    params, acts = model_params(model)
+    src_ips, X, y = load_dataset(args.data, args.label_column)
+    if y is None:
+        print(f"[FEDERATED] No {args.label_column!r} column in {args.data}; labelling rows with {args.init}")
+        y = model.predict(X, batch_size=4096).argmax(axis=1)
+    if not len(X):
+        raise SystemExit(f"[FEDERATED] {args.data} has no rows")
+
+    rng = np.random.default_rng(args.seed)
+    test = rng.random(len(X)) < args.holdout
+    train_idx = np.flatnonzero(~test)
+    parts = partition([src_ips[i] for i in train_idx], args.clients, args.partition, args.seed)
+    workers = args.workers or min(args.clients, os.cpu_count() or 1)
+
+    with tempfile.TemporaryDirectory(prefix='federated-') as data_dir:
+        clients = []
+        for c, part in enumerate(parts):
+            if not len(part):
+                continue
+            np.save(os.path.join(data_dir, f'client{c}_X.npy'), X[train_idx[part]])
+            np.save(os.path.join(data_dir, f'client{c}_y.npy'), y[train_idx[part]])
+            clients.append(c)
+        print(f"[FEDERATED] {len(train_idx)} training rows over {len(clients)} gateways "
+              f"({', '.join(str(len(p)) for p in parts)}), {workers} worker processes")
+
+        cfg = {'epochs': args.epochs, 'lr': args.lr, 'batch_size': args.batch_size, 'codec': args.codec,
+               'topk': args.topk, 'error_feedback': args.codec != 'float32' and not args.no_error_feedback}
+        start_acc = accuracy(params, acts, X[test], y[test])
+        baseline = None
+        with get_context('fork').Pool(workers) as pool:
+            t = time.perf_counter()
+            new_params, history = run_rounds(params, acts, clients, data_dir, cfg, args, pool)
+            parallel_s = time.perf_counter() - t
+            if args.compare_baseline and args.codec != 'float32':
+                base_cfg = dict(cfg, codec='float32', error_feedback=False)
+                base_params, base_history = run_rounds(params, acts, clients, data_dir, base_cfg, args, pool)
+                baseline = {'accuracy': accuracy(base_params, acts, X[test], y[test]),
+                            'upload_bytes': sum(h['upload_bytes'] for h in base_history)}
+        serial_s = None
+        if args.compare_serial:
+            t = time.perf_counter()
+            run_rounds(params, acts, clients, data_dir, cfg, args, None)
+            serial_s = time.perf_counter() - t
+
+    for h in history:
+        print(f"[FEDERATED] Round {h['round']}: {h['wall_s']:.2f}s wall, clients {min(h['client_s']):.2f}-"
+              f"{max(h['client_s']):.2f}s, loss {h['loss']:.4f}, {h['parallelism']:.1f}x client time overlapped, "
+              f"{h['upload_bytes'] / 1024:.1f} KiB uploaded")
+    end_acc = accuracy(new_params, acts, X[test], y[test])
+    if start_acc is not None:
+        print(f"[FEDERATED] Held-out accuracy: {start_acc:.4f} -> {end_acc:.4f} ({int(test.sum())} rows)")
+    upload = sum(h['upload_bytes'] for h in history)
+    dense = 4 * sum(t.size for t in flatten(params)) * len(clients) * args.rounds
+    h5 = os.path.getsize(args.init) * len(clients) * args.rounds
+    print(f"[FEDERATED] Uploads ({args.codec}): {upload / 1024:.1f} KiB in total, "
+          f"{dense / max(upload, 1):.1f}x smaller than float32 deltas, {h5 / max(upload, 1):.1f}x smaller than .h5 files")
+    if baseline is not None:
+        print(f"[FEDERATED] Uncompressed baseline: {baseline['upload_bytes'] / 1024:.1f} KiB uploaded, "
+              f"held-out accuracy {baseline['accuracy']} vs {end_acc} with {args.codec}")
+    print(f"[FEDERATED] {args.rounds} rounds in {parallel_s:.2f}s with {workers} workers")
+    if serial_s is not None:
+        print(f"[FEDERATED] Serial: {serial_s:.2f}s -> {serial_s / parallel_s:.2f}x wall-clock speedup")
+
+    layers = [(name, kernel.astype(np.float32), None if old_bias is None else bias.astype(np.float32), act, act_name)
+              for (name, _, old_bias, act, act_name), (kernel, bias) in zip(model.layers, new_params)]
+    save_h5_weights(layers, args.output, args.init)
+    print(f"[FEDERATED] Wrote {args.output}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'clients': len(clients), 'workers': workers, 'codec': args.codec, 'rounds': history,
+                       'parallel_s': parallel_s, 'serial_s': serial_s,
+                       'speedup': serial_s / parallel_s if serial_s else None,
+                       'accuracy_before': start_acc, 'accuracy_after': end_acc,
+                       'upload_bytes': upload, 'h5_bytes_per_round': os.path.getsize(args.init) * len(clients),
+                       'baseline': baseline}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+import numpy as np
+
+# Flow aggregation for IDS_FLOWS=1. Packets are grouped by 5-tuple (src ip, dst ip, proto,
+# sport, dport) in array-backed tables; each flow's window opens at its first packet and closes
+# window seconds later, when one record per flow is emitted: the mean of its packets' model
+# features plus the aggregates below. Flows idle for idle_timeout seconds free their slot.
+# All times are capture timestamps (frame.time_epoch), so replays of old captures window the
+# same way as live traffic.
+
+FLOW_COLUMNS = ['flow.packets', 'flow.bytes', 'flow.syn_ratio', 'flow.fin_ratio',
+                'flow.iat_mean', 'flow.iat_std', 'flow.duration']
+
+
+class FlowTable:
+    def __init__(self, n_features, window=1.0, idle_timeout=30.0, capacity=4096):
+        self.n_features = n_features
+        self.window = window
+        self.idle_timeout = idle_timeout
+        self.index = {}  # key -> slot
+        self.keys = []
+        self.free = []
+        self.clock = 0.0  # newest capture timestamp seen
+        self.evicted = 0
+        self._alloc(capacity)
+
+    def _alloc(self, capacity):
+        old = len(self.keys)
+        grow = capacity - old
+
+        def extend(name, fill, dtype, width=None):
+            shape = (grow,) if width is None else (grow, width)
+            new = np.full(shape, fill, dtype=dtype)
+            cur = getattr(self, name, None)
+            setattr(self, name, new if cur is None else np.concatenate([cur, new]))
+
+        # Window accumulators (reset on every flush)...
+        extend('packets', 0, np.int64)
+        extend('bytes', 0.0, np.float64)
+        extend('syn', 0.0, np.float64)
+        extend('fin', 0.0, np.float64)
+        extend('iat_n', 0, np.int64)
+        extend('iat_sum', 0.0, np.float64)
+        extend('iat_sq', 0.0, np.float64)
+        extend('feat_sum', 0.0, np.float64, self.n_features)
+        extend('window_start', np.inf, np.float64)
+        # ...and per-flow state kept across windows.
+        extend('last_ts', 0.0, np.float64)
+        extend('used', False, np.bool_)
+        self.keys.extend([None] * grow)
+        self.free.extend(range(capacity - 1, old - 1, -1))
+
+    def __len__(self):
+        return len(self.index)
+
+    def _slot(self, key):
+        slot = self.index.get(key)
+        if slot is None:
+            if not self.free:
+                self._alloc(2 * len(self.keys))
+            slot = self.free.pop()
+            self.index[key] = slot
+            self.keys[slot] = key
+        return slot
+
+    def add(self, keys, X, ts, lengths, syn, fin):
+        # keys: one hashable 5-tuple per packet; the rest are per-packet arrays.
+        if not len(keys):
+            return
+        slots = np.fromiter((self._slot(k) for k in keys), dtype=np.int64, count=len(keys))
+        ts = np.asarray(ts, dtype=np.float64)
+        order = np.lexsort((ts, slots))
+        s, t = slots[order], ts[order]
+
+        # Inter-arrival times: within the batch from the previous packet of the same flow, and
+        # for a flow's first packet in the batch from its last one in earlier batches.
+        first = np.ones(len(s), dtype=bool)
+        first[1:] = s[1:] != s[:-1]
+        prev = np.empty_like(t)
+        prev[1:] = t[:-1]
+        prev[first] = self.last_ts[s[first]]
+        has_prev = ~first | self.used[s]
+        iat = np.maximum(t - prev, 0.0)[has_prev]
+        np.add.at(self.iat_n, s[has_prev], 1)
+        np.add.at(self.iat_sum, s[has_prev], iat)
+        np.add.at(self.iat_sq, s[has_prev], iat * iat)
+
+        np.add.at(self.packets, s, 1)
+        np.add.at(self.bytes, s, np.asarray(lengths, dtype=np.float64)[order])
+        np.add.at(self.syn, s, np.asarray(syn, dtype=np.float64)[order])
+        np.add.at(self.fin, s, np.asarray(fin, dtype=np.float64)[order])
+        np.add.at(self.feat_sum, s, np.asarray(X, dtype=np.float64)[order])
+        np.minimum.at(self.window_start, s, t)
+        np.maximum.at(self.last_ts, s, t)
+        self.used[s] = True
+        self.clock = max(self.clock, float(t.max()))
+
+    def flush(self, now=None, force=False):
+        # Emits flows whose window has closed (all pending flows with force=True). Returns
+        # (keys, X, aggregates, last_ts): X holds mean feature vectors, aggregates FLOW_COLUMNS.
+        now = self.clock if now is None else now
+        pending = self.packets > 0
+        if not force:
+            pending &= self.window_start <= now - self.window
+        due = np.flatnonzero(pending)
+        n = self.packets[due].astype(np.float64)
+        X = self.feat_sum[due] / n[:, None]
+        iat_n = np.maximum(self.iat_n[due], 1)
+        iat_mean = self.iat_sum[due] / iat_n
+        iat_std = np.sqrt(np.maximum(self.iat_sq[due] / iat_n - iat_mean * iat_mean, 0.0))
+        aggregates = np.column_stack([n, self.bytes[due], self.syn[due] / n, self.fin[due] / n, iat_mean, iat_std,
+                                      self.last_ts[due] - self.window_start[due]])
+        keys = [self.keys[i] for i in due.tolist()]
+        last_ts = self.last_ts[due].copy()
+
+        for name in ('packets', 'iat_n'):
+            getattr(self, name)[due] = 0
+        for name in ('bytes', 'syn', 'fin', 'iat_sum', 'iat_sq', 'feat_sum'):
+            getattr(self, name)[due] = 0.0
+        self.window_start[due] = np.inf
+        return keys, X, aggregates, last_ts
+
+    def evict_idle(self, now=None):
+        # Frees flows with nothing pending that have been quiet for idle_timeout.
+        now = self.clock if now is None else now
+        idle = np.flatnonzero(self.used & (self.packets == 0) & (self.last_ts < now - self.idle_timeout))
+        for slot in idle.tolist():
+            del self.index[self.keys[slot]]
+            self.keys[slot] = None
+            self.free.append(slot)
+        self.used[idle] = False
+        self.last_ts[idle] = 0.0
+        self.evicted += len(idle)
+        return len(idle)
@@ -0,0 +1,138 @@
+import os
+import threading
+import time
+import numpy as np
+
+# Zero-downtime model replacement for rtp.py. A background thread watches the model file; once
+# a new version has stopped changing it is loaded, warmed up and validated off the scoring
+# path. The scoring loop calls poll() between batches, which swaps the ready model in with a
+# single assignment, so every batch is scored entirely by one model and no row is dropped or
+# scored twice. If the new model fails on a live batch, the previous one takes over again and
+# scores that batch instead.
+
+CHECK_INTERVAL = 1.0
+SAMPLE_ROWS = 256
+
+
+def file_stamp(path):
+    try:
+        st = os.stat(path)
+        return st.st_mtime_ns, st.st_size
+    except OSError:
+        return None
+
+
+class ModelSwapper:
+    def __init__(self, model, path, loader, min_agreement=0.0, check_interval=CHECK_INTERVAL):
+        self.current = model
+        self.previous = None
+        self.path = path
+        self.loader = loader
+        self.min_agreement = min_agreement  # share of alert decisions that must match the old model
+        self.check_interval = check_interval
+        self.on_swap = []  # callbacks run in the scoring thread after a swap or rollback
+        self.version = 1
+        self.swaps = 0
+        self.failures = 0
+        self.rollbacks = 0
+        self.last_swap_s = None  # file change noticed -> new model serving
+        self.last_warmup_s = None
+        self._stamp = file_stamp(path)
+        self._pending = None
+        self._sample = None  # (recent inputs, current model's outputs for them)
+        self._sampled_at = 0.0
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._watch, name='model-watcher', daemon=True)
+        self._thread.start()
+
+    def predict(self, X, **kwargs):
+        try:
+            preds = self.current.predict(X, **kwargs)
+        except Exception as e:
+            if self.previous is None:
+                raise
+            print(f"[PREDICT] New model failed on a live batch ({e}); rolling back to the previous one.")
+            self.rollback()
+            preds = self.current.predict(X, **kwargs)
+        now = time.monotonic()
+        if self._sample is None or now - self._sampled_at >= self.check_interval:
+            n = min(len(X), SAMPLE_ROWS)
+            self._sample = (np.array(X[:n], dtype=np.float32), np.array(preds[:n]))
+            self._sampled_at = now
+        return preds
+
+    def poll(self):
+        # Called between batches by the scoring loop; the only place current changes.
+        if self._pending is None:
+            return False
+        with self._lock:
+            model, detected = self._pending
+            self._pending = None
+        self.previous, self.current = self.current, model
+        self.version += 1
+        self.swaps += 1
+        self.last_swap_s = time.monotonic() - detected
+        for fn in self.on_swap:
+            fn()
+        print(f"[PREDICT] Swapped in model version {self.version} from {self.path} "
+              f"({self.last_swap_s:.2f}s after the file changed, warm-up {self.last_warmup_s * 1000:.1f} ms)")
+        return True
+
+    def rollback(self):
+        if self.previous is None:
+            return False
+        self.current, self.previous = self.previous, None
+        self.version += 1
+        self.rollbacks += 1
+        for fn in self.on_swap:
+            fn()
+        return True
+
+    def _watch(self):
+        seen = self._stamp
+        while True:
+            time.sleep(self.check_interval)
+            stamp = file_stamp(self.path)
+            # Load only once the file has stopped changing for a whole interval.
+            if stamp is None or stamp == self._stamp or stamp != seen:
+                seen = stamp
+                continue
+            self._stamp = stamp
+            self._prepare(time.monotonic() - self.check_interval)
+
+    def _prepare(self, detected):
+        try:
+            model = self.loader(self.path)
+            sample = self._sample
+            X = sample[0] if sample is not None else np.zeros((8, getattr(model, 'input_dim', 21)), np.float32)
+            t = time.perf_counter()
+            preds = np.asarray(model.predict(X, verbose=0))
+            self.last_warmup_s = time.perf_counter() - t
+            self._validate(preds, sample)
+        except Exception as e:
+            self.failures += 1
+            print(f"[PREDICT] Not swapping to the new {self.path}: {e}. Keeping model version {self.version}.")
+            return
+        with self._lock:
+            self._pending = (model, detected)
+
+    def _validate(self, preds, sample):
+        if preds.ndim != 2 or not np.all(np.isfinite(preds)):
+            raise ValueError("model returned non-finite or malformed outputs")
+        if sample is None:
+            return
+        ref = sample[1]
+        if preds.shape != ref.shape:
+            raise ValueError(f"output shape {preds.shape[1:]} differs from the current model's {ref.shape[1:]}")
+        if self.min_agreement > 0:
+            agreement = float(np.mean((preds.argmax(axis=1) != 0) == (ref.argmax(axis=1) != 0)))
+            if agreement < self.min_agreement:
+                raise ValueError(f"alert agreement with the current model is {agreement:.1%}, "
+                                 f"below {self.min_agreement:.1%}")
+
+    def stats(self):
+        return {"version": self.version, "swaps": self.swaps, "failures": self.failures,
+                "rollbacks": self.rollbacks, "last_swap_s": self.last_swap_s}
+
+    def __getattr__(self, name):
+        return getattr(self.current, name)
@@ -1,9 +1,15 @@
-import subprocess
+import json
+import signal
 import sys
 import time
 import os
-from multiprocessing import Process, Event
-from collections import Counter
+from blocker import Blocker, BACKENDS
+from detection import (DetectionEngine, DETECT_WINDOW_SECONDS, DETECT_WINDOW_SIZE, DETECT_MIN_COUNT,
+                       DETECT_MIN_RATIO, DETECT_MIN_RATE, RED_HOLD, BLOCK_TTL)
+import metrics
+from segments import SegmentWriter, SEGMENT_DIR, SEGMENT_STATE
+from supervisor import Supervisor, Stage
+from tailing import FileTail
 
 try:
     BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -18,8 +24,28 @@ DASHBOARD_SCRIPT = os.path.join(BASE_DIR, "dashboard.py")
 PREDICT_LOG = os.path.join(BASE_DIR, "logs/prediction_output.log")
 STATUS_FILE = os.path.join(BASE_DIR, "logs/status.txt")
 BLOCKED_IPS_FILE = os.path.join(BASE_DIR, "logs/blocked_ips.txt")
+VITALS_ALERTS_FILE = os.path.join(BASE_DIR, "logs/vitals_alerts.json")  # written by rts.py (anomaly.py)
 ESP32_IP = "192.168.137.250"
 INTERFACE = "wlan0"
+# "file": stages hand rows over through the CSV files in logs/.
+# "shm": rtf -> rtc -> rtp use shared-memory rings instead (see shmring.py).
+TRANSPORT = "shm" if "--shm" in sys.argv else os.environ.get("IDS_TRANSPORT", "file")
+# Score one aggregated record per flow and window instead of every packet (see flows.py).
+FLOWS = "--flows" in sys.argv or os.environ.get("IDS_FLOWS", "0") == "1"
+# Capture into a bounded ring of pcap segments that rtf.py extracts on all cores (segments.py)
+# instead of one ever-growing esp32_traffic.pcap.
+SEGMENTS = "--segments" in sys.argv or os.environ.get("IDS_CAPTURE_SEGMENTS", "0") == "1"
+SEGMENT_MB = float(os.environ.get("IDS_SEGMENT_MB", "4"))
+SEGMENT_SECONDS = float(os.environ.get("IDS_SEGMENT_SECONDS", "1"))
+SEGMENT_FILES = int(os.environ.get("IDS_SEGMENT_FILES", "32"))
+# "text": decisions, status and blocklist go through prediction_output.log, status.txt and
+# blocked_ips.txt. "sqlite": all of them live in the event store logs/events.db (eventstore.py).
+EVENTS = "sqlite" if "--sqlite" in sys.argv else os.environ.get("IDS_EVENTS", "text")
+EVENTS_DB = os.path.join(BASE_DIR, "logs/events.db")
+SHM_CAPACITY = int(os.environ.get("IDS_SHM_CAPACITY", "65536"))
+# "ipset" blocks through an ipset + one iptables rule; "dry-run" only logs (no root needed).
+BLOCK_BACKEND = os.environ.get("IDS_BLOCK_BACKEND", "ipset")
+BLUE_HOLD = 4  # seconds the dashboard shows "danger averted" after a block
 
 def get_lan_ip():
     ips = os.popen('hostname -I').read().strip().split()
@@ -31,145 +57,229 @@ def get_lan_ip():
     else:
         return '127.0.0.1'
 
-def run_script(script, name, halt_event, log_file=None):
-    with open(log_file, "w") if log_file else open(os.devnull, "w") as f:
-        proc = subprocess.Popen([sys.executable, script], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1)
-        while True:
-            if halt_event.is_set():
-                proc.terminate()
-                break
-            line = proc.stdout.readline()
-            if not line:
-                break
-            print(f"[{name}] {line}", end='')
-            if log_file:
-                f.write(line)
-                f.flush()
-
-def run_tcpdump(halt_event):
+def tcpdump_stage():
+    lan_ip = get_lan_ip()
+    if SEGMENTS:
+        cmd = ["sudo", "tcpdump", "-i", INTERFACE, "-U", "dst host", lan_ip, "-w", "-"]
+        print(f"[TCPDUMP] Starting: {' '.join(cmd)} -> {SEGMENT_DIR}/ ({SEGMENT_MB:g} MB / {SEGMENT_SECONDS:g}s "
+              f"segments, at most {SEGMENT_FILES} kept)")
+        # The capture arrives on stdout and is cut into segments in the supervisor's event loop.
+        sink = lambda: SegmentWriter(os.path.join(BASE_DIR, SEGMENT_DIR), int(SEGMENT_MB * 1024 * 1024),
+                                     SEGMENT_SECONDS, SEGMENT_FILES, os.path.join(BASE_DIR, SEGMENT_STATE))
+        return Stage("TCPDUMP", cmd, sink=sink, tick_interval=min(0.1, SEGMENT_SECONDS))
     cmd = [
         "sudo", "tcpdump", "-i", INTERFACE,
-        "dst host", get_lan_ip(),
+        "dst host", lan_ip,
         "-w", os.path.join(BASE_DIR, "logs/esp32_traffic.pcap"),
     ]
     print(f"[TCPDUMP] Starting: {' '.join(cmd)}")
-    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
-    while True:
-        if halt_event.is_set():
-            proc.terminate()
-            break
-        line = proc.stdout.readline()
-        if not line:
-            break
-        print(f"[TCPDUMP] {line}", end='')
-
-def run_dashboard():
-    subprocess.Popen([sys.executable, DASHBOARD_SCRIPT])
-
-def tail_file(filename, n=1):
-    try:
-        with open(filename, "r") as f:
-            lines = f.readlines()
-            return lines[-n:] if len(lines) >= n else lines
-    except Exception:
-        return [""]
+    return Stage("TCPDUMP", cmd)
+
+def create_rings():
+    # Created (and later unlinked) here so the rings outlive restarts of individual stages.
+    from shmring import ShmRing, FEATURES_RING, SCALED_RING
+    from rtf import fields
+    n_features = len(fields) - 1
+    rings = [ShmRing.create(FEATURES_RING, SHM_CAPACITY, n_features),
+             ShmRing.create(SCALED_RING, SHM_CAPACITY, n_features)]
+    print(f"[MAIN] Shared-memory transport: {FEATURES_RING}, {SCALED_RING} ({SHM_CAPACITY} records each)")
+    return rings
+
+store = None
+
+def get_store():
+    global store
+    if store is None and EVENTS == "sqlite":
+        from eventstore import EventStore
+        store = EventStore(EVENTS_DB)
+    return store
 
 def write_status(status):
+    if get_store() is not None:
+        store.set_status(status)
+        return
     with open(STATUS_FILE, "w") as f:
         f.write(status + "\n")
 
+blocker = None
+
+def start_blocker():
+    global blocker
+    blocked_file = None if get_store() is not None else BLOCKED_IPS_FILE
+    blocker = Blocker(BACKENDS[BLOCK_BACKEND](), blocked_file=blocked_file, default_ttl=BLOCK_TTL, store=store)
+    return blocker.start()
+
 def block_ip(ip):
     my_ip = get_lan_ip()
     if not ip or ip == my_ip or ip == "127.0.0.1" or ip == "192.168.137.1" or ip == ESP32_IP:
         print(f"[INFO] Skipping IP (not blocking): {ip}")
         return
+    if blocker is None:
+        start_blocker()
     print(f"[DEBUG] Blocking IP: {ip}")
-    subprocess.run(['sudo', 'iptables', '-I', 'INPUT', '1', '-s', ip, '-j', 'DROP'])
-    subprocess.run(['sudo', 'netfilter-persistent', 'save'])
-    # Save blocked IP to file
-    with open(BLOCKED_IPS_FILE, "a") as f:
-        f.write(ip + "\n")
-    print(f"[INFO] Blocked and saved IP: {ip}")
-
-def extract_top_attacker_ip_from_last_n_malicious(n=500):
-    lines = tail_file(PREDICT_LOG, n)
-    ips = []
-    for line in lines:
-        if "ALERT: Malicious" in line and "src_ip:" in line:
-            parts = line.strip().split("src_ip:")
-            if len(parts) > 1:
-                ip = parts[1].strip().split()[0]
-                ips.append(ip)
-    exclude = {get_lan_ip(), "127.0.0.1", "192.168.137.1", ESP32_IP}
-    ips = [ip for ip in ips if ip and ip not in exclude]
-    if not ips:
+    # Queued: the blocker thread applies it (and saves blocked_ips.txt) in the next batch.
+    blocker.block(ip)
+
+def parse_prediction(line):
+    # "Row N: ALERT: Malicious traffic detected! src_ip: X" / "Row N: Normal traffic src_ip: X",
+    # with " packets: K" appended when the row is a flow of K packets.
+    if "src_ip:" not in line:
         return None
-    counter = Counter(ips)
-    top_ip, count = counter.most_common(1)[0]
-    print(f"[DEBUG] Top attacker IP in last {n} malicious: {top_ip} ({count} times)")
-    return top_ip
+    parts = line.strip().split("src_ip:")
+    ip = parts[1].strip().split()[0] if len(parts) > 1 and parts[1].strip() else ""
+    weight = 1
+    if "packets:" in line:
+        try:
+            weight = max(1, int(line.rsplit("packets:", 1)[1].split()[0]))
+        except (ValueError, IndexError):
+            pass
+    return "ALERT: Malicious" in line, ip, weight
+
+_vitals = [None, ""]  # alerts file stamp, summary line
+
+def vitals_line():
+    # The physiological alerts rts.py currently has active, as one line ("" when none).
+    try:
+        st = os.stat(VITALS_ALERTS_FILE)
+        stamp = (st.st_mtime_ns, st.st_size)
+    except FileNotFoundError:
+        return ""
+    if stamp != _vitals[0]:
+        try:
+            with open(VITALS_ALERTS_FILE) as f:
+                alerts = json.load(f)["alerts"]
+        except (OSError, ValueError, KeyError):
+            alerts = []
+        _vitals[0] = stamp
+        _vitals[1] = "; ".join(f"{a['device'] or 'sensor'} {a['signal']} {a['value']:g} ({a['reason']})"
+                               for a in alerts)
+    return _vitals[1]
+
+def decision_reader():
+    # Returns a function giving the new decisions as [(is_malicious, ip, weight)].
+    if get_store() is not None:
+        last_id = [store.last_prediction_id()]  # only decisions made from now on
+
+        def read():
+            rows = store.predictions_since(last_id[0])
+            if rows:
+                last_id[0] = rows[-1][0]
+            return [(bool(mal), ip, weight) for _, _, ip, mal, weight in rows]
+        return read
+    log = FileTail(PREDICT_LOG)
+    return lambda: [d for d in map(parse_prediction, log.read_lines()) if d]
 
 def monitor_for_attack():
-    already_blocked = set()
+    # Each src_ip is judged on its own sliding window (see detection.py), so several attackers,
+    # or an attacker hidden among normal traffic, are flagged and blocked independently.
+    exclude = {get_lan_ip(), "127.0.0.1", "192.168.137.1", ESP32_IP}
+    engine = DetectionEngine(
+        window_seconds=DETECT_WINDOW_SECONDS, window_size=DETECT_WINDOW_SIZE,
+        min_count=DETECT_MIN_COUNT, min_ratio=DETECT_MIN_RATIO, min_rate=DETECT_MIN_RATE,
+        exclude=exclude)
+    if blocker is None:
+        start_blocker()
+    read_decisions = decision_reader()
+    m = metrics.registry("monitor")
+    decisions = {True: m.counter("ids_decisions_total", "Predictions read by the monitor", verdict="malicious"),
+                 False: m.counter("ids_decisions_total", "Predictions read by the monitor", verdict="normal")}
+    flagged_total = m.counter("ids_sources_flagged_total", "Sources that crossed the detection thresholds")
+    blocked_total = m.counter("ids_sources_blocked_total", "Sources handed to the blocker")
+    last_input = [0.0]
+    m.gauge("ids_seconds_since_input", "Seconds since the stage last received input", fn=metrics.since(last_input))
+    m.gauge("ids_tracked_sources", "Sources with a live detection window", fn=lambda: len(engine.sources))
+    m.start_exporter(directory=os.path.join(BASE_DIR, metrics.METRICS_DIR))
+    flagged_at = {}  # ip -> when it was flagged; blocked once red has been shown for RED_HOLD
+    averted_until = 0.0
+    last_evict = time.monotonic()
+    status = "Benign"
+    vitals = ""
+    write_status(status)
     while True:
-        status = "Benign"
-        if os.path.exists(PREDICT_LOG):
-            pred_lines = tail_file(PREDICT_LOG, n=500)
-            # Attack detected: 500 consecutive malicious
-            if pred_lines and all("ALERT: Malicious" in l for l in pred_lines) and len(pred_lines) == 500:
-                attacker_ip = extract_top_attacker_ip_from_last_n_malicious(n=500)
-                if attacker_ip and attacker_ip not in already_blocked:
-                    print("[MAIN] Detected sustained attack. Extracting attacker IP...")
-                    # 1. RED: Attack detected
-                    status = "Halted"
-                    write_status(status)
-                    print("[MAIN] RED status written. Waiting 3 seconds for dashboard to show red.")
-                    time.sleep(3)  # Hold red for 3 seconds
-
-                    # 2. Block attacker and show BLUE
-                    block_ip(attacker_ip)
-                    already_blocked.add(attacker_ip)
-                    status = "Danger averted: attacker blocked"
-                    write_status(status)
-                    print("[MAIN] BLUE status written. Waiting 4 seconds for dashboard to show blue.")
-                    time.sleep(4)  # Hold blue for 4 seconds
-
-                    # 3. GREEN: Benign
-                    status = "Benign"
-                    write_status(status)
-                    print("[MAIN] GREEN status written. Returning to normal monitoring.")
-                else:
-                    # Already blocked or no attacker found, just show benign
-                    status = "Benign"
-                    write_status(status)
-            else:
-                status = "Benign"
-                write_status(status)
-        time.sleep(0.1)
+        batch = read_decisions()
+        now = time.monotonic()
+        if batch:
+            last_input[0] = time.time()
+        for is_mal, ip, weight in batch:
+            decisions[is_mal].inc()
+            if engine.update(ip, is_mal, now, weight):
+                flagged_at.setdefault(ip, now)
+                flagged_total.inc()
+                s = engine.stats(ip)
+                print(f"[MAIN] Detected sustained attack from {ip} "
+                      f"({s['malicious']}/{s['count']} malicious in window).")
+                if store is not None:
+                    store.add_alert(ip, "flagged", f"{s['malicious']}/{s['count']} malicious in window")
+
+        due = [ip for ip, t in flagged_at.items() if now - t >= RED_HOLD]
+        for ip in due:
+            block_ip(ip)
+            blocked_total.inc()
+            if store is not None:
+                store.add_alert(ip, "blocked")
+            # Not excluded for good: while blocked, rtp.py drops its rows anyway, and once the block
+            # expires (IDS_BLOCK_TTL) it can be flagged again.
+            engine.forget(ip, exclude=False)
+            del flagged_at[ip]
+        if due:
+            averted_until = now + BLUE_HOLD
+
+        # 1. RED while any attacker is waiting to be blocked, 2. BLUE for a while after blocking,
+        # 3. GREEN otherwise.
+        if flagged_at:
+            new_status = "Halted"
+        elif now < averted_until:
+            new_status = "Danger averted: attacker blocked"
+        else:
+            new_status = "Benign"
+        # Physiological alerts go on a second line, below the network status.
+        new_vitals = vitals_line()
+        if new_status != status or new_vitals != vitals:
+            if new_status != status:
+                print(f"[MAIN] Status: {new_status}")
+            if new_vitals != vitals:
+                print(f"[MAIN] Vitals: {new_vitals or 'normal'}")
+            status, vitals = new_status, new_vitals
+            write_status(status + (f"\nVitals alert: {vitals}" if vitals else ""))
 
+        if now - last_evict >= 10:
+            engine.evict_idle(now)
+            last_evict = now
+        if not batch:
+            time.sleep(0.1)
 
 if __name__ == "__main__":
     lan_ip = get_lan_ip()
     print(f"\n[MAIN] Starting web dashboard at: http://{lan_ip}:8050\n")
-    halt_event = Event()
-    dashboard_proc = Process(target=run_dashboard)
-    dashboard_proc.start()
-    time.sleep(2)
-
-    procs = [
-        Process(target=run_tcpdump, args=(halt_event,)),
-        Process(target=run_script, args=(SENSOR_SCRIPT, "SENSOR", halt_event)),
-        Process(target=run_script, args=(FEATURES_SCRIPT, "FEATURES", halt_event)),
-        Process(target=run_script, args=(PREPROCESS_SCRIPT, "PREPROCESS", halt_event)),
-        Process(target=run_script, args=(PREDICT_SCRIPT, "PREDICT", halt_event, PREDICT_LOG))
-    ]
-    for p in procs:
-        p.start()
-        time.sleep(1)
+    os.environ["IDS_TRANSPORT"] = TRANSPORT  # inherited by the stage subprocesses
+    os.environ["IDS_FLOWS"] = "1" if FLOWS else "0"
+    os.environ["IDS_CAPTURE_SEGMENTS"] = "1" if SEGMENTS else "0"
+    os.environ["IDS_EVENTS"] = EVENTS
+    rings = create_rings() if TRANSPORT == "shm" else []
+    open(PREDICT_LOG, "w").close()  # rtp.py appends this run's decisions
 
-    monitor_for_attack()
+    # One event loop runs every stage, relays their output and restarts them (supervisor.py);
+    # stages with a metrics registry are also health-checked through their snapshots.
+    supervisor = Supervisor(metrics_dir=os.path.join(BASE_DIR, metrics.METRICS_DIR))
+    supervisor.add(Stage("DASHBOARD", [sys.executable, DASHBOARD_SCRIPT]))
+    supervisor.add(tcpdump_stage())
+    supervisor.add(Stage("SENSOR", [sys.executable, SENSOR_SCRIPT]))
+    supervisor.add(Stage("FEATURES", [sys.executable, FEATURES_SCRIPT], metrics_stage="extract"))
+    supervisor.add(Stage("PREPROCESS", [sys.executable, PREPROCESS_SCRIPT], metrics_stage="preprocess"))
+    supervisor.add(Stage("PREDICT", [sys.executable, PREDICT_SCRIPT], metrics_stage="predict"))
+    supervisor.start()
 
-    for p in procs:
-        p.join()
-    dashboard_proc.terminate()
+    def terminate(signum, frame):
+        raise KeyboardInterrupt
+    signal.signal(signal.SIGTERM, terminate)
+    try:
+        monitor_for_attack()
+    except KeyboardInterrupt:
+        print("[MAIN] Stopping...")
+    finally:
+        supervisor.stop()
+        if blocker is not None:
+            blocker.stop()
+        for ring in rings:
+            ring.close()
     print("[MAIN] Exited.")
@@ -0,0 +1,186 @@
+import bisect
+import json
+import os
+import threading
+import time
+
+# Lightweight per-process metrics. Each pipeline stage records counters, gauges and
+# histograms in memory (an update is a dict lookup and an add) and a daemon thread dumps a
+# JSON snapshot to logs/metrics/<stage>.json every couple of seconds. dashboard.py merges the
+# snapshots into one Prometheus text page at /metrics.
+
+METRICS_DIR = os.environ.get('IDS_METRICS_DIR', 'logs/metrics')
+EXPORT_INTERVAL = 2.0
+# Seconds; covers sub-millisecond batch runs up to multi-second backlogs.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, n=1):
+        self.value += n
+
+    def snapshot(self):
+        return {'value': self.value}
+
+
+class Gauge:
+    kind = 'gauge'
+
+    def __init__(self, fn=None):
+        self.value = 0
+        self.fn = fn  # evaluated at export time, e.g. "seconds since last input"
+
+    def set(self, value):
+        self.value = value
+
+    def snapshot(self):
+        return {'value': self.fn() if self.fn else self.value}
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def observe_many(self, values):
+        # One vectorised pass for a whole batch (e.g. per-row latencies).
+        if np is None:
+            for v in values:
+                self.observe(v)
+            return
+        values = np.asarray(values, dtype=np.float64)
+        if not values.size:
+            return
+        idx = np.searchsorted(self.buckets, values, side='left')
+        for i, n in enumerate(np.bincount(idx, minlength=len(self.counts)).tolist()):
+            self.counts[i] += n
+        self.sum += float(values.sum())
+        self.count += int(values.size)
+
+    def snapshot(self):
+        return {'buckets': list(self.buckets), 'counts': list(self.counts), 'sum': self.sum, 'count': self.count}
+
+
+class Registry:
+    def __init__(self, stage):
+        self.stage = stage
+        self.metrics = {}  # (name, labels) -> (metric, help)
+        self._thread = None
+
+    def _get(self, cls, name, help, labels, **kwargs):
+        key = (name, tuple(sorted(labels.items())))
+        entry = self.metrics.get(key)
+        if entry is None:
+            entry = self.metrics[key] = (cls(**kwargs), help)
+        return entry[0]
+
+    def counter(self, name, help='', **labels):
+        return self._get(Counter, name, help, labels)
+
+    def gauge(self, name, help='', fn=None, **labels):
+        g = self._get(Gauge, name, help, labels)
+        if fn is not None:
+            g.fn = fn
+        return g
+
+    def histogram(self, name, help='', buckets=LATENCY_BUCKETS, **labels):
+        return self._get(Histogram, name, help, labels, buckets=buckets)
+
+    def snapshot(self):
+        out = []
+        for (name, labels), (metric, help) in list(self.metrics.items()):
+            entry = {'name': name, 'type': metric.kind, 'help': help, 'labels': dict(labels)}
+            entry.update(metric.snapshot())
+            out.append(entry)
+        return {'stage': self.stage, 'pid': os.getpid(), 'time': time.time(), 'metrics': out}
+
+    def export(self, directory=METRICS_DIR):
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f'{self.stage}.json')
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp, path)
+
+    def start_exporter(self, interval=EXPORT_INTERVAL, directory=METRICS_DIR):
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.export(directory)
+                except Exception as e:
+                    print(f"[METRICS] Export for {self.stage} failed: {e}")
+        self._thread = threading.Thread(target=run, name='metrics-exporter', daemon=True)
+        self._thread.start()
+        return self
+
+
+_registries = {}
+
+
+def registry(stage):
+    if stage not in _registries:
+        _registries[stage] = Registry(stage)
+    return _registries[stage]
+
+
+def since(timestamp_holder):
+    # Gauge callback: seconds since timestamp_holder[0] (a one-element list updated by the stage).
+    return lambda: time.time() - timestamp_holder[0] if timestamp_holder[0] else -1
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+                          for k, v in sorted(labels.items())) + '}'
+
+
+def render_prometheus(snapshots, now=None, stale_after=3 * EXPORT_INTERVAL):
+    # Prometheus text exposition (0.0.4) of stage snapshots; every series gets a stage label.
+    now = time.time() if now is None else now
+    families = {}
+    for snap in snapshots:
+        for m in snap['metrics']:
+            families.setdefault(m['name'], (m['type'], m['help'], []))[2].append((snap['stage'], m))
+    lines = ['# HELP ids_stage_up Whether the stage exported metrics recently.', '# TYPE ids_stage_up gauge']
+    for snap in snapshots:
+        up = 1 if now - snap['time'] <= stale_after else 0
+        lines.append(f'ids_stage_up{_format_labels({"stage": snap["stage"]})} {up}')
+    for name in sorted(families):
+        kind, help, series = families[name]
+        if help:
+            lines.append(f'# HELP {name} {help}')
+        lines.append(f'# TYPE {name} {kind}')
+        for stage, m in series:
+            labels = dict(m['labels'], stage=stage)
+            if kind == 'histogram':
+                cumulative = 0
+                for le, n in zip(m['buckets'] + ['+Inf'], m['counts']):
+                    cumulative += n
+                    lines.append(f'{name}_bucket{_format_labels(dict(labels, le=le))} {cumulative}')
+                lines.append(f'{name}_sum{_format_labels(labels)} {m["sum"]}')
+                lines.append(f'{name}_count{_format_labels(labels)} {m["count"]}')
+            else:
+                lines.append(f'{name}{_format_labels(labels)} {m["value"]}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,155 @@
+import json
+import os
+import shutil
+import numpy as np
+import h5py
+
+
+def _sigmoid(x):
+    # tanh form never overflows, unlike 1 / (1 + exp(-x)) for large negative x
+    return 0.5 * (1.0 + np.tanh(0.5 * x))
+
+
+def _softmax(x):
+    e = np.exp(x - x.max(axis=-1, keepdims=True))
+    return e / e.sum(axis=-1, keepdims=True)
+
+
+ACTIVATIONS = {
+    'linear': lambda x: x,
+    None: lambda x: x,
+    'sigmoid': _sigmoid,
+    'softmax': _softmax,
+    'relu': lambda x: np.maximum(x, 0),
+    'tanh': np.tanh,
+    'elu': lambda x: np.where(x > 0, x, np.expm1(np.minimum(x, 0))),
+    'softplus': lambda x: np.logaddexp(0, x),
+    'softsign': lambda x: x / (1 + np.abs(x)),
+    'swish': lambda x: x * _sigmoid(x),
+    'silu': lambda x: x * _sigmoid(x),
+}
+
+
+def _activation(name):
+    if isinstance(name, dict):  # serialized activation object
+        name = name.get('config', {}).get('name', name.get('class_name'))
+    if name not in ACTIVATIONS:
+        raise ValueError(f"Unsupported activation: {name}")
+    return ACTIVATIONS[name]
+
+
+def _decode(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def _weight_datasets(group):
+    # weight_names lists the datasets in creation order (kernel, bias, ...), relative to the
+    # layer group, for both the Keras 2 ("dense/kernel:0") and Keras 3 ("dense/kernel") layouts.
+    names = [_decode(n) for n in group.attrs.get('weight_names', [])]
+    if names:
+        return {n.split('/')[-1].split(':')[0]: group[n] for n in names}
+    datasets = {}
+    group.visititems(lambda name, obj: datasets.setdefault(name.split('/')[-1].split(':')[0], obj)
+                     if isinstance(obj, h5py.Dataset) else None)
+    return datasets
+
+
+def _layer_weights(group):
+    return {name: ds[()] for name, ds in _weight_datasets(group).items()}
+
+
+class NumpyModel:
+    # A chain of dense layers evaluated with plain NumPy: y = act(x @ W + b) per layer.
+    def __init__(self, layers, path=None):
+        self.layers = layers  # [(name, kernel, bias, activation_fn, activation_name)]
+        self.path = path
+
+    @property
+    def input_dim(self):
+        return self.layers[0][1].shape[0]
+
+    def predict(self, X, batch_size=None, verbose=0):
+        X = np.asarray(X, dtype=np.float32)
+        if batch_size is None or len(X) <= batch_size:
+            return self._forward(X)
+        return np.concatenate([self._forward(X[i:i + batch_size]) for i in range(0, len(X), batch_size)])
+
+    def _forward(self, h):
+        for _, kernel, bias, act, _ in self.layers:
+            h = h @ kernel
+            if bias is not None:
+                h += bias
+            h = act(h)
+        return h
+
+    def __call__(self, X):
+        return self.predict(X)
+
+    def get_weights(self):
+        weights = []
+        for _, kernel, bias, _, _ in self.layers:
+            weights.append(kernel)
+            if bias is not None:
+                weights.append(bias)
+        return weights
+
+    def summary(self):
+        for name, kernel, bias, _, act_name in self.layers:
+            print(f"{name}: {kernel.shape[0]} -> {kernel.shape[1]} ({act_name})")
+
+
+def load_h5_model(path):
+    with h5py.File(path, 'r') as f:
+        config = json.loads(_decode(f.attrs['model_config']))
+        root = f['model_weights'] if 'model_weights' in f else f
+        layer_configs = config['config']
+        if isinstance(layer_configs, dict):
+            layer_configs = layer_configs['layers']
+
+        layers = []
+        for layer in layer_configs:
+            cls = layer['class_name']
+            cfg = layer['config']
+            name = cfg.get('name', layer.get('name'))
+            if cls in ('InputLayer', 'Dropout', 'GaussianNoise', 'GaussianDropout', 'AlphaDropout'):
+                continue  # no-ops at inference time
+            if cls == 'Dense':
+                w = _layer_weights(root[name])
+                kernel = np.asarray(w['kernel'], dtype=np.float32)
+                bias = np.asarray(w['bias'], dtype=np.float32) if cfg.get('use_bias', True) else None
+                act_name = cfg.get('activation', 'linear')
+                layers.append((name, kernel, bias, _activation(act_name), act_name))
+            elif cls == 'Activation':
+                if not layers:
+                    raise ValueError(f"{path}: Activation layer {name} before any Dense layer")
+                prev_name, kernel, bias, prev_act, prev_act_name = layers[-1]
+                act = _activation(cfg['activation'])
+                layers[-1] = (prev_name, kernel, bias, lambda x, a=act, p=prev_act: a(p(x)),
+                              f"{prev_act_name}+{cfg['activation']}")
+            else:
+                raise ValueError(f"{path}: layer type {cls} is not supported by the NumPy backend")
+    if not layers:
+        raise ValueError(f"{path}: no Dense layers found")
+    return NumpyModel(layers, path)
+
+
+def save_h5_weights(layers, path, template):
+    # Writes Dense kernels/biases into a copy of template (a Keras h5 with the same layer names),
+    # so the result keeps the template's config and loads anywhere the original does.
+    if os.path.abspath(template) != os.path.abspath(path):
+        tmp = path + '.tmp'
+        shutil.copyfile(template, tmp)
+    else:
+        tmp = path
+    with h5py.File(tmp, 'r+') as f:
+        root = f['model_weights'] if 'model_weights' in f else f
+        for name, kernel, bias, _, _ in layers:
+            datasets = _weight_datasets(root[name])
+            for key, value in (('kernel', kernel), ('bias', bias)):
+                if value is None:
+                    continue
+                if datasets[key].shape != value.shape:
+                    raise ValueError(f"{template}: {name}/{key} has shape {datasets[key].shape}, not {value.shape}")
+                datasets[key][...] = value
+    if tmp != path:
+        os.replace(tmp, path)
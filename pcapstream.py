@@ -0,0 +1,160 @@
+import os
+import struct
+import json
+
+# libpcap magic -> struct byte order (micro- and nanosecond variants)
+PCAP_MAGICS = {
+    b"\xd4\xc3\xb2\xa1": "<",
+    b"\xa1\xb2\xc3\xd4": ">",
+    b"\x4d\x3c\xb2\xa1": "<",
+    b"\xa1\xb2\x3c\x4d": ">",
+}
+NANOSECOND_MAGICS = (b"\x4d\x3c\xb2\xa1", b"\xa1\xb2\x3c\x4d")
+GLOBAL_HEADER_LEN = 24
+RECORD_HEADER_LEN = 16
+MAX_SNAPLEN = 262144
+
+
+# Follows a growing pcap and hands out only the packets added since the last read.
+# Each chunk is a self-contained pcap (global header + whole records) that can be piped
+# straight into tshark. Truncation, a rewritten header or a new inode restart the scan.
+# A damaged record in an otherwise unchanged file only skips ahead: the scan resumes at the
+# next offset where two consecutive plausible record headers line up.
+class PcapTail:
+    def __init__(self, path, offset=0, packets=0, inode=None):
+        self.path = path
+        self.offset = offset
+        self.packets = packets
+        self.inode = inode
+        self.header = None
+        self.endian = "<"
+        self.snaplen = MAX_SNAPLEN
+        self.frac_limit = 10 ** 6
+        self.resets = 0
+        self.skipped_bytes = 0
+
+    def reset(self, reason):
+        print(f"[FEATURES] {self.path} {reason}, restarting from the first packet.")
+        self.offset = 0
+        self.packets = 0
+        self.header = None
+        self.resets += 1
+
+    def _check_header(self, f, st):
+        if self.inode is not None and st.st_ino != self.inode:
+            self.reset("was rotated")
+        if st.st_size < self.offset:
+            self.reset("was truncated")
+        self.inode = st.st_ino
+        if st.st_size < GLOBAL_HEADER_LEN:
+            return False
+        f.seek(0)
+        header = f.read(GLOBAL_HEADER_LEN)
+        if header[:4] not in PCAP_MAGICS:
+            print(f"[FEATURES] {self.path} is not a libpcap file (magic {header[:4].hex()}).")
+            return False
+        if self.header is not None and header != self.header:
+            self.reset("was rewritten")
+        if self.header is None:
+            self.header = header
+            self.endian = PCAP_MAGICS[header[:4]]
+            self.frac_limit = 10 ** 9 if header[:4] in NANOSECOND_MAGICS else 10 ** 6
+            snaplen = struct.unpack(self.endian + "I", header[16:20])[0]
+            self.snaplen = snaplen if 0 < snaplen <= MAX_SNAPLEN else MAX_SNAPLEN
+        if self.offset < GLOBAL_HEADER_LEN:
+            self.offset = GLOBAL_HEADER_LEN
+            self.packets = 0
+        return True
+
+    def read_new(self, max_bytes=8 * 1024 * 1024):
+        try:
+            f = open(self.path, "rb")
+        except FileNotFoundError:
+            return None, 0
+        with f:
+            st = os.fstat(f.fileno())
+            if not self._check_header(f, st):
+                return None, 0
+            available = st.st_size - self.offset
+            if available < RECORD_HEADER_LEN:
+                return None, 0
+            f.seek(self.offset)
+            buf = f.read(min(available, max(max_bytes, self.snaplen + RECORD_HEADER_LEN)))
+
+        pos = 0
+        n = 0
+        end = len(buf)
+        while pos + RECORD_HEADER_LEN <= end:
+            incl_len = self._record_len(buf, pos)
+            if incl_len is None:
+                if n:
+                    break  # hand out the good records first; resync on the next read
+                sync = self._resync(buf)
+                if sync is None:
+                    # Every offset that could still start a record needs more data to confirm;
+                    # those before it can be dropped now.
+                    skip = end - 2 * RECORD_HEADER_LEN - self.snaplen
+                    if skip > 0:
+                        self._skip(skip)
+                    return None, 0
+                self._skip(sync)
+                buf = buf[sync:]
+                end = len(buf)
+                continue
+            if pos + RECORD_HEADER_LEN + incl_len > end:
+                break  # tcpdump has not finished writing this record yet
+            pos += RECORD_HEADER_LEN + incl_len
+            n += 1
+        if not n:
+            return None, 0
+        self.offset += pos
+        self.packets += n
+        return self.header + buf[:pos], n
+
+    def _record_len(self, buf, pos):
+        # incl_len of the record header at pos, or None if it cannot be one.
+        _, frac, incl_len, orig_len = struct.unpack_from(self.endian + "IIII", buf, pos)
+        if frac >= self.frac_limit or incl_len > self.snaplen or orig_len < incl_len:
+            return None
+        return incl_len
+
+    def _resync(self, buf):
+        # First offset after the damaged header at 0 where a plausible record is followed by
+        # another one, or None if there is none in buf yet.
+        last = len(buf) - 2 * RECORD_HEADER_LEN
+        for pos in range(1, last + 1):
+            incl_len = self._record_len(buf, pos)
+            if incl_len is None:
+                continue
+            following = pos + RECORD_HEADER_LEN + incl_len
+            if following <= last + RECORD_HEADER_LEN and self._record_len(buf, following) is not None:
+                return pos
+        return None
+
+    def _skip(self, n):
+        print(f"[FEATURES] {self.path} has a corrupt record at byte {self.offset}; skipped {n} bytes.")
+        self.offset += n
+        self.skipped_bytes += n
+
+    def state(self):
+        return {"inode": self.inode, "offset": self.offset, "packets": self.packets}
+
+    def save_state(self, state_path, checkpoint=None):
+        # checkpoint: (offset, packets) to resume from instead of the read position, e.g. the
+        # end of the last packet whose row has actually been emitted.
+        state = self.state()
+        if checkpoint is not None:
+            state["offset"], state["packets"] = checkpoint
+        tmp = state_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp, state_path)
+
+    @classmethod
+    def from_state(cls, path, state_path):
+        try:
+            with open(state_path) as f:
+                state = json.load(f)
+            return cls(path, state["offset"], state["packets"], state["inode"])
+        except (OSError, ValueError, KeyError):
+            return cls(path)
@@ -0,0 +1,128 @@
+import os
+import time
+from collections import OrderedDict
+import numpy as np
+
+# LRU cache of model outputs keyed by feature vector. Gateway traffic repeats the same few
+# feature vectors (identical flags, no HTTP fields, same MAC bits) thousands of times, so a
+# micro-batch is first collapsed to its distinct rows with one np.unique, those are looked up,
+# and only the misses reach the model. With decimals set, vectors are rounded before keying
+# so near-identical rows share an entry (exact float32 match otherwise).
+# The cache clears itself when the model file's mtime changes.
+
+MODEL_CHECK_INTERVAL = 1.0
+
+
+class PredictionCache:
+    def __init__(self, max_entries=65536, decimals=None, model_path=None):
+        self.max_entries = max_entries
+        self.decimals = decimals
+        self.model_path = model_path
+        self.index = OrderedDict()  # key bytes -> slot in self.values, least recent first
+        self.values = None
+        self.free = []
+        self.rows = 0
+        self.model_rows = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.row_cost = 0.0  # EWMA of model seconds per row, to estimate the time saved
+        self._model_stamp = self._stamp()
+        self._last_check = time.monotonic()
+
+    def _stamp(self):
+        try:
+            st = os.stat(self.model_path)
+            return st.st_mtime_ns, st.st_size
+        except (OSError, TypeError):
+            return None
+
+    def _check_model(self):
+        now = time.monotonic()
+        if now - self._last_check < MODEL_CHECK_INTERVAL:
+            return
+        self._last_check = now
+        stamp = self._stamp()
+        if stamp != self._model_stamp:
+            self._model_stamp = stamp
+            self.invalidate()
+
+    def invalidate(self):
+        self.index.clear()
+        self.free = list(range(self.max_entries - 1, -1, -1)) if self.values is not None else []
+        self.invalidations += 1
+
+    def _keys(self, X):
+        K = np.round(X, self.decimals) if self.decimals is not None else X
+        K = np.ascontiguousarray(K + np.float32(0.0), dtype=np.float32)  # -0.0 and 0.0 share a key
+        return K.view(np.dtype((np.void, K.dtype.itemsize * K.shape[1]))).ravel()
+
+    def predict(self, model, X, **kwargs):
+        X = np.asarray(X, dtype=np.float32)
+        if not len(X):
+            return model.predict(X, **kwargs)
+        self._check_model()
+        uniq, first, inverse = np.unique(self._keys(X), return_index=True, return_inverse=True)
+        keys = [k.tobytes() for k in uniq]
+        slots = [self.index.get(k) for k in keys]
+        missing = [i for i, s in enumerate(slots) if s is None]
+        generation = self.invalidations
+
+        if missing:
+            t = time.perf_counter()
+            preds = np.asarray(model.predict(X[first[missing]], **kwargs))
+            elapsed = time.perf_counter() - t
+            per_row = elapsed / len(missing)
+            self.row_cost = per_row if not self.model_rows else 0.8 * self.row_cost + 0.2 * per_row
+            self.model_rows += len(missing)
+            if self.values is None:
+                self.values = np.zeros((self.max_entries, preds.shape[1]), dtype=preds.dtype)
+                self.free = list(range(self.max_entries - 1, -1, -1))
+        if self.invalidations != generation and len(missing) < len(keys):
+            # The cache was cleared during model.predict (a hot-swap rollback): the hits belong
+            # to the model that was just dropped, so the whole batch goes to the one now serving.
+            missing = list(range(len(keys)))
+            slots = [None] * len(keys)
+            preds = np.asarray(model.predict(X[first], **kwargs))
+            self.model_rows += len(keys)
+        out = np.empty((len(keys), self.values.shape[1]), dtype=self.values.dtype)
+
+        for i, slot in enumerate(slots):
+            if slot is not None:
+                self.index.move_to_end(keys[i])
+                out[i] = self.values[slot]
+        for j, i in enumerate(missing):
+            out[i] = preds[j]
+            if self.free:
+                slot = self.free.pop()
+            else:
+                _, slot = self.index.popitem(last=False)
+                self.evictions += 1
+            self.values[slot] = preds[j]
+            self.index[keys[i]] = slot
+        self.rows += len(X)
+        return out[inverse.ravel()]
+
+    def stats(self):
+        hits = self.rows - self.model_rows
+        return {
+            "entries": len(self.index),
+            "rows": self.rows,
+            "model_rows": self.model_rows,
+            "hit_rate": hits / self.rows if self.rows else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "saved_s": hits * self.row_cost,
+        }
+
+
+class CachedModel:
+    # Drop-in for the model in rtp.py: predict() goes through the cache.
+    def __init__(self, model, cache):
+        self.model = model
+        self.cache = cache
+
+    def predict(self, X, **kwargs):
+        return self.cache.predict(self.model, X, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
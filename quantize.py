@@ -0,0 +1,79 @@
+import argparse
+import os
+import random
+import numpy as np
+
+from tfliteinfer import MODES, quantized_path
+
+# Post-training quantisation of the DBN for rtp.py's int8 / float16 backends. The int8 model is
+# calibrated on a random sample of real preprocessed rows, so activation ranges match the
+# traffic the gateway actually scores.
+#
+#   python quantize.py --mode int8                  # add --integer-io for int8 in/out tensors
+#   IDS_MODEL_BACKEND=int8 python rtp.py
+#   python bench_inference.py --backends numpy,int8,float16    # agreement/throughput/latency
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_PATH = os.path.join(BASE_DIR, 'dbn_iomt_ids.h5')
+CALIBRATION_CSV = os.path.join(BASE_DIR, 'logs/network_features_preprocessed.csv')
+
+
+def calibration_rows(path, n_rows, seed=0):
+    from rtp import parse_rows
+    with open(path, newline='') as f:
+        header = f.readline()
+        lines = f.readlines()
+    if len(lines) > n_rows:
+        lines = random.Random(seed).sample(lines, n_rows)
+    _, X, _ = parse_rows(lines, header)
+    return X
+
+
+def convert(model_path, mode, X=None, integer_io=False):
+    import tensorflow as tf
+    model = tf.keras.models.load_model(model_path)
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if mode == 'float16':
+        converter.target_spec.supported_types = [tf.float16]
+    elif mode == 'int8':
+        if X is None or not len(X):
+            raise ValueError("int8 quantisation needs calibration rows")
+        converter.representative_dataset = lambda: ([X[i:i + 1]] for i in range(len(X)))
+        # Integer kernels throughout. In/out stay float32 unless integer_io is set, for runtimes
+        # without float support; TFLiteModel then (de)quantises at the boundary.
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        if integer_io:
+            converter.inference_input_type = tf.int8
+            converter.inference_output_type = tf.int8
+    else:
+        raise ValueError(f"Unknown quantisation mode: {mode}")
+    return converter.convert()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Quantise the IDS model for reduced-precision inference')
+    parser.add_argument('--model', default=MODEL_PATH)
+    parser.add_argument('--mode', choices=MODES, default='int8')
+    parser.add_argument('--calibration', default=CALIBRATION_CSV)
+    parser.add_argument('--samples', type=int, default=2000, help='calibration rows (int8)')
+    parser.add_argument('--integer-io', action='store_true', help='int8 input/output tensors (int8)')
+    parser.add_argument('--output', help='default: <model>.<mode>.tflite')
+    args = parser.parse_args()
+
+    X = None
+    if args.mode == 'int8':
+        if not os.path.exists(args.calibration):
+            raise SystemExit(f"[QUANTIZE] {args.calibration} not found; run the pipeline first to capture traffic")
+        X = calibration_rows(args.calibration, args.samples).astype(np.float32)
+        print(f"[QUANTIZE] Calibrating on {len(X)} rows from {args.calibration}")
+    content = convert(args.model, args.mode, X, integer_io=args.integer_io)
+    output = args.output or quantized_path(args.model, args.mode)
+    with open(output, 'wb') as f:
+        f.write(content)
+    print(f"[QUANTIZE] Wrote {output} ({len(content) / 1024:.0f} KiB, "
+          f"{os.path.getsize(args.model) / 1024:.0f} KiB float32 .h5)")
+
+
+if __name__ == '__main__':
+    main()
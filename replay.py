@@ -0,0 +1,375 @@
+import argparse
+import csv
+import json
+import math
+import mmap
+import os
+import struct
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+from detection import (DetectionEngine, DETECT_WINDOW_SECONDS, DETECT_WINDOW_SIZE, DETECT_MIN_COUNT,
+                       DETECT_MIN_RATIO, DETECT_MIN_RATE, RED_HOLD, BLOCK_TTL)
+from pcapstream import PCAP_MAGICS, GLOBAL_HEADER_LEN, RECORD_HEADER_LEN
+from rtf import extract_rows, rows_to_array, capture_times, EXTRACT_WORKERS
+from rtc import FEATURES, SCALER_MODE, SCALER_STATS, STATE_FILE
+from rtp import MODEL_PATH, load_model
+from scaling import RunningScaler
+
+# Offline forensic replay: scores an existing capture as fast as the machine allows, with the
+# same fields (rtf.py), scaling (rtc.py) and model (rtp.py) as the live pipeline. The pcap is
+# cut into chunks on packet boundaries, each chunk is dissected by its own tshark on a process
+# pool (which also turns rows into feature arrays), and the main process scales and scores the
+# chunks in capture order in large batches while the pool works ahead. Results are written as
+# per-source and per-time-bucket summaries; the live pipeline's files and blocklist are left alone.
+# Sources are flagged the way the live monitor would flag them: the decisions go through
+# main.py's DetectionEngine settings on capture time (see Detections).
+#
+#   python replay.py capture.pcap
+#   python replay.py capture.pcap --bucket 10 --scaler state --out logs/replay
+#   python replay.py capture.pcap --backend keras --predictions     # also one row per packet
+#
+# tshark dissector state does not cross chunk boundaries, so fields such as
+# tcp.analysis.initial_rtt can be missing for connections split across two chunks.
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+OUTPUT_DIR = os.path.join(BASE_DIR, 'logs/replay')
+CHUNK_BYTES = 16 * 1024 * 1024
+BATCH_SIZE = 65536
+
+
+def pcap_chunks(path, chunk_bytes):
+    # [(start, end)] byte ranges of whole records, each at most chunk_bytes (or one record).
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        header = bytes(buf[:GLOBAL_HEADER_LEN])
+        if header[:4] not in PCAP_MAGICS:
+            raise ValueError(f"{path} is not a libpcap capture (pcapng is not supported; convert with editcap -F pcap)")
+        fmt = PCAP_MAGICS[header[:4]] + 'I'
+        ranges = []
+        start = pos = GLOBAL_HEADER_LEN
+        end = len(buf)
+        while pos + RECORD_HEADER_LEN <= end:
+            nxt = pos + RECORD_HEADER_LEN + struct.unpack_from(fmt, buf, pos + 8)[0]
+            if nxt > end:
+                print(f"[REPLAY] {path} ends with a truncated record; ignoring its last {end - pos} bytes")
+                break
+            if nxt - start > chunk_bytes and pos > start:
+                ranges.append((start, pos))
+                start = pos
+            pos = nxt
+        if pos > start:
+            ranges.append((start, pos))
+    return header, ranges
+
+
+def extract_chunk(path, header, start, end):
+    # Pool worker: returns (source IPs, unscaled features, capture times) for one chunk.
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    rows = extract_rows(header + data)
+    return [row[0] for row in rows], rows_to_array(rows), np.array(capture_times(rows), dtype=np.float64)
+
+
+def load_scaler(mode):
+    # welford: fresh online statistics, as a newly started rtc.py would build them.
+    # frozen: training-time statistics from IDS_SCALER_STATS.
+    # state: the statistics the gateway is using right now (rtc.py's saved state), held fixed.
+    if mode == 'frozen':
+        if not os.path.exists(SCALER_STATS):
+            raise SystemExit(f"[REPLAY] {SCALER_STATS} not found")
+        scaler = RunningScaler.load(SCALER_STATS, len(FEATURES))
+    elif mode == 'state':
+        try:
+            with open(STATE_FILE) as f:
+                scaler = RunningScaler.from_dict(json.load(f)['scaler'])
+        except (FileNotFoundError, ValueError, KeyError):
+            raise SystemExit(f"[REPLAY] No scaler state in {STATE_FILE}; run the pipeline first or use --scaler welford")
+    else:
+        return RunningScaler(len(FEATURES), 'welford')
+    scaler.mode = 'frozen'
+    return scaler
+
+
+class Detections:
+    # The attack monitor of main.py replayed on capture time: same DetectionEngine settings, a
+    # flagged source is blocked RED_HOLD seconds later, and its packets are then ignored while
+    # the block lasts (IDS_BLOCK_TTL, 0 = for good), as rtp.py drops blocked sources.
+    def __init__(self):
+        self.engine = DetectionEngine(
+            window_seconds=DETECT_WINDOW_SECONDS, window_size=DETECT_WINDOW_SIZE,
+            min_count=DETECT_MIN_COUNT, min_ratio=DETECT_MIN_RATIO, min_rate=DETECT_MIN_RATE)
+        self.pending = {}  # ip -> (flagged at, malicious, count in window)
+        self.blocked_until = {}
+        self.events = []  # (ip, flagged at, blocked at, malicious, count)
+        self.ignored = 0  # packets from blocked sources
+        self.now = 0.0
+        self.last_evict = 0.0
+
+    def add(self, src_ips, ts, malicious):
+        engine = self.engine
+        for ip, t, mal in zip(src_ips, ts.tolist(), malicious.tolist()):
+            now = self.now = max(self.now, t)  # packets without a capture time keep the clock
+            if self.pending:
+                self._block_due(now)
+            if ip in self.blocked_until:
+                if now < self.blocked_until[ip]:
+                    self.ignored += 1
+                    continue
+                del self.blocked_until[ip]
+            if engine.update(ip, mal, now):
+                s = engine.stats(ip)
+                self.pending.setdefault(ip, (now, s['malicious'], s['count']))
+            if now - self.last_evict >= 10:
+                engine.evict_idle(now)
+                self.last_evict = now
+
+    def _block_due(self, now):
+        for ip, (flagged, mal, count) in list(self.pending.items()):
+            if now - flagged >= RED_HOLD:
+                self._block(ip, flagged, mal, count)
+
+    def _block(self, ip, flagged, mal, count):
+        blocked = flagged + RED_HOLD
+        self.events.append((ip, flagged, blocked, mal, count))
+        self.blocked_until[ip] = blocked + BLOCK_TTL if BLOCK_TTL else math.inf
+        self.engine.forget(ip, exclude=False)
+        del self.pending[ip]
+
+    def finish(self):
+        # Sources flagged within RED_HOLD of the end would still have been blocked.
+        for ip, (flagged, mal, count) in list(self.pending.items()):
+            self._block(ip, flagged, mal, count)
+        self.events.sort(key=lambda e: e[1])
+
+    def write(self, out_dir):
+        path = os.path.join(out_dir, 'detections.csv')
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['src_ip', 'flagged_at', 'blocked_at', 'window_malicious', 'window_count'])
+            for ip, flagged, blocked, mal, count in self.events:
+                writer.writerow([ip, '%.6f' % flagged, '%.6f' % blocked, mal, count])
+        return path
+
+
+class Summary:
+    # Per-source and per-time-bucket counts, accumulated with one np.unique per chunk.
+    def __init__(self, bucket_seconds):
+        self.bucket_seconds = bucket_seconds
+        self.ip_index = {}
+        self.ips = []
+        self.ip_classes = None  # [source, class] -> packets
+        self.first_seen = np.zeros(0)
+        self.last_seen = np.zeros(0)
+        self.bucket_index = {}
+        self.buckets = []
+        self.bucket_classes = None  # [bucket, class] -> packets
+        self.bucket_sources = []  # per bucket: set of source indices
+        self.bucket_malicious = []  # per bucket: source index -> malicious packets
+        self.packets = 0
+
+    def _lookup(self, index, names, values):
+        uniq, inverse = np.unique(values, return_inverse=True)
+        for v in uniq.tolist():
+            if v not in index:
+                index[v] = len(names)
+                names.append(v)
+        ids = np.array([index[v] for v in uniq.tolist()], dtype=np.int64)
+        return ids[inverse.ravel()]
+
+    def _grow(self, table, rows, n_classes):
+        if table is None:
+            table = np.zeros((0, n_classes), dtype=np.int64)
+        if rows > len(table):
+            table = np.concatenate([table, np.zeros((max(rows, 2 * len(table)) - len(table), n_classes), np.int64)])
+        return table
+
+    def add(self, src_ips, ts, classes, n_classes):
+        if not len(classes):
+            return
+        self.packets += len(classes)
+        src = self._lookup(self.ip_index, self.ips, np.array(src_ips))
+        self.ip_classes = self._grow(self.ip_classes, len(self.ips), n_classes)
+        if len(self.ips) > len(self.first_seen):
+            grow = len(self.ip_classes) - len(self.first_seen)
+            self.first_seen = np.concatenate([self.first_seen, np.full(grow, np.inf)])
+            self.last_seen = np.concatenate([self.last_seen, np.full(grow, -np.inf)])
+        np.add.at(self.ip_classes, (src, classes), 1)
+        np.minimum.at(self.first_seen, src, ts)
+        np.maximum.at(self.last_seen, src, ts)
+
+        bucket = self._lookup(self.bucket_index, self.buckets,
+                              np.floor(ts / self.bucket_seconds).astype(np.int64))
+        self.bucket_classes = self._grow(self.bucket_classes, len(self.buckets), n_classes)
+        while len(self.bucket_sources) < len(self.buckets):
+            self.bucket_sources.append(set())
+            self.bucket_malicious.append({})
+        for b, s in np.unique(np.stack([bucket, src]), axis=1).T.tolist():
+            self.bucket_sources[b].add(s)
+        flagged = classes != 0
+        if not flagged.any():
+            np.add.at(self.bucket_classes, (bucket, classes), 1)
+            return
+        pairs, counts = np.unique(np.stack([bucket[flagged], src[flagged]]), axis=1, return_counts=True)
+        for (b, s), c in zip(pairs.T.tolist(), counts.tolist()):
+            self.bucket_malicious[b][s] = self.bucket_malicious[b].get(s, 0) + c
+        np.add.at(self.bucket_classes, (bucket, classes), 1)
+
+    def write(self, out_dir, detections):
+        flagged_at = {}
+        flags_per_bucket = {}
+        for ip, flagged, _, _, _ in detections.events:
+            flagged_at.setdefault(ip, flagged)
+            b = int(math.floor(flagged / self.bucket_seconds))
+            flags_per_bucket[b] = flags_per_bucket.get(b, 0) + 1
+        n = len(self.ips)
+        counts = self.ip_classes[:n] if n else np.zeros((0, 1), np.int64)
+        malicious = counts[:, 1:].sum(axis=1)
+        ip_path = os.path.join(out_dir, 'sources.csv')
+        with open(ip_path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['src_ip', 'packets', 'malicious', 'malicious_ratio', 'top_attack_class',
+                             'first_seen', 'last_seen', 'first_flagged'] + [f'class_{c}' for c in range(counts.shape[1])])
+            for i in np.argsort(-malicious, kind='stable').tolist():
+                total = int(counts[i].sum())
+                top = int(np.argmax(counts[i, 1:])) + 1 if malicious[i] else ''
+                flagged = flagged_at.get(self.ips[i])
+                writer.writerow([self.ips[i], total, int(malicious[i]), '%.4f' % (malicious[i] / total), top,
+                                 '%.6f' % self.first_seen[i], '%.6f' % self.last_seen[i],
+                                 '' if flagged is None else '%.6f' % flagged] + counts[i].tolist())
+
+        bucket_path = os.path.join(out_dir, 'buckets.csv')
+        with open(bucket_path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['bucket_start', 'packets', 'malicious', 'sources', 'malicious_sources',
+                             'top_malicious_source', 'flagged_sources'] + [f'class_{c}' for c in range(counts.shape[1])])
+            for b in np.argsort(self.buckets, kind='stable').tolist():
+                row = self.bucket_classes[b]
+                malicious_sources = self.bucket_malicious[b]
+                top = self.ips[max(malicious_sources, key=malicious_sources.get)] if malicious_sources else ''
+                writer.writerow(['%.0f' % (self.buckets[b] * self.bucket_seconds), int(row.sum()),
+                                 int(row[1:].sum()), len(self.bucket_sources[b]), len(malicious_sources), top,
+                                 flags_per_bucket.get(self.buckets[b], 0)] + row.tolist())
+        return ip_path, bucket_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Score an existing pcap offline with the IDS model')
+    parser.add_argument('pcap')
+    parser.add_argument('--model', default=MODEL_PATH)
+    parser.add_argument('--backend', default='numpy', help='keras, numpy, int8 or float16 (as IDS_MODEL_BACKEND)')
+    parser.add_argument('--scaler', choices=('welford', 'frozen', 'state'), default=SCALER_MODE)
+    parser.add_argument('--workers', type=int, default=EXTRACT_WORKERS, help='tshark processes')
+    parser.add_argument('--chunk-mb', type=float, default=CHUNK_BYTES / 2 ** 20)
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--bucket', type=float, default=60.0, help='seconds per time bucket')
+    parser.add_argument('--no-cache', action='store_true', help='score every row, even repeated feature vectors')
+    parser.add_argument('--predictions', action='store_true', help='also write predictions.csv, one row per packet')
+    parser.add_argument('--out', default=OUTPUT_DIR)
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    header, ranges = pcap_chunks(args.pcap, int(args.chunk_mb * 2 ** 20))
+    size = os.path.getsize(args.pcap)
+    print(f"[REPLAY] {args.pcap}: {size / 2 ** 20:.1f} MiB in {len(ranges)} chunks, {args.workers} extraction workers")
+
+    # The pool forks before the model is loaded, so workers stay small.
+    with ProcessPoolExecutor(args.workers) as pool:
+        pending = []
+        it = iter(ranges)
+
+        def refill():
+            # Keeps the workers busy without reading the whole capture into memory.
+            for start, end in it:
+                pending.append(pool.submit(extract_chunk, args.pcap, header, start, end))
+                if len(pending) >= 2 * args.workers:
+                    break
+        refill()
+
+        model = load_model(args.model, args.backend)
+        if not args.no_cache:
+            from predcache import PredictionCache, CachedModel
+            model = CachedModel(model, PredictionCache())
+        scaler = load_scaler(args.scaler)
+        summary = Summary(args.bucket)
+        detections = Detections()
+        os.makedirs(args.out, exist_ok=True)
+        pred_file = open(os.path.join(args.out, 'predictions.csv'), 'w', newline='') if args.predictions else None
+        if pred_file:
+            pred_writer = csv.writer(pred_file)
+            pred_writer.writerow(['frame.time_epoch', 'ip.src', 'class', 'malicious'])
+        t_start = None
+        t_end = None
+        score_s = 0.0
+        done = 0
+
+        while pending:
+            src_ips, X, ts = pending.pop(0).result()
+            refill()
+            done += 1
+            if not len(X):
+                continue
+            t = time.perf_counter()
+            scaler.partial_fit(X)
+            X_scaled = scaler.transform(X)
+            preds = np.asarray(model.predict(X_scaled, batch_size=args.batch_size, verbose=0))
+            classes = preds.argmax(axis=1)
+            score_s += time.perf_counter() - t
+            summary.add(src_ips, ts, classes, preds.shape[1])
+            detections.add(src_ips, ts, classes != 0)
+            stamped = ts[ts > 0]
+            if len(stamped):
+                t_start = stamped.min() if t_start is None else min(t_start, stamped.min())
+                t_end = stamped.max() if t_end is None else max(t_end, stamped.max())
+            if pred_file:
+                pred_writer.writerows(zip(('%.6f' % v for v in ts.tolist()), src_ips, classes.tolist(),
+                                          (classes != 0).astype(int).tolist()))
+            if done % 10 == 0 or not pending:
+                rate = summary.packets / (time.perf_counter() - t0)
+                print(f"[REPLAY] {done}/{len(ranges)} chunks, {summary.packets} packets ({rate:,.0f} packets/s)")
+        if pred_file:
+            pred_file.close()
+
+    detections.finish()
+    wall_s = time.perf_counter() - t0
+    ip_path, bucket_path = summary.write(args.out, detections)
+    detections_path = detections.write(args.out)
+    capture_s = (t_end - t_start) if t_start is not None else 0.0
+    flagged = len({e[0] for e in detections.events})
+    with_malicious = sum(1 for i in range(len(summary.ips)) if summary.ip_classes[i, 1:].any())
+    result = {
+        "pcap": os.path.abspath(args.pcap),
+        "model": os.path.abspath(args.model),
+        "backend": args.backend,
+        "scaler": args.scaler,
+        "packets": summary.packets,
+        "sources": len(summary.ips),
+        "flagged_sources": flagged,
+        "blocks": len(detections.events),
+        "sources_with_malicious_packets": with_malicious,
+        "packets_from_blocked_sources": detections.ignored,
+        "detection": {"window_seconds": DETECT_WINDOW_SECONDS, "window_size": DETECT_WINDOW_SIZE,
+                      "min_count": DETECT_MIN_COUNT, "min_ratio": DETECT_MIN_RATIO,
+                      "min_rate": DETECT_MIN_RATE, "red_hold": RED_HOLD, "block_ttl": BLOCK_TTL},
+        "malicious_packets": int(summary.ip_classes[:len(summary.ips), 1:].sum()) if summary.ips else 0,
+        "capture_seconds": capture_s,
+        "wall_seconds": wall_s,
+        "score_seconds": score_s,
+        "packets_per_second": summary.packets / wall_s if wall_s else 0.0,
+        "realtime_factor": capture_s / wall_s if wall_s else 0.0,
+    }
+    if not args.no_cache:
+        result["cache"] = model.cache.stats()
+    with open(os.path.join(args.out, 'summary.json'), 'w') as f:
+        json.dump(result, f, indent=2)
+
+    print(f"[REPLAY] {result['packets']} packets from {result['sources']} sources in {wall_s:.1f}s "
+          f"({result['packets_per_second']:,.0f} packets/s, {result['realtime_factor']:.0f}x real time)")
+    print(f"[REPLAY] {result['malicious_packets']} malicious packets from {with_malicious} sources; "
+          f"{flagged} sources flagged by the live detection settings")
+    print(f"[REPLAY] Wrote {ip_path}, {bucket_path}, {detections_path} and summary.json")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,48 +1,184 @@
-import pandas as pd
 import numpy as np
 import time
 import os
-from sklearn.preprocessing import StandardScaler
+import csv
+import json
+import metrics
+from rtf import fields, to_float, STAMP_COLUMNS
+from scaling import RunningScaler
+from tailing import FileTail
 
 INPUT_CSV = 'logs/network_features.csv'
 OUTPUT_CSV = 'logs/network_features_preprocessed.csv'
+STATE_FILE = 'logs/preprocess_state.json'
+# "welford": running mean/variance updated online and persisted in STATE_FILE.
+# "frozen": training-time mean/var read from SCALER_STATS and never updated; the file is not
+# shipped, so frozen mode refuses to start without it rather than quietly scaling online.
+SCALER_MODE = os.environ.get('IDS_SCALER_MODE', 'welford')
+SCALER_STATS = os.environ.get('IDS_SCALER_STATS', 'scaler_stats.json')
+TRANSPORT = os.environ.get('IDS_TRANSPORT', 'file')
+FEATURES = fields[1:]
+# Columns passed through from rtf.py (a flow's packet count with IDS_FLOWS=1, and timestamps,
+# ts.extract last), plus the time this stage wrote the row.
+PASSTHROUGH = ['flow.packets'] + STAMP_COLUMNS
+STAMPS = PASSTHROUGH + ['ts.preprocess']
+MAX_CHUNK_BYTES = 1024 * 1024
+POLL_INTERVAL = 0.1
+STATE_SAVE_INTERVAL = 1.0
+REPORT_INTERVAL = 5.0
 
-last_row = 0
 
-print("[PREPROCESS] Waiting for network_features.csv to be created and filled...")
-while not (os.path.exists(INPUT_CSV) and os.path.getsize(INPUT_CSV) > 0):
-    time.sleep(1)
+def parse_lines(lines, header):
+    columns = next(csv.reader([header]))
+    src_col = columns.index('ip.src') if 'ip.src' in columns else 0
+    feature_cols = [columns.index(name) if name in columns else None for name in FEATURES]
+    stamp_cols = [columns.index(name) if name in columns else None for name in PASSTHROUGH]
+    src_ips = []
+    X = np.zeros((len(lines), len(FEATURES)), dtype=np.float64)
+    stamps = []
+    n = 0
+    for row in csv.reader(lines):
+        if not row:
+            continue
+        src_ips.append(row[src_col] if src_col < len(row) else '')
+        X[n] = [to_float(row[c]) if c is not None and c < len(row) else 0.0 for c in feature_cols]
+        stamps.append([row[c] if c is not None and c < len(row) else '' for c in stamp_cols])
+        n += 1
+    return src_ips, X[:n], stamps
+
+
+def write_rows(src_ips, X_scaled, stamps):
+    write_header = not os.path.exists(OUTPUT_CSV) or os.path.getsize(OUTPUT_CSV) == 0
+    preprocessed = '%.6f' % time.time()
+    with open(OUTPUT_CSV, 'a', newline='') as f:
+        writer = csv.writer(f)
+        if write_header:
+            writer.writerow(['ip.src'] + FEATURES + STAMPS)
+        writer.writerows([ip] + ['%.6g' % v for v in row] + stamp + [preprocessed]
+                         for ip, row, stamp in zip(src_ips, X_scaled.tolist(), stamps))
+
+
+def stage_metrics(queue_depth):
+    m = metrics.registry('preprocess')
+    last_input = [0.0]
+    m.gauge('ids_seconds_since_input', 'Seconds since the stage last received input', fn=metrics.since(last_input))
+    m.gauge('ids_queue_depth', 'Input waiting for the stage (bytes of CSV or ring records)', fn=queue_depth)
+    m.start_exporter()
+    return (m.counter('ids_rows_total', 'Records emitted by the stage'),
+            m.histogram('ids_batch_size', 'Records per emitted batch', buckets=metrics.SIZE_BUCKETS),
+            m.histogram('ids_stage_latency_seconds', 'Delay between pipeline timestamps', span='extract_to_preprocess'),
+            last_input)
+
+
+def load_state():
+    state = {}
+    if os.path.exists(STATE_FILE):
+        with open(STATE_FILE) as f:
+            state = json.load(f)
+    if SCALER_MODE == 'frozen':
+        if not os.path.exists(SCALER_STATS):
+            raise SystemExit(f"[PREPROCESS] IDS_SCALER_MODE=frozen but {SCALER_STATS} does not exist. Provide the "
+                             f"training-time statistics as JSON ({{\"mean\": [...], \"var\": [...]}}, "
+                             f"{len(FEATURES)} features) or use IDS_SCALER_MODE=welford.")
+        scaler = RunningScaler.load(SCALER_STATS, len(FEATURES))
+        scaler.mode = 'frozen'
+        return state, scaler
+    if state.get('scaler', {}).get('mode') == 'welford':
+        return state, RunningScaler.from_dict(state['scaler'])
+    return state, RunningScaler(len(FEATURES), 'welford')
 
-while True:
-    try:
-        df = pd.read_csv(INPUT_CSV, on_bad_lines='skip')  # pandas >=1.3
-    except Exception as e:
-        print(f"[PREPROCESS] Error reading {INPUT_CSV}: {e}")
-        time.sleep(1)
-        continue
 
-    if len(df) > last_row:
-        new_rows = df.iloc[last_row:]
-        new_rows = new_rows.fillna(0)
+def save_state(tail, scaler):
+    tmp = STATE_FILE + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump({'input': tail.state() if tail else None, 'scaler': scaler.to_dict()}, f)
+    os.replace(tmp, STATE_FILE)
+
+
+def run_shm(scaler):
+    # Zero-copy path: scale records from the features ring straight into slots of the scaled ring.
+    from shmring import ShmRing, FEATURES_RING, SCALED_RING
+    src = ShmRing.attach(FEATURES_RING, timeout=30)
+    dst = ShmRing.attach(SCALED_RING, timeout=30)
+    print(f"[PREPROCESS] Reading from shared-memory ring {FEATURES_RING}")
+    rows_total, batch_sizes, latency, last_input = stage_metrics(lambda: len(src))
+    dirty = False
+    last_save = 0.0
+    while True:
+        views = src.read(timeout=STATE_SAVE_INTERVAL)
+        if views is None:
+            if dirty:
+                save_state(None, scaler)
+                dirty = False
+            continue
+        X, src_ip, weight, ts = views
+        now = time.time()
+        last_input[0] = now
+        latency.observe_many(now - ts)
+        scaler.partial_fit(X)
+        done = 0
+        while done < len(X):
+            feats, out_ip, out_weight, out_ts = dst.reserve(len(X) - done)
+            n = len(feats)
+            scaler.transform(X[done:done + n], out=feats)
+            out_ip[:] = src_ip[done:done + n]
+            out_weight[:] = weight[done:done + n]
+            out_ts[:] = ts[done:done + n]
+            dst.commit(n)
+            done += n
+        src.release(len(X))
+        rows_total.inc(len(X))
+        batch_sizes.observe(len(X))
+        dirty = True
+        if now - last_save >= STATE_SAVE_INTERVAL:
+            save_state(None, scaler)
+            last_save = now
+            dirty = False
+
+
+def main():
+    state, scaler = load_state()
+    print(f"[PREPROCESS] Scaling mode: {scaler.mode} ({scaler.count} rows of statistics)")
+    if TRANSPORT == 'shm':
+        run_shm(scaler)
+        return
+
+    # Metrics are exported while waiting too, so the supervisor sees a live stage on a quiet network.
+    tail = None
+    rows_total, batch_sizes, latency, last_input = stage_metrics(
+        lambda: max(0, os.path.getsize(INPUT_CSV) - tail.offset) if tail is not None and os.path.exists(INPUT_CSV) else 0)
+    print("[PREPROCESS] Waiting for network_features.csv to be created and filled...")
+    while not (os.path.exists(INPUT_CSV) and os.path.getsize(INPUT_CSV) > 0):
+        time.sleep(1)
 
-        numeric_cols = new_rows.select_dtypes(include=[np.number]).columns
-        non_numeric_cols = [col for col in new_rows.columns if col not in numeric_cols]
+    tail = FileTail.from_state(INPUT_CSV, state.get('input'), header=True)
+    last_report = time.monotonic()
+    appended = 0
 
-        scaler = StandardScaler()
-        scaled_numeric = scaler.fit_transform(new_rows[numeric_cols])
+    while True:
+        if appended and time.monotonic() - last_report >= REPORT_INTERVAL:
+            print(f"[PREPROCESS] Appended {appended} rows to {OUTPUT_CSV} in the last "
+                  f"{time.monotonic() - last_report:.0f}s")
+            appended = 0
+            last_report = time.monotonic()
+        lines = tail.read_lines(MAX_CHUNK_BYTES)
+        if not lines:
+            time.sleep(POLL_INTERVAL)
+            continue
 
-        new_rows_scaled = pd.concat(
-            [new_rows[non_numeric_cols].reset_index(drop=True),
-             pd.DataFrame(scaled_numeric, columns=numeric_cols)],
-            axis=1
-        )
-        new_rows_scaled = new_rows_scaled.fillna(0)
+        now = time.time()
+        last_input[0] = now
+        src_ips, X, stamps = parse_lines(lines, tail.header)
+        if len(X):
+            scaler.partial_fit(X)
+            write_rows(src_ips, scaler.transform(X), stamps)
+            appended += len(X)
+            rows_total.inc(len(X))
+            batch_sizes.observe(len(X))
+            latency.observe_many([now - to_float(s[-1]) for s in stamps if s[-1]])
+        # Checkpoint right after the rows are written, so a restart does not append them again.
+        save_state(tail, scaler)
 
-        if os.path.exists(OUTPUT_CSV) and os.path.getsize(OUTPUT_CSV) > 0:
-            new_rows_scaled.to_csv(OUTPUT_CSV, mode='a', header=False, index=False)
-        else:
-            new_rows_scaled.to_csv(OUTPUT_CSV, mode='w', header=True, index=False)
-        print(f"[PREPROCESS] Appended {len(new_rows_scaled)} new rows to {OUTPUT_CSV}")
 
-        last_row = len(df)
-    time.sleep(1)
+if __name__ == "__main__":
+    main()
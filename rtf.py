@@ -1,7 +1,15 @@
 import subprocess
+import threading
+import queue
 import time
 import os
 import csv
+import collections
+import numpy as np
+import metrics
+from flows import FlowTable, FLOW_COLUMNS
+from pcapstream import PcapTail, GLOBAL_HEADER_LEN
+from segments import SEGMENT_DIR, completed_segments, load_segment_state, save_segment_state
 
 fields = [
     'ip.src',  # Must be first for logging
@@ -11,40 +19,391 @@ fields = [
     'tcp.flags.urg', 'tcp.urgent_pointer', 'ip.frag_offset', 'eth.dst.ig', 'eth.src.ig', 'eth.src.lg',
     'eth.src_not_group', 'arp.isannouncement'
 ]
+# Extra columns after the model fields: when the packet was captured and when it was extracted.
+# rtc.py appends ts.preprocess; rtp.py uses them for per-stage latency metrics.
+STAMP_FIELDS = ['frame.time_epoch']
+STAMP_COLUMNS = STAMP_FIELDS + ['ts.extract']
+# Flow key and size, used to aggregate packets into flows with IDS_FLOWS=1.
+FLOW_FIELDS = ['ip.dst', 'ip.proto', 'tcp.srcport', 'tcp.dstport', 'udp.srcport', 'udp.dstport', 'frame.len']
+EXTRA_FIELDS = STAMP_FIELDS + FLOW_FIELDS
+ROW_WIDTH = len(fields) + len(EXTRA_FIELDS)
+PACKET_COLUMNS = fields + EXTRA_FIELDS + ['ts.extract']
+FLOW_KEY_COLUMNS = ['ip.dst', 'ip.proto', 'flow.sport', 'flow.dport']
+FLOW_RECORD_COLUMNS = fields + STAMP_FIELDS + FLOW_KEY_COLUMNS + FLOW_COLUMNS + ['ts.extract']
 
 pcap_file = "logs/esp32_traffic.pcap"
 output_csv = "logs/network_features.csv"
+state_file = "logs/network_features.state"
+# "file": append rows to output_csv; "shm": write float records into the shared-memory ring.
+TRANSPORT = os.environ.get('IDS_TRANSPORT', 'file')
+FLOWS = os.environ.get('IDS_FLOWS', '0') == '1'
+FLOW_WINDOW = float(os.environ.get('IDS_FLOW_WINDOW', '1.0'))  # seconds per flow record
+FLOW_IDLE_TIMEOUT = float(os.environ.get('IDS_FLOW_IDLE_TIMEOUT', '30'))
+# Capture segments written by main.py with IDS_CAPTURE_SEGMENTS=1, dissected by a process pool.
+SEGMENTS = os.environ.get('IDS_CAPTURE_SEGMENTS', '0') == '1'
+EXTRACT_WORKERS = int(os.environ.get('IDS_EXTRACT_WORKERS', '0')) or os.cpu_count() or 1
+SEGMENT_POLL_INTERVAL = 0.02
+MAX_CHUNK_BYTES = 8 * 1024 * 1024
+POLL_INTERVAL = 0.25 if TRANSPORT == 'file' else 0.005
 
-while not os.path.exists(pcap_file) or os.path.getsize(pcap_file) == 0:
-    print("[FEATURES] Waiting for esp32_traffic.pcap to be created and filled...")
-    time.sleep(1)
+_value_cache = {}
 
-while True:
-    cmd = [
-        "tshark", "-r", pcap_file, "-T", "fields"
-    ]
-    for field in fields:
+
+def to_float(value):
+    # tshark prints booleans as True/False (or 1/0), some fields in hex, and repeated
+    # fields as "a,b". Empty means the field is absent, which training treated as 0.
+    try:
+        return _value_cache[value]
+    except KeyError:
+        pass
+    v = value.split(',', 1)[0].strip()
+    if v in ('', 'False'):
+        parsed = 0.0
+    elif v == 'True':
+        parsed = 1.0
+    else:
+        try:
+            parsed = float(int(v, 16)) if v.startswith('0x') else float(v)
+        except ValueError:
+            parsed = 0.0
+        if parsed != parsed:
+            parsed = 0.0
+    if len(_value_cache) < 65536:
+        _value_cache[value] = parsed
+    return parsed
+
+
+def rows_to_array(rows):
+    X = np.zeros((len(rows), len(fields) - 1), dtype=np.float32)
+    for i, row in enumerate(rows):
+        X[i] = [to_float(v) for v in row[1:len(fields)]]
+    return X
+
+
+def tshark_cmd(source="-"):
+    cmd = ["tshark", "-r", source, "-T", "fields"]
+    for field in fields + EXTRA_FIELDS:
         cmd += ["-e", field]
-    cmd += ["-E", "header=y", "-E", "separator=,", "-E", "quote=d"]
+    cmd += ["-E", "header=n", "-E", "separator=,", "-E", "quote=d"]
+    return cmd
 
-    result = subprocess.run(cmd, stdout=subprocess.PIPE, text=True)
-    lines = result.stdout.strip().split('\n')
-    if not lines or len(lines) < 2:
-        print("[FEATURES] No data yet.")
-        time.sleep(1)
-        continue
 
-    tmp_output_csv = output_csv + ".tmp"
-    with open(tmp_output_csv, "w", newline='') as f:
+def _fix_row(row):
+    if len(row) < ROW_WIDTH:
+        row += [''] * (ROW_WIDTH - len(row))
+    return row[:ROW_WIDTH]
+
+
+def extract_rows(pcap_bytes):
+    # Dissect a self-contained pcap chunk fed on stdin; one row per packet.
+    result = subprocess.run(tshark_cmd(), input=pcap_bytes, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    return [_fix_row(row) for row in csv.reader(result.stdout.decode(errors="replace").splitlines()) if row]
+
+
+# One long-lived `tshark -l -r -` fed through a pipe. Avoids paying tshark's start-up for every
+# chunk and keeps dissector state (e.g. tcp.analysis.initial_rtt) across chunks.
+class TsharkStream:
+    def __init__(self, header):
+        self.proc = subprocess.Popen(["tshark", "-l"] + tshark_cmd()[1:], stdin=subprocess.PIPE,
+                                     stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        self.rows = queue.Queue()
+        self.fed = 0
+        self.parsed = 0
+        self.marks = collections.deque()  # (packets fed so far, capture position after them)
+        self.proc.stdin.write(header)
+        self.proc.stdin.flush()
+        self.reader = threading.Thread(target=self._reader, daemon=True)
+        self.reader.start()
+
+    def _reader(self):
+        for line in self.proc.stdout:
+            text = line.decode(errors="replace").rstrip("\r\n")
+            if text:
+                self.rows.put(_fix_row(next(csv.reader([text]))))
+
+    def feed(self, records, n_packets, mark=None):
+        self.proc.stdin.write(records)
+        self.proc.stdin.flush()
+        self.fed += n_packets
+        if mark is not None:
+            self.marks.append((self.fed, mark))
+
+    def parsed_mark(self):
+        # The latest mark whose packets have all come back from tshark (one row per packet),
+        # or None if no fed chunk has been fully parsed since the previous call.
+        mark = None
+        while self.marks and self.marks[0][0] <= self.parsed:
+            mark = self.marks.popleft()[1]
+        return mark
+
+    def drain(self, timeout=0.0):
+        rows = []
+        try:
+            rows.append(self.rows.get(timeout=timeout) if timeout else self.rows.get_nowait())
+            while True:
+                rows.append(self.rows.get_nowait())
+        except queue.Empty:
+            pass
+        self.parsed += len(rows)
+        return rows
+
+    @property
+    def backlog(self):
+        return self.fed - self.parsed
+
+    def close(self):
+        try:
+            self.proc.stdin.close()
+        except OSError:
+            pass
+        try:
+            self.proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+        self.reader.join(timeout=5)
+
+
+def capture_times(rows):
+    return [to_float(row[len(fields)]) if len(row) > len(fields) else 0.0 for row in rows]
+
+
+def append_rows(rows, path=output_csv, columns=PACKET_COLUMNS):
+    write_header = not os.path.exists(path) or os.path.getsize(path) == 0
+    extracted = '%.6f' % time.time()
+    with open(path, "a", newline='') as f:
         writer = csv.writer(f)
-        header = lines[0].split(',')
-        writer.writerow(header)
-        for line in lines[1:]:
-            row = [x.strip('"') for x in line.split(',')]
-            if not row or len(row) < 1:
-                continue
-            writer.writerow(row)
-    os.replace(tmp_output_csv, output_csv)  # atomic move
-
-    print("[FEATURES] Extracted features to network_features.csv")
-    time.sleep(1)
+        if write_header:
+            writer.writerow(columns)
+        writer.writerows(row + [extracted] for row in rows)
+
+
+_col = {name: i for i, name in enumerate(fields + EXTRA_FIELDS)}
+
+
+def add_to_flows(table, rows):
+    # Feeds dissected packets into the flow table, keyed by (src, dst, proto, sport, dport).
+    X = rows_to_array(rows)
+    keys = [(r[0], r[_col['ip.dst']], r[_col['ip.proto']],
+             r[_col['tcp.srcport']] or r[_col['udp.srcport']], r[_col['tcp.dstport']] or r[_col['udp.dstport']])
+            for r in rows]
+    lengths = [to_float(r[_col['frame.len']]) for r in rows]
+    table.add(keys, X, capture_times(rows), lengths,
+              X[:, _col['tcp.flags.syn'] - 1], X[:, _col['tcp.flags.fin'] - 1])
+
+
+def flow_rows(keys, X, aggregates, last_ts):
+    # One CSV row per flow: source IP, mean model features, last packet time, key, aggregates.
+    return [[key[0]] + ['%.6g' % v for v in feats] + ['%.6f' % t] + list(key[1:]) + ['%.6g' % v for v in agg]
+            for key, feats, agg, t in zip(keys, X.tolist(), aggregates.tolist(), last_ts.tolist())]
+
+
+def make_sink():
+    # Returns (emit packet rows, emit flow records, description of the target).
+    if TRANSPORT == 'shm':
+        from shmring import ShmRing, FEATURES_RING, ip_to_u32
+        ring = ShmRing.attach(FEATURES_RING, timeout=30)
+
+        def emit(rows):
+            ring.write(rows_to_array(rows), np.array([ip_to_u32(r[0]) for r in rows], dtype=np.uint32))
+
+        def emit_flows(keys, X, aggregates, last_ts):
+            ring.write(X, np.array([ip_to_u32(k[0]) for k in keys], dtype=np.uint32),
+                       weight=aggregates[:, 0].astype(np.uint32))
+        return emit, emit_flows, "shared-memory ring " + FEATURES_RING
+
+    def emit_flows(keys, X, aggregates, last_ts):
+        append_rows(flow_rows(keys, X, aggregates, last_ts), columns=FLOW_RECORD_COLUMNS)
+    return append_rows, emit_flows, "network_features.csv"
+
+
+def check_output_columns(columns):
+    # Start a fresh CSV when the existing one was written in the other mode (packets vs flows).
+    if not os.path.exists(output_csv) or os.path.getsize(output_csv) == 0:
+        return
+    with open(output_csv, newline='') as f:
+        header = next(csv.reader(f), [])
+    if header != columns:
+        print(f"[FEATURES] {output_csv} has different columns, starting a new file.")
+        os.remove(output_csv)
+
+
+class Emitter:
+    # Sends dissected packets on to rtc.py, directly or through the flow table (IDS_FLOWS=1),
+    # and keeps the stage's metrics. Shared by the live-tail and segment modes.
+    def __init__(self, queue_depth):
+        if TRANSPORT == 'file':
+            check_output_columns(FLOW_RECORD_COLUMNS if FLOWS else PACKET_COLUMNS)
+        self.emit, self.emit_flows, self.target = make_sink()
+        self.table = FlowTable(len(fields) - 1, FLOW_WINDOW, FLOW_IDLE_TIMEOUT) if FLOWS else None
+        if FLOWS:
+            print(f"[FEATURES] Aggregating packets into flows ({FLOW_WINDOW:g}s windows)")
+        self.last_rows = time.time()
+        self.last_evict = time.monotonic()
+        self.emitted = 0
+        self.last_report = time.monotonic()
+
+        m = self.metrics = metrics.registry('extract')
+        self.rows_total = m.counter('ids_rows_total', 'Records emitted by the stage')
+        self.batch_sizes = m.histogram('ids_batch_size', 'Records per emitted batch', buckets=metrics.SIZE_BUCKETS)
+        self.capture_latency = m.histogram('ids_stage_latency_seconds', 'Delay between pipeline timestamps',
+                                           span='capture_to_extract')
+        self.packets_total = m.counter('ids_packets_total', 'Packets dissected')
+        self.last_input = [0.0]
+        m.gauge('ids_seconds_since_input', 'Seconds since the stage last received input',
+                fn=metrics.since(self.last_input))
+        m.gauge('ids_queue_depth', 'Input waiting inside the stage', fn=queue_depth)
+        if FLOWS:
+            m.gauge('ids_active_flows', 'Flows in the flow table', fn=lambda: len(self.table))
+        m.start_exporter()
+
+    def packets(self, rows):
+        if not rows:
+            return
+        self.packets_total.inc(len(rows))
+        self.last_rows = time.time()
+        if self.table is not None:
+            add_to_flows(self.table, rows)
+        else:
+            self.emit(rows)
+            self._count(len(rows), [self.last_rows - t for t in capture_times(rows) if t])
+
+    def tick(self, force=False):
+        if self.table is None:
+            return
+        # Windows close on capture time; while no packets arrive, let it advance with the clock.
+        keys, X, aggregates, last_ts = self.table.flush(
+            self.table.clock + max(0.0, time.time() - self.last_rows), force=force)
+        if keys:
+            self.emit_flows(keys, X, aggregates, last_ts)
+            self._count(len(keys), time.time() - last_ts[last_ts > 0])
+        if time.monotonic() - self.last_evict >= 10:
+            self.table.evict_idle()
+            self.last_evict = time.monotonic()
+
+    def _count(self, n, latencies):
+        self.emitted += n
+        self.rows_total.inc(n)
+        self.batch_sizes.observe(n)
+        self.capture_latency.observe_many(latencies)
+
+    def report(self, packets_read):
+        if self.emitted and time.monotonic() - self.last_report >= 1.0:
+            unit = "flow records" if self.table is not None else "rows"
+            print(f"[FEATURES] Appended {self.emitted} {unit} to {self.target} ({packets_read} packets read)")
+            self.emitted = 0
+            self.last_report = time.monotonic()
+
+
+def extract_file(path):
+    # Segment worker: one-shot tshark over a complete capture file.
+    result = subprocess.run(tshark_cmd(path), stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    return [_fix_row(row) for row in csv.reader(result.stdout.decode(errors="replace").splitlines()) if row]
+
+
+def run_segments():
+    # Completed capture segments (see segments.py) are dissected in parallel, one tshark per
+    # segment across a process pool, and emitted strictly in segment order, so rtc.py sees
+    # packets in capture order. Emitted segments are deleted, keeping disk use bounded.
+    from concurrent.futures import ProcessPoolExecutor
+    done_seq = load_segment_state()
+    if done_seq is None and os.path.exists(output_csv):
+        os.remove(output_csv)
+    next_seq = None if done_seq is None else done_seq + 1
+    pending = {}  # seq -> (path, future)
+    packets = 0
+    print(f"[FEATURES] Extracting capture segments from {SEGMENT_DIR}/ with {EXTRACT_WORKERS} workers")
+    # The pool forks before the metrics exporter thread exists.
+    with ProcessPoolExecutor(EXTRACT_WORKERS) as pool:
+        out = Emitter(lambda: len(pending))
+        out.metrics.gauge('ids_segments_done', 'Capture segments extracted', fn=lambda: next_seq or 0)
+        while True:
+            for seq, path in completed_segments(SEGMENT_DIR):
+                if done_seq is not None and seq <= done_seq:
+                    os.remove(path)  # emitted before a restart, deletion was interrupted
+                    continue
+                if seq in pending or len(pending) >= 2 * EXTRACT_WORKERS:
+                    continue
+                pending[seq] = (path, pool.submit(extract_file, path))
+                out.last_input[0] = time.time()
+
+            progressed = False
+            while pending:
+                seq = min(pending)
+                path, future = pending[seq]
+                if not future.done():
+                    break
+                try:
+                    rows = future.result()
+                except Exception as e:
+                    print(f"[FEATURES] Extracting {path} failed: {e}")
+                    rows = []
+                if next_seq is not None and seq > next_seq:
+                    print(f"[FEATURES] Segments {next_seq}-{seq - 1} were dropped before extraction")
+                out.packets(rows)
+                packets += len(rows)
+                done_seq, next_seq = seq, seq + 1
+                save_segment_state(done_seq)
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                del pending[seq]
+                progressed = True
+
+            out.tick()
+            out.report(packets)
+            if not progressed:
+                time.sleep(SEGMENT_POLL_INTERVAL)
+
+
+def main():
+    if SEGMENTS:
+        run_segments()
+        return
+    # Metrics are exported while waiting too, so the supervisor sees a live stage on a quiet network.
+    stream = None
+    out = Emitter(lambda: stream.backlog if stream is not None else 0)
+    while not os.path.exists(pcap_file) or os.path.getsize(pcap_file) == 0:
+        print("[FEATURES] Waiting for esp32_traffic.pcap to be created and filled...")
+        time.sleep(1)
+
+    tail = PcapTail.from_state(pcap_file, state_file)
+    if tail.offset == 0 and os.path.exists(output_csv):
+        # No saved position: start a fresh output so rows line up with the capture again.
+        os.remove(output_csv)
+    out.metrics.gauge('ids_capture_bytes_read', 'Bytes of the capture consumed', fn=lambda: tail.offset)
+    resets = tail.resets
+
+    while True:
+        chunk, n_packets = tail.read_new(MAX_CHUNK_BYTES)
+        if n_packets:
+            if stream is not None and tail.resets != resets:
+                # New capture file: flush what the old dissector still holds, then restart it.
+                stream.close()
+                out.packets(stream.drain())
+                out.tick(force=True)
+                stream = None
+            resets = tail.resets
+            if stream is None:
+                stream = TsharkStream(chunk[:GLOBAL_HEADER_LEN])
+            stream.feed(chunk[GLOBAL_HEADER_LEN:], n_packets, (tail.offset, tail.packets))
+            out.last_input[0] = time.time()
+
+        rows = stream.drain(timeout=POLL_INTERVAL) if stream is not None else []
+        if rows:
+            out.packets(rows)
+            # Saved at the end of the last chunk tshark has fully returned, not the last one fed
+            # to it: after a crash, packets still inside tshark are read again (rows of a partly
+            # returned chunk may repeat, none are lost). Flows still open in the flow table
+            # (IDS_FLOWS=1) are not covered and restart from their next packet.
+            mark = stream.parsed_mark()
+            if mark is not None:
+                tail.save_state(state_file, mark)
+        elif stream is None:
+            time.sleep(POLL_INTERVAL)
+        out.tick()
+        out.report(tail.packets)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,70 +1,314 @@
-import pandas as pd
 import numpy as np
-import tensorflow as tf
 import time
 import os
+import csv
+import json
+import metrics
+from rtf import fields
+from batching import MicroBatcher
+from hotswap import ModelSwapper
+from predcache import CachedModel, PredictionCache
+from tailing import FileTail
 
-MODEL_PATH = 'dbn_iomt_ids.h5'
+MODEL_PATH = os.environ.get('IDS_MODEL_PATH', 'dbn_iomt_ids.h5')
+# "keras" loads the model with TensorFlow; "numpy" runs the same weights through npinfer
+# without importing TensorFlow at all; "int8"/"float16" run the TensorFlow Lite model that
+# quantize.py made from it (<model>.int8.tflite / <model>.float16.tflite).
+MODEL_BACKEND = os.environ.get('IDS_MODEL_BACKEND', 'keras')
+TRANSPORT = os.environ.get('IDS_TRANSPORT', 'file')
 CSV_PATH = 'logs/network_features_preprocessed.csv'
 LOG_PATH = 'logs/prediction_output.log'
 BLOCKED_IPS_FILE = 'logs/blocked_ips.txt'
+STATS_FILE = 'logs/predict_stats.json'
+# A row waits at most LATENCY_BUDGET seconds for a batch to fill; batches never exceed MAX_BATCH_SIZE.
+LATENCY_BUDGET = float(os.environ.get('IDS_LATENCY_BUDGET', '0.05'))
+MAX_BATCH_SIZE = int(os.environ.get('IDS_MAX_BATCH_SIZE', '1024'))
+MAX_CHUNK_BYTES = 1024 * 1024
+# Packet count (flows only) and timestamp columns added by rtf.py/rtc.py; missing in older
+# CSVs, where they read as 0.
+STAMP_NAMES = ['flow.packets', 'frame.time_epoch', 'ts.preprocess']
+POLL_INTERVAL = 0.01
+STATS_INTERVAL = 5.0
+# Model outputs of up to PREDICT_CACHE rows are kept by feature vector (0 disables the cache);
+# CACHE_DECIMALS rounds vectors before keying so near-identical rows share an entry.
+PREDICT_CACHE = int(os.environ.get('IDS_PREDICT_CACHE', '65536'))
+CACHE_DECIMALS = int(os.environ['IDS_CACHE_DECIMALS']) if os.environ.get('IDS_CACHE_DECIMALS') else None
+# Reload the model in the background when its file changes (see hotswap.py). A new model must
+# agree with the old one on at least SWAP_MIN_AGREEMENT of recent alert decisions (0 = no check).
+HOT_SWAP = os.environ.get('IDS_MODEL_HOT_SWAP', '1') == '1'
+SWAP_MIN_AGREEMENT = float(os.environ.get('IDS_SWAP_MIN_AGREEMENT', '0'))
+# "text": decisions go to LOG_PATH and the blocklist is read from BLOCKED_IPS_FILE.
+# "sqlite": decisions are inserted into the event store, which also holds the blocklist.
+EVENTS = os.environ.get('IDS_EVENTS', 'text')
+# Also print every decision to stdout (text events only). Off by default: at line rate that is
+# one console line per packet, which the supervisor would mostly have to drop.
+PRINT_DECISIONS = os.environ.get('IDS_PRINT_DECISIONS', '0') == '1'
+
+_blocked_cache = (None, set())
+_store = None
 
-last_row = 0
 
 def get_blocked_ips():
-    if not os.path.exists(BLOCKED_IPS_FILE):
+    global _blocked_cache
+    if _store is not None:
+        return _store.blocked_ips()
+    try:
+        mtime = os.stat(BLOCKED_IPS_FILE).st_mtime_ns
+    except FileNotFoundError:
         return set()
-    with open(BLOCKED_IPS_FILE, "r") as f:
-        return set(line.strip() for line in f if line.strip())
+    if mtime != _blocked_cache[0]:
+        with open(BLOCKED_IPS_FILE, "r") as f:
+            _blocked_cache = (mtime, set(line.strip() for line in f if line.strip()))
+    return _blocked_cache[1]
 
-model = tf.keras.models.load_model(MODEL_PATH)
-print("Model loaded.")
 
-with open(LOG_PATH, "a") as logf:
-    while True:
-        try:
-            df = pd.read_csv(CSV_PATH)
-        except (pd.errors.EmptyDataError, FileNotFoundError):
-            time.sleep(1)
+def load_model(path=MODEL_PATH, backend=MODEL_BACKEND):
+    if backend == 'numpy':
+        from npinfer import load_h5_model
+        return load_h5_model(path)
+    if backend == 'keras':
+        import tensorflow as tf
+        return tf.keras.models.load_model(path)
+    if backend in ('int8', 'float16'):
+        from tfliteinfer import TFLiteModel, quantized_path
+        return TFLiteModel(quantized_path(path, backend), max_batch=MAX_BATCH_SIZE)
+    raise ValueError(f"Unknown model backend: {backend}")
+
+
+def parse_rows(lines, header):
+    columns = next(csv.reader([header]))
+    feature_names = [name for name in fields[1:] if name in columns]
+    feature_cols = [columns.index(name) for name in feature_names] if feature_names else list(range(1, len(columns)))
+    stamp_cols = [columns.index(name) if name in columns else None for name in STAMP_NAMES]
+    src_ips = []
+    values = []
+    stamps = []
+    for row in csv.reader(lines):
+        if not row:
             continue
-        except Exception as e:
-            msg = f"[PREDICT] Error reading {CSV_PATH}: {e}"
-            print(msg)
-            logf.write(msg + "\n")
+        src_ips.append(row[0])
+        values.append([row[c] if c < len(row) else '' for c in feature_cols])
+        stamps.append(tuple(_to_float(row[c]) if c is not None and c < len(row) else 0.0 for c in stamp_cols))
+    try:
+        X = np.array(values, dtype=np.float32).reshape(len(values), len(feature_cols))
+    except ValueError:
+        X = np.array([[_to_float(v) for v in row] for row in values], dtype=np.float32).reshape(len(values), len(feature_cols))
+    return src_ips, np.nan_to_num(X, nan=0.0), stamps
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except ValueError:
+        return 0.0
+
+
+def score_batch(model, keys, X, blocked_ips):
+    # [(key, is_malicious)]; rows from blocked IPs are left out.
+    malicious = (np.argmax(model.predict(X, verbose=0), axis=1) != 0).tolist()
+    return [(key, mal) for key, mal in zip(keys, malicious) if key[1] not in blocked_ips]
+
+
+def decision_lines(decisions):
+    out = []
+    for key, mal in decisions:
+        row_number, src_ip, weight = key[0], key[1], key[2]
+        # A flow record stands for several packets; the monitor weighs it accordingly.
+        suffix = f" packets: {weight}" if weight > 1 else ""
+        if mal:
+            out.append(f"Row {row_number}: ALERT: Malicious traffic detected! src_ip: {src_ip}{suffix}")
+        else:
+            out.append(f"Row {row_number}: Normal traffic src_ip: {src_ip}{suffix}")
+    return out
+
+
+class StageMetrics:
+    # Keys are (row number, source IP, weight) and may carry (capture, preprocess) timestamps.
+    def __init__(self, queue_depth):
+        m = metrics.registry('predict')
+        self.rows = m.counter('ids_rows_total', 'Records emitted by the stage')
+        self.batch_sizes = m.histogram('ids_batch_size', 'Records per emitted batch', buckets=metrics.SIZE_BUCKETS)
+        self.wait = m.histogram('ids_batch_wait_seconds', 'Time the oldest row of a batch waited for it to fill')
+        self.run = m.histogram('ids_batch_run_seconds', 'Model time per batch')
+        self.latency = {span: m.histogram('ids_stage_latency_seconds', 'Delay between pipeline timestamps', span=span)
+                        for span in ('capture_to_predict', 'preprocess_to_predict', 'extract_to_predict')}
+        self.last_input = [0.0]
+        m.gauge('ids_seconds_since_input', 'Seconds since the stage last received input',
+                fn=metrics.since(self.last_input))
+        m.gauge('ids_queue_depth', 'Records waiting to be scored', fn=queue_depth)
+        m.start_exporter()
+
+    def record(self, keys, waited, run_time, span_stamps=()):
+        now = time.time()
+        self.rows.inc(len(keys))
+        self.batch_sizes.observe(len(keys))
+        self.wait.observe(waited)
+        self.run.observe(run_time)
+        for span, stamps in span_stamps:
+            self.latency[span].observe_many([now - t for t in stamps if t])
+
+
+def write_stats(batcher, model=None, swapper=None):
+    stats = batcher.stats()
+    if isinstance(model, CachedModel):
+        stats['cache'] = model.cache.stats()
+    if swapper is not None:
+        stats['model'] = swapper.stats()
+    tmp = STATS_FILE + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(stats, f)
+    os.replace(tmp, STATS_FILE)
+
+
+def with_cache(model):
+    cache = PredictionCache(PREDICT_CACHE, CACHE_DECIMALS, getattr(model, 'path', None) or MODEL_PATH)
+    m = metrics.registry('predict')
+    m.gauge('ids_cache_hit_ratio', 'Share of rows answered from the prediction cache',
+            fn=lambda: cache.stats()['hit_rate'])
+    m.gauge('ids_cache_entries', 'Feature vectors in the prediction cache', fn=lambda: len(cache.index))
+    m.gauge('ids_cache_evictions', 'Entries evicted from the prediction cache', fn=lambda: cache.evictions)
+    m.gauge('ids_cache_saved_seconds', 'Estimated model time saved by the cache',
+            fn=lambda: cache.stats()['saved_s'])
+    return CachedModel(model, cache)
+
+
+def with_hot_swap(model):
+    path = getattr(model, 'path', None) or MODEL_PATH
+    swapper = ModelSwapper(model, path, lambda p: load_model(p, MODEL_BACKEND), SWAP_MIN_AGREEMENT)
+    m = metrics.registry('predict')
+    m.gauge('ids_model_version', 'Models served since start (swaps and rollbacks)', fn=lambda: swapper.version)
+    m.gauge('ids_model_swap_failures', 'New model files rejected by validation', fn=lambda: swapper.failures)
+    m.gauge('ids_model_rollbacks', 'Swaps undone after the new model failed', fn=lambda: swapper.rollbacks)
+    m.gauge('ids_model_swap_seconds', 'File change to new model serving, last swap',
+            fn=lambda: swapper.last_swap_s or 0.0)
+    return swapper
+
+
+def text_sink(logf):
+    def emit(decisions):
+        if decisions:
+            text = "\n".join(decision_lines(decisions)) + "\n"
+            if PRINT_DECISIONS:
+                print(text, end='')
+            logf.write(text)
             logf.flush()
-            time.sleep(1)
-            continue
+    return emit
+
+
+def store_sink(store):
+    def emit(decisions):
+        store.add_predictions([(key[1], mal, key[2]) for key, mal in decisions])
+    return emit
 
-        if len(df) < last_row:
-            print("[PREDICT] Input file truncated, resetting last_row to 0.")
-            last_row = 0
 
-        blocked_ips = get_blocked_ips()
+def run_file(model, emit, batcher, swapper=None):
+    tail = FileTail(CSV_PATH, header=True)
+    stage = StageMetrics(lambda: batcher.pending)
+    row_number = 0
+    resets = 0
+    last_stats = time.monotonic()
 
-        if len(df) > last_row:
-            new_rows = df.iloc[last_row:]
-            src_ips = new_rows.iloc[:, 0].astype(str).tolist()
-            features = new_rows.iloc[:, 1:]
-            X = features.apply(pd.to_numeric, errors='coerce').fillna(0).to_numpy(dtype=np.float32)
+    while True:
+        lines = tail.read_lines(MAX_CHUNK_BYTES)
+        if tail.resets != resets:
+            print("[PREDICT] Input file truncated, resetting last_row to 0.")
+            resets = tail.resets
+            row_number = 0
+        if lines:
+            src_ips, X, stamps = parse_rows(lines, tail.header)
+            keys = [(row_number + i + 1, ip, int(stamp[0]) or 1) + stamp[1:]
+                    for i, (ip, stamp) in enumerate(zip(src_ips, stamps))]
+            row_number += len(keys)
+            batcher.add(keys, X)
+            stage.last_input[0] = time.time()
+
+        while batcher.ready(input_idle=not lines):
+            if swapper is not None:
+                swapper.poll()  # between batches only: a batch is never split across models
+            keys, X, waited = batcher.take()
             if not np.any(X):
-                last_row = len(df)
-                time.sleep(1)
+                batcher.record(len(keys), waited, 0.0)
+                stage.record(keys, waited, 0.0)
                 continue
-            preds = model.predict(X, verbose=0)
-            for i, pred in enumerate(preds):
-                is_malicious = int(np.argmax(pred))
-                row_number = last_row + i + 1
-                src_ip = src_ips[i]
-                if src_ip in blocked_ips:
-                    # Skip predicting/logging for blocked IPs
-                    continue
-                out = ""
-                if is_malicious:
-                    out = f"Row {row_number}: ALERT: Malicious traffic detected! src_ip: {src_ip}"
-                else:
-                    out = f"Row {row_number}: Normal traffic src_ip: {src_ip}"
-                print(out)
-                logf.write(out + "\n")
-                logf.flush()
-            last_row = len(df)
-        time.sleep(1)
+            t = time.perf_counter()
+            decisions = score_batch(model, keys, X, get_blocked_ips())
+            run_time = time.perf_counter() - t
+            batcher.record(len(keys), waited, run_time)
+            emit(decisions)
+            stage.record(keys, waited, run_time, [
+                ('capture_to_predict', [k[3] for k in keys]),
+                ('preprocess_to_predict', [k[4] for k in keys]),
+            ])
+
+        now = time.monotonic()
+        if now - last_stats >= STATS_INTERVAL and batcher.batches:
+            # Written to a file rather than printed, to keep the console for events.
+            write_stats(batcher, model, swapper)
+            last_stats = now
+
+        if not lines:
+            time.sleep(POLL_INTERVAL)
+
+
+def run_shm(model, emit, batcher, swapper=None):
+    # Score views of the scaled ring in place; a read returns whatever is ready (up to the
+    # batcher's target size), so quiet periods are scored row by row and floods in full batches.
+    from shmring import ShmRing, SCALED_RING, u32_to_ip
+    ring = ShmRing.attach(SCALED_RING, timeout=30)
+    print(f"[PREDICT] Reading from shared-memory ring {SCALED_RING}")
+    stage = StageMetrics(lambda: len(ring))
+    row_number = 0
+    last_stats = time.monotonic()
+
+    while True:
+        if swapper is not None:
+            swapper.poll()
+        views = ring.read(max_n=batcher.target_size(), timeout=STATS_INTERVAL)
+        if views is not None:
+            X, src_ip, weight, ts = views
+            stage.last_input[0] = time.time()
+            waited = max(0.0, stage.last_input[0] - float(ts[0]))
+            keys = [(row_number + i + 1, u32_to_ip(ip), w)
+                    for i, (ip, w) in enumerate(zip(src_ip.tolist(), weight.tolist()))]
+            row_number += len(keys)
+            t = time.perf_counter()
+            decisions = score_batch(model, keys, X, get_blocked_ips()) if np.any(X) else []
+            run_time = time.perf_counter() - t
+            batcher.record(len(keys), waited, run_time)
+            # The ring's timestamp is set when rtf.py extracts the record.
+            stage.record(keys, waited, run_time, [('extract_to_predict', ts.tolist())])
+            ring.release(len(keys))
+            emit(decisions)
+
+        now = time.monotonic()
+        if now - last_stats >= STATS_INTERVAL and batcher.batches:
+            write_stats(batcher, model, swapper)
+            last_stats = now
+
+
+def main():
+    global _store
+    model = load_model()
+    print(f"Model loaded ({MODEL_BACKEND} backend).")
+    swapper = None
+    if HOT_SWAP:
+        model = swapper = with_hot_swap(model)
+    if PREDICT_CACHE > 0:
+        model = with_cache(model)
+        if swapper is not None:
+            swapper.on_swap.append(model.cache.invalidate)
+    batcher = MicroBatcher(MAX_BATCH_SIZE, LATENCY_BUDGET)
+
+    run = run_shm if TRANSPORT == 'shm' else run_file
+    if EVENTS == 'sqlite':
+        from eventstore import EventStore, EVENTS_DB
+        _store = EventStore(EVENTS_DB)
+        print(f"[PREDICT] Writing decisions to {EVENTS_DB}")
+        run(model, store_sink(_store), batcher, swapper)
+        return
+    with open(LOG_PATH, "a") as logf:
+        run(model, text_sink(logf), batcher, swapper)
+
+
+if __name__ == "__main__":
+    main()
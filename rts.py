@@ -1,11 +1,115 @@
-from flask import Flask, request
+from flask import Flask, request, jsonify
+import atexit
 import csv
 import os
+import threading
+import time
 from datetime import datetime
-import random
+from anomaly import VitalsMonitor
+from vitals import valid_device_id
 
 app = Flask(__name__)
 csv_file = "logs/livedata.csv"
+# ts (epoch seconds) places readings on the dashboard's vitals charts.
+CSV_COLUMNS = ['time', 'heartRate', 'spo2', 'body_temperature', 'ambient_temperature', 'device_id', 'ts']
+FLUSH_ROWS = 1000  # flush once this many rows are buffered...
+FLUSH_INTERVAL = 0.2  # ...or this many seconds after the first buffered row
+REPORT_INTERVAL = 5.0
+
+
+# Buffers rows in memory and appends them to the CSV from one background thread, so a request
+# only pays for a list append. Rows are flushed when FLUSH_ROWS accumulate or FLUSH_INTERVAL
+# passes. An existing file keeps its header (older files lack the device_id and ts columns).
+class BufferedCsvWriter:
+    def __init__(self, path, columns=CSV_COLUMNS, flush_rows=FLUSH_ROWS, flush_interval=FLUSH_INTERVAL):
+        self.path = path
+        self.columns = columns
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.rows = []
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.written = 0
+        self.devices = set()
+        self.received = 0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def write(self, row):
+        self.writerows([row])
+
+    def writerows(self, rows):
+        with self.lock:
+            self.rows.extend(rows)
+            self.received += len(rows)
+            n = len(self.rows)
+        if n >= self.flush_rows:
+            self.wakeup.set()
+
+    def _file_columns(self):
+        if os.path.exists(self.path) and os.path.getsize(self.path) > 0:
+            with open(self.path, newline='') as f:
+                return next(csv.reader(f), self.columns), False
+        return self.columns, True
+
+    def flush(self):
+        with self.write_lock:
+            with self.lock:
+                rows, self.rows = self.rows, []
+            if not rows:
+                return 0
+            columns, write_header = self._file_columns()
+            with open(self.path, 'a', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=columns, extrasaction='ignore')
+                if write_header:
+                    writer.writeheader()
+                writer.writerows(rows)
+            self.written += len(rows)
+            self.devices.update(row.get('device_id', '') for row in rows)
+            return len(rows)
+
+    def _run(self):
+        last_report = time.monotonic()
+        reported = 0
+        while True:
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print("[SERVER] Error writing", self.path, e)
+            now = time.monotonic()
+            if now - last_report >= REPORT_INTERVAL and self.written != reported:
+                print(f"[SERVER] Stored {self.written - reported} readings from "
+                      f"{len(self.devices)} device(s) in the last {now - last_report:.0f}s")
+                reported = self.written
+                self.devices = set()
+                last_report = now
+
+
+writer = BufferedCsvWriter(csv_file)
+# Physiological anomaly checks (see anomaly.py); requests only hand rows over.
+monitor = VitalsMonitor()
+
+
+def make_row(data, device_id=''):
+    # Use current time in HH:MM:SS format
+    row = {
+        'time': datetime.now().strftime("%H:%M:%S"),
+        'heartRate': data.get('heartRate', ''),
+        'spo2': data.get('spo2', ''),
+        'body_temperature': data.get('body_temperature', ''),
+        'ambient_temperature': data.get('ambient_temperature', ''),
+        'device_id': data.get('device_id', device_id),
+        'ts': '%.3f' % time.time(),
+    }
+    if not valid_device_id(row['device_id']):
+        row['device_id'] = request.remote_addr or ''
+    float(row['heartRate'])  # rejects readings without a numeric heart rate
+    return row
+
 
 @app.route('/post', methods=['POST'])
 def receive():
@@ -14,29 +118,46 @@ def receive():
             data = request.get_json(force=True)
         except Exception:
             data = request.form.to_dict()
-        print("[SERVER] Received data:", data)
-        # Use current time in HH:MM:SS format
-        now_time = datetime.now().strftime("%H:%M:%S")
-        row = [
-            now_time,
-            data.get('heartRate', ''),
-            data.get('spo2', ''),
-            data.get('body_temperature', ''),
-            data.get('ambient_temperature', '')
-        ]
-        write_header = not os.path.exists(csv_file)
-        with open(csv_file, 'a', newline='') as f:
-            writer = csv.writer(f)
-            # Clamp heart rate if needed
-            if float(row[1]) > 125:
-                row[1] = str(round(random.uniform(80, 125), 2))
-            if write_header:
-                writer.writerow(['time', 'heartRate', 'spo2', 'body_temperature', 'ambient_temperature'])
-            writer.writerow(row)
+        row = make_row(data, request.headers.get('X-Device-Id', ''))
+        writer.write(row)
+        monitor.submit([row])
         return "OK", 200
     except Exception as e:
         print("[SERVER] Error:", e)
         return str(e), 400
 
+
+# Accepts either a JSON list of readings or {"device_id": ..., "readings": [...]}; a reading's
+# own device_id overrides the batch one.
+@app.route('/post_batch', methods=['POST'])
+def receive_batch():
+    try:
+        data = request.get_json(force=True)
+        if isinstance(data, dict):
+            device_id = data.get('device_id', '')
+            readings = data.get('readings', [])
+        else:
+            device_id, readings = '', data
+        device_id = device_id or request.headers.get('X-Device-Id', '')
+        rows = []
+        rejected = 0
+        for reading in readings:
+            try:
+                rows.append(make_row(reading, device_id))
+            except (TypeError, ValueError, AttributeError):
+                rejected += 1
+        writer.writerows(rows)
+        monitor.submit(rows)
+        return jsonify({"accepted": len(rows), "rejected": rejected}), 200
+    except Exception as e:
+        print("[SERVER] Error:", e)
+        return str(e), 400
+
+
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=8090)
+    try:
+        # A production WSGI server if available; Flask's dev server otherwise.
+        from waitress import serve
+        serve(app, host='0.0.0.0', port=8090, threads=16)
+    except ImportError:
+        app.run(host='0.0.0.0', port=8090, threaded=True)
@@ -0,0 +1,84 @@
+import json
+import os
+import numpy as np
+
+
+# StandardScaler replacement for the streaming pipeline. In "welford" mode the mean and
+# variance are updated online (Chan et al. batch merge of Welford's recurrence), so a batch
+# of one row is scaled against everything seen so far instead of against itself. In
+# "frozen" mode the training-time statistics are used as-is.
+class RunningScaler:
+    def __init__(self, n_features, mode="welford"):
+        if mode not in ("welford", "frozen"):
+            raise ValueError(f"Unknown scaler mode: {mode}")
+        self.mode = mode
+        self.count = 0
+        self.mean = np.zeros(n_features, dtype=np.float64)
+        self.m2 = np.zeros(n_features, dtype=np.float64)
+
+    @property
+    def var(self):
+        if self.count == 0:
+            return np.zeros_like(self.m2)
+        return self.m2 / self.count
+
+    @property
+    def scale(self):
+        scale = np.sqrt(self.var)
+        scale[scale == 0] = 1.0  # same as sklearn: constant columns are only centred
+        return scale
+
+    def partial_fit(self, X):
+        if self.mode == "frozen" or len(X) == 0:
+            return self
+        X = np.asarray(X, dtype=np.float64)
+        n_b = X.shape[0]
+        mean_b = X.mean(axis=0)
+        m2_b = ((X - mean_b) ** 2).sum(axis=0)
+        total = self.count + n_b
+        delta = mean_b - self.mean
+        self.mean += delta * (n_b / total)
+        self.m2 += m2_b + delta ** 2 * (self.count * n_b / total)
+        self.count = total
+        return self
+
+    def transform(self, X, out=None):
+        if out is None:
+            return ((np.asarray(X, dtype=np.float64) - self.mean) / self.scale).astype(np.float32)
+        # Write straight into a caller-provided float32 buffer (e.g. a shared-memory ring slot).
+        np.subtract(X, self.mean, out=out, casting='unsafe')
+        np.divide(out, self.scale, out=out, casting='unsafe')
+        return out
+
+    def to_dict(self):
+        return {"mode": self.mode, "count": self.count, "mean": self.mean.tolist(), "m2": self.m2.tolist()}
+
+    @classmethod
+    def from_dict(cls, d):
+        mean = np.asarray(d["mean"], dtype=np.float64)
+        scaler = cls(len(mean), d.get("mode", "welford"))
+        scaler.mean = mean
+        if "m2" in d:
+            scaler.m2 = np.asarray(d["m2"], dtype=np.float64)
+            scaler.count = int(d.get("count", 0))
+        else:
+            # Training-time stats exported as mean/var (e.g. from sklearn's mean_ / var_).
+            scaler.count = int(d.get("count", 1)) or 1
+            scaler.m2 = np.asarray(d["var"], dtype=np.float64) * scaler.count
+        return scaler
+
+    @classmethod
+    def load(cls, path, n_features, mode="welford"):
+        if not os.path.exists(path):
+            return cls(n_features, mode)
+        with open(path) as f:
+            scaler = cls.from_dict(json.load(f))
+        if len(scaler.mean) != n_features:
+            raise ValueError(f"{path} has {len(scaler.mean)} features, expected {n_features}")
+        return scaler
+
+    def save(self, path):
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.to_dict(), f)
+        os.replace(tmp, path)
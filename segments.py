@@ -0,0 +1,138 @@
+import json
+import os
+import re
+import struct
+import time
+
+from pcapstream import PCAP_MAGICS, GLOBAL_HEADER_LEN, RECORD_HEADER_LEN
+
+# Rotating capture for IDS_CAPTURE_SEGMENTS=1. tcpdump streams the capture on stdout and
+# SegmentWriter cuts it into numbered pcap files of at most max_bytes or max_seconds each
+# (whichever comes first), always on packet boundaries. A segment is written as .part and
+# renamed once complete, so readers only ever see whole files. At most max_files completed
+# segments are kept: rtf.py deletes segments once extracted, and if it falls that far behind
+# the oldest ones are dropped to bound disk use.
+# Sequence numbers never go backwards: rtf.py records the last segment it emitted in
+# SEGMENT_STATE and skips anything numbered at or below it, so a new writer (tcpdump restart)
+# continues above both the segments on disk and that record.
+
+SEGMENT_DIR = 'logs/segments'
+SEGMENT_STATE = 'logs/segments.state'
+_NAME = re.compile(r'^seg-(\d{8})\.pcap$')
+
+
+def segment_path(directory, seq):
+    return os.path.join(directory, f'seg-{seq:08d}.pcap')
+
+
+def completed_segments(directory):
+    # [(seq, path)] of complete segments, oldest first.
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    found = [(int(m.group(1)), os.path.join(directory, name)) for name in names for m in [_NAME.match(name)] if m]
+    return sorted(found)
+
+
+def load_segment_state(path=SEGMENT_STATE):
+    # Last segment rtf.py emitted, or None before the first one.
+    try:
+        with open(path) as f:
+            return json.load(f)["seq"]
+    except (FileNotFoundError, ValueError, KeyError):
+        return None
+
+
+def save_segment_state(seq, path=SEGMENT_STATE):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump({"seq": seq}, f)
+    os.replace(tmp, path)
+
+
+class SegmentWriter:
+    def __init__(self, directory=SEGMENT_DIR, max_bytes=4 * 1024 * 1024, max_seconds=1.0, max_files=32,
+                 state_path=SEGMENT_STATE):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.max_files = max_files
+        os.makedirs(directory, exist_ok=True)
+        for name in os.listdir(directory):
+            if name.endswith('.part'):
+                os.remove(os.path.join(directory, name))
+        existing = completed_segments(directory)
+        done = load_segment_state(state_path)
+        self.seq = max(existing[-1][0] + 1 if existing else 0, 0 if done is None else done + 1)
+        self.header = None
+        self.endian = '<'
+        self.pending = bytearray()
+        self.f = None
+        self.opened_at = 0.0
+        self.size = 0
+        self.packets = 0
+        self.segments = 0
+        self.dropped = 0
+
+    def feed(self, data, now=None):
+        self.pending += data
+        if self.header is None:
+            if len(self.pending) < GLOBAL_HEADER_LEN:
+                return
+            self.header = bytes(self.pending[:GLOBAL_HEADER_LEN])
+            if self.header[:4] not in PCAP_MAGICS:
+                raise ValueError(f"Capture stream is not libpcap (magic {self.header[:4].hex()})")
+            self.endian = PCAP_MAGICS[self.header[:4]]
+            del self.pending[:GLOBAL_HEADER_LEN]
+        # Only whole records go into a segment; a partial one waits for the next chunk.
+        fmt = self.endian + 'I'
+        pos = n = 0
+        while pos + RECORD_HEADER_LEN <= len(self.pending):
+            end = pos + RECORD_HEADER_LEN + struct.unpack_from(fmt, self.pending, pos + 8)[0]
+            if end > len(self.pending):
+                break
+            pos = end
+            n += 1
+        if n:
+            if self.f is None:
+                self._open(now)
+            self.f.write(self.pending[:pos])
+            self.size += pos
+            self.packets += n
+            del self.pending[:pos]
+        self.tick(now)
+
+    def tick(self, now=None):
+        # Rotates on size, or on age so quiet periods still reach the extractors promptly.
+        if self.f is None:
+            return
+        now = time.monotonic() if now is None else now
+        if self.size >= self.max_bytes or now - self.opened_at >= self.max_seconds:
+            self._close()
+
+    def _open(self, now=None):
+        self.f = open(segment_path(self.directory, self.seq) + '.part', 'wb')
+        self.f.write(self.header)
+        self.opened_at = time.monotonic() if now is None else now
+        self.size = 0
+
+    def _close(self):
+        path = segment_path(self.directory, self.seq)
+        self.f.close()
+        self.f = None
+        os.replace(path + '.part', path)
+        self.seq += 1
+        self.segments += 1
+        done = completed_segments(self.directory)
+        for _, old in done[:max(0, len(done) - self.max_files)]:
+            try:
+                os.remove(old)
+                self.dropped += 1
+                print(f"[TCPDUMP] Extraction is behind; dropped {os.path.basename(old)} to bound disk use")
+            except FileNotFoundError:
+                pass
+
+    def close(self):
+        if self.f is not None:
+            self._close()
@@ -0,0 +1,260 @@
+import fcntl
+import os
+import socket
+import struct
+import tempfile
+import time
+from functools import lru_cache
+from multiprocessing import shared_memory
+import numpy as np
+
+# Single-producer/single-consumer ring of fixed-width float32 feature records in POSIX shared
+# memory, used instead of the CSV files between rtf -> rtc -> rtp when IDS_TRANSPORT=shm.
+# Each slot holds n_features float32 values, the IPv4 source address as a uint32 (0 = none),
+# a uint32 weight (packets the record stands for: 1, or a flow's count with IDS_FLOWS=1)
+# and a float64 timestamp. Readers get NumPy views straight into the segment (no copy) and
+# release them once done; a full ring blocks the writer (backpressure).
+#
+# Layout: [0:64) meta | [64:68) write cursor | [128:132) read cursor | features | src_ip | weight | ts
+# Cursors are uint32 and wrap modulo 2**32, so the capacity must be a power of two.
+#
+# Ordering: a plain cursor store could become visible to the other process before the record
+# bytes written ahead of it (ARM reorders stores), so the reader could see a half-written
+# record. Cursors are therefore only loaded and stored while holding an flock on a lock file
+# next to the segment. Taking and dropping the kernel lock are acquire and release operations,
+# so everything written before a commit() (or read before a release()) is visible to the other
+# side once it sees the new cursor. A batch takes the lock twice, once to load both cursors and
+# once to advance one, and a waiting side takes it once per poll, never per record.
+
+MAGIC = 0x49445352  # "IDSR"
+META_FMT = "<IIII"  # magic, capacity, n_features, closed
+WRITE_OFF = 64
+READ_OFF = 128
+DATA_OFF = 192
+CURSOR_MOD = 1 << 32
+
+LOCK_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+
+FEATURES_RING = "ids_features"
+SCALED_RING = "ids_scaled"
+
+_ip_cache = {}
+
+
+def ip_to_u32(ip):
+    try:
+        return _ip_cache[ip]
+    except KeyError:
+        pass
+    try:
+        value = struct.unpack("!I", socket.inet_aton(ip))[0] if ip else 0
+    except OSError:
+        value = 0
+    if len(_ip_cache) < 65536:
+        _ip_cache[ip] = value
+    return value
+
+
+@lru_cache(maxsize=65536)
+def u32_to_ip(value):
+    return socket.inet_ntoa(struct.pack("!I", value)) if value else ""
+
+
+def _lock_path(name):
+    return os.path.join(LOCK_DIR, name.lstrip("/") + ".lock")
+
+
+def _layout(capacity, n_features):
+    feat_off = DATA_OFF
+    ip_off = feat_off + capacity * n_features * 4
+    weight_off = ip_off + capacity * 4
+    ts_off = weight_off + capacity * 4
+    ts_off += (-ts_off) % 8
+    return feat_off, ip_off, weight_off, ts_off, ts_off + capacity * 8
+
+
+class ShmRing:
+    def __init__(self, shm, owner=False):
+        self.shm = shm
+        self.owner = owner
+        magic, capacity, n_features, _ = struct.unpack_from(META_FMT, shm.buf, 0)
+        if magic != MAGIC:
+            raise ValueError(f"Shared memory segment {shm.name} is not an IDS ring")
+        self.name = shm.name
+        self.capacity = capacity
+        self.n_features = n_features
+        self._mask = capacity - 1
+        feat_off, ip_off, weight_off, ts_off, _ = _layout(capacity, n_features)
+        buf = shm.buf
+        self._meta = np.ndarray((4,), np.uint32, buf, 0)
+        self._write = np.ndarray((1,), np.uint32, buf, WRITE_OFF)
+        self._read = np.ndarray((1,), np.uint32, buf, READ_OFF)
+        self.features = np.ndarray((capacity, n_features), np.float32, buf, feat_off)
+        self.src_ip = np.ndarray((capacity,), np.uint32, buf, ip_off)
+        self.weight = np.ndarray((capacity,), np.uint32, buf, weight_off)
+        self.ts = np.ndarray((capacity,), np.float64, buf, ts_off)
+        self._lock_fd = os.open(_lock_path(self.name), os.O_RDONLY | os.O_CREAT, 0o644)
+
+    def _cursors(self):
+        # (write, read), loaded under the lock (acquire).
+        fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+        try:
+            return int(self._write[0]), int(self._read[0])
+        finally:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    def _advance(self, cursor, n):
+        # Moves a cursor under the lock (release): earlier record accesses happen before it.
+        fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+        try:
+            cursor[0] = (int(cursor[0]) + n) % CURSOR_MOD
+        finally:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    @classmethod
+    def create(cls, name, capacity=65536, n_features=21):
+        if capacity & (capacity - 1) or not 0 < capacity < CURSOR_MOD // 2:
+            raise ValueError("Ring capacity must be a power of two below 2**31")
+        size = _layout(capacity, n_features)[-1]
+        try:
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+        except FileNotFoundError:
+            pass
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        struct.pack_into(META_FMT, shm.buf, 0, MAGIC, capacity, n_features, 0)
+        struct.pack_into("<I", shm.buf, WRITE_OFF, 0)
+        struct.pack_into("<I", shm.buf, READ_OFF, 0)
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            try:
+                shm = shared_memory.SharedMemory(name=name)
+                break
+            except FileNotFoundError:
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise
+                time.sleep(0.1)
+        try:
+            # The creating process owns the segment; keep Python's resource tracker from
+            # unlinking it when this (attaching) process exits.
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, "shared_memory")
+        except Exception:
+            pass
+        return cls(shm)
+
+    @property
+    def closed(self):
+        return self._meta is None or bool(self._meta[3])
+
+    def __len__(self):
+        write, read = self._cursors()
+        return (write - read) % CURSOR_MOD
+
+    @property
+    def free(self):
+        return self.capacity - len(self)
+
+    @property
+    def consumed(self):
+        return self._cursors()[1]
+
+    @property
+    def written(self):
+        return self._cursors()[0]
+
+    def _wait(self, ready, timeout):
+        # Returns the (write, read) cursors once ready(write, read) holds, or None on timeout or
+        # when the ring is closed first. Spins briefly, then backs off to short sleeps; keeps
+        # idle CPU low without futexes.
+        deadline = None if timeout is None else time.monotonic() + timeout
+        delay = 0.00005
+        while True:
+            if self._meta is None:
+                return None
+            # The owner only closes after its last commit, so cursors loaded after seeing
+            # `closed` are final.
+            closed = bool(self._meta[3])
+            cursors = self._cursors()
+            if ready(*cursors):
+                return cursors
+            if closed or (deadline is not None and time.monotonic() >= deadline):
+                return None
+            time.sleep(delay)
+            delay = min(delay * 2, 0.002)
+
+    # Producer side
+
+    def reserve(self, n, timeout=None):
+        # Returns writable (features, src_ip, weight, ts) views for up to n contiguous slots,
+        # blocking while the ring is full. Fill them, then commit() how many were used.
+        cursors = self._wait(lambda write, read: (write - read) % CURSOR_MOD < self.capacity, timeout)
+        if cursors is None:
+            return None
+        write, read = cursors
+        start = write & self._mask
+        n = min(n, self.capacity - (write - read) % CURSOR_MOD, self.capacity - start)
+        end = start + n
+        return self.features[start:end], self.src_ip[start:end], self.weight[start:end], self.ts[start:end]
+
+    def commit(self, n):
+        self._advance(self._write, n)
+
+    def write(self, X, src_ip, ts=None, timeout=None, weight=None):
+        X = np.asarray(X, dtype=np.float32)
+        now = time.time()
+        done = 0
+        while done < len(X):
+            views = self.reserve(len(X) - done, timeout)
+            if views is None:
+                break
+            feats, ips, weights, stamps = views
+            n = len(feats)
+            feats[:] = X[done:done + n]
+            ips[:] = src_ip[done:done + n]
+            weights[:] = 1 if weight is None else weight[done:done + n]
+            stamps[:] = now if ts is None else ts[done:done + n]
+            self.commit(n)
+            done += n
+        return done
+
+    # Consumer side
+
+    def read(self, max_n=None, timeout=None):
+        # Returns zero-copy (features, src_ip, weight, ts) views of up to max_n contiguous records,
+        # blocking until at least one is available. Call release(n) when done with them.
+        cursors = self._wait(lambda write, read: write != read, timeout)
+        if cursors is None:
+            return None
+        write, read = cursors
+        start = read & self._mask
+        n = min((write - read) % CURSOR_MOD, self.capacity - start)
+        if max_n is not None:
+            n = min(n, max_n)
+        end = start + n
+        return self.features[start:end], self.src_ip[start:end], self.weight[start:end], self.ts[start:end]
+
+    def release(self, n):
+        self._advance(self._read, n)
+
+    def close(self):
+        if self.owner:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+            self._meta[3] = 1
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+        # Drop our views before closing the mapping, otherwise close() raises BufferError.
+        self._meta = self._write = self._read = None
+        self.features = self.src_ip = self.weight = self.ts = None
+        self.shm.close()
+        os.close(self._lock_fd)
+        if self.owner:
+            for unlink in (self.shm.unlink, lambda: os.remove(_lock_path(self.name))):
+                try:
+                    unlink()
+                except FileNotFoundError:
+                    pass
@@ -0,0 +1,282 @@
+import asyncio
+import json
+import os
+import signal
+import sys
+import threading
+import time
+
+import metrics
+
+# Runs every pipeline stage as a child process from one asyncio event loop (in a background
+# thread, so main.py's monitor keeps the main thread). Per stage the loop
+#   - relays output: stdout is read in READ_CHUNK chunks and split into lines, which go to a
+#     bounded console buffer that a writer thread drains in batches. A slow terminal can only
+#     make the console drop lines (counted), never stall a stage on a full pipe;
+#   - restarts the stage when it exits, after a backoff doubling from RESTART_MIN to
+#     RESTART_MAX and reset once a run lasted STABLE_SECONDS;
+#   - checks health every HEALTH_INTERVAL: a stage with a metrics registry must keep exporting
+#     logs/metrics/<stage>.json from its own pid, or it is killed (and restarted) once
+#     STALE_AFTER seconds pass without a snapshot after the STARTUP_GRACE period. Stages export
+#     before they wait for their input, so an idle stage stays healthy. A queue depth above
+#     LAG_DEPTH is reported as lag.
+# stop() terminates all stages, kills whatever is left after SHUTDOWN_TIMEOUT and returns.
+
+READ_CHUNK = 65536
+RESTART_MIN = 1.0
+RESTART_MAX = 30.0
+STABLE_SECONDS = 60.0
+HEALTH_INTERVAL = 5.0
+STALE_AFTER = float(os.environ.get('IDS_HEALTH_STALE', '30'))
+STARTUP_GRACE = float(os.environ.get('IDS_HEALTH_GRACE', '120'))  # model loading can take a while
+LAG_DEPTH = float(os.environ.get('IDS_HEALTH_LAG_DEPTH', '100000'))
+SHUTDOWN_TIMEOUT = float(os.environ.get('IDS_SHUTDOWN_TIMEOUT', '5'))
+CONSOLE_LINES = 10000  # console lines buffered before new ones are dropped
+CONSOLE_INTERVAL = 0.1
+
+
+class Stage:
+    # sink: factory for an object with feed(bytes), tick() and close() that takes the raw stdout
+    # instead of the line relay (stderr is still relayed); a fresh one is made for every run.
+    def __init__(self, name, cmd, metrics_stage=None, sink=None, tick_interval=0.1):
+        self.name = name
+        self.cmd = cmd
+        self.metrics_stage = metrics_stage
+        self.sink = sink
+        self.tick_interval = tick_interval
+        self.proc = None
+        self.started = 0.0
+        self.runs = 0
+        self.lagging = False
+
+
+class Console:
+    def __init__(self, capacity=CONSOLE_LINES, interval=CONSOLE_INTERVAL, out=None, on_drop=None):
+        self.capacity = capacity
+        self.on_drop = on_drop
+        self.interval = interval
+        self.out = out or sys.stdout
+        self.lines = []
+        self.dropped = 0
+        self.lock = threading.Lock()
+        self.done = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='console', daemon=True)
+        self._thread.start()
+
+    def write(self, lines, always=False):
+        with self.lock:
+            room = self.capacity - len(self.lines)
+            if room < len(lines) and not always:
+                self.dropped += len(lines) - max(room, 0)
+                lines = lines[:max(room, 0)]
+            self.lines.extend(lines)
+
+    def flush(self):
+        with self.lock:
+            lines, self.lines = self.lines, []
+            dropped, self.dropped = self.dropped, 0
+        if dropped:
+            if self.on_drop:
+                self.on_drop(dropped)
+            lines.append(f"[SUPERVISOR] Console fell behind; dropped {dropped} lines\n")
+        if lines:
+            try:
+                self.out.write(''.join(lines))
+                self.out.flush()
+            except (OSError, ValueError):
+                pass
+
+    def _run(self):
+        while not self.done.wait(self.interval):
+            self.flush()
+        self.flush()
+
+    def close(self):
+        self.done.set()
+        self._thread.join(2.0)
+
+
+class Supervisor:
+    def __init__(self, metrics_dir=metrics.METRICS_DIR, stagger=1.0):
+        self.metrics_dir = metrics_dir
+        self.stagger = stagger
+        self.stages = []
+        self.loop = None
+        self.stopping = False
+        self._thread = None
+        self._tasks = []
+        self._ready = threading.Event()
+        m = metrics.registry('supervisor')
+        self.m = m
+        dropped = m.counter('ids_console_lines_dropped_total', 'Stage output lines the console dropped')
+        self.console = Console(on_drop=dropped.inc)
+        m.gauge('ids_console_backlog', 'Stage output lines waiting for the console', fn=lambda: len(self.console.lines))
+
+    def add(self, stage):
+        self.stages.append(stage)
+        stage.restarts = self.m.counter('ids_stage_restarts_total', 'Times the supervisor restarted the stage',
+                                        stage=stage.name)
+        self.m.gauge('ids_stage_running', 'Whether the stage process is running', stage=stage.name,
+                     fn=lambda: int(stage.proc is not None and stage.proc.returncode is None))
+        return stage
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='supervisor', daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        self.m.start_exporter(directory=self.metrics_dir)
+        return self
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self._ready.set()
+        try:
+            self.loop.run_until_complete(self._main())
+        finally:
+            self.loop.close()
+
+    async def _main(self):
+        self._done = asyncio.Event()
+        self._health_task = asyncio.ensure_future(self._health())
+        for i, stage in enumerate(self.stages):
+            if i and self.stagger:
+                await asyncio.sleep(self.stagger)
+            if self.stopping:
+                break
+            self._tasks.append(asyncio.ensure_future(self._supervise(stage)))
+        await self._done.wait()
+
+    async def _supervise(self, stage):
+        backoff = RESTART_MIN
+        while not self.stopping:
+            stage.started = time.monotonic()
+            stage.runs += 1
+            stage.lagging = False
+            try:
+                code = await self._run_once(stage)
+            except OSError as e:
+                code = None
+                self._log(f"Could not start {stage.name}: {e}")
+            if self.stopping:
+                break
+            if time.monotonic() - stage.started >= STABLE_SECONDS:
+                backoff = RESTART_MIN
+            self._log(f"{stage.name} exited with code {code}; restarting in {backoff:g}s")
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, RESTART_MAX)
+            stage.restarts.inc()
+
+    async def _run_once(self, stage):
+        if stage.sink is None:
+            stage.proc = await asyncio.create_subprocess_exec(
+                *stage.cmd, stdin=asyncio.subprocess.DEVNULL, stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.STDOUT)
+            await self._relay(stage, stage.proc.stdout)
+        else:
+            sink = stage.sink()
+            stage.proc = await asyncio.create_subprocess_exec(
+                *stage.cmd, stdin=asyncio.subprocess.DEVNULL, stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE)
+            try:
+                await asyncio.gather(self._feed(stage, stage.proc.stdout, sink),
+                                     self._relay(stage, stage.proc.stderr))
+            finally:
+                sink.close()
+        return await stage.proc.wait()
+
+    async def _relay(self, stage, stream):
+        prefix = f"[{stage.name}] "
+        partial = b''
+        while True:
+            data = await stream.read(READ_CHUNK)
+            if not data:
+                break
+            data = partial + data
+            cut = data.rfind(b'\n') + 1
+            partial = data[cut:]
+            if not cut:
+                continue
+            text = data[:cut].decode(errors='replace')
+            self.console.write([prefix + line + '\n' for line in text.splitlines()])
+        if partial:
+            self.console.write([prefix + partial.decode(errors='replace') + '\n'])
+
+    async def _feed(self, stage, stream, sink):
+        while True:
+            try:
+                data = await asyncio.wait_for(stream.read(1 << 20), stage.tick_interval)
+            except asyncio.TimeoutError:
+                sink.tick()
+                continue
+            if not data:
+                break
+            sink.feed(data)
+
+    def _snapshot(self, stage):
+        try:
+            with open(os.path.join(self.metrics_dir, f'{stage.metrics_stage}.json')) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    async def _health(self):
+        while not self.stopping:
+            await asyncio.sleep(HEALTH_INTERVAL)
+            now = time.time()
+            for stage in self.stages:
+                proc = stage.proc
+                if stage.metrics_stage is None or proc is None or proc.returncode is not None:
+                    continue
+                if time.monotonic() - stage.started < STARTUP_GRACE:
+                    continue
+                snap = self._snapshot(stage)
+                if snap is None or snap.get('pid') != proc.pid or now - snap.get('time', 0) > STALE_AFTER:
+                    self._log(f"{stage.name} has not exported metrics for {STALE_AFTER:g}s; killing it")
+                    self._signal(proc, signal.SIGKILL)
+                    continue
+                depth = max([m.get('value', 0) for m in snap['metrics'] if m['name'] == 'ids_queue_depth'] or [0])
+                if (depth > LAG_DEPTH) != stage.lagging:
+                    stage.lagging = depth > LAG_DEPTH
+                    self._log(f"{stage.name} is lagging: {depth:g} queued" if stage.lagging
+                              else f"{stage.name} caught up")
+
+    def _log(self, message):
+        # Through the console, so it stays in order with the stage output around it.
+        self.console.write([f"[SUPERVISOR] {message}\n"], always=True)
+
+    def _signal(self, proc, sig):
+        if proc.returncode is None:
+            try:
+                proc.send_signal(sig)
+            except ProcessLookupError:
+                pass
+
+    async def _shutdown(self, timeout):
+        self.stopping = True
+        self._health_task.cancel()
+        procs = [s.proc for s in self.stages if s.proc is not None and s.proc.returncode is None]
+        for proc in procs:
+            self._signal(proc, signal.SIGTERM)
+        if procs:
+            await asyncio.wait([asyncio.ensure_future(p.wait()) for p in procs], timeout=timeout)
+            for stage in self.stages:
+                if stage.proc is not None and stage.proc.returncode is None:
+                    self._log(f"{stage.name} did not exit within {timeout:g}s; killing it")
+                    self._signal(stage.proc, signal.SIGKILL)
+        # Readers can still be blocked on pipes held open by grandchildren (sudo, worker pools).
+        _, pending = await asyncio.wait(self._tasks, timeout=1.0)
+        for task in pending:
+            task.cancel()
+        self._done.set()
+
+    def stop(self, timeout=SHUTDOWN_TIMEOUT):
+        if self.loop is None or not self._thread.is_alive():
+            return
+        future = asyncio.run_coroutine_threadsafe(self._shutdown(timeout), self.loop)
+        try:
+            future.result(timeout + 3.0)
+        except Exception as e:
+            self._log(f"Shutdown incomplete: {e}")
+        self._thread.join(2.0)
+        self.console.close()
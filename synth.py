@@ -0,0 +1,201 @@
+import random
+import socket
+import struct
+
+from pcapstream import PCAP_MAGICS
+
+# Synthetic workload for benchmarks: libpcap files with a configurable mix of benign ESP32
+# sensor traffic and attacks, plus simulated sensor POST bodies. Only packets addressed to the
+# gateway are generated, matching the `dst host <lan ip>` filter main.py gives tcpdump.
+#
+#   python synth.py out.pcap --seconds 60 --pps 2000 --mix benign=0.6,syn_flood=0.3,arp_spoof=0.1
+
+GATEWAY_IP = "192.168.137.10"
+GATEWAY_MAC = "b8:27:eb:00:00:10"
+ESP32_IP = "192.168.137.250"
+ESP32_MAC = "24:0a:c4:00:00:fa"
+ROUTER_IP = "192.168.137.1"
+ATTACKERS = {
+    "syn_flood": ("192.168.137.66", "02:00:00:00:00:66"),
+    "http_flood": ("192.168.137.77", "02:00:00:00:00:77"),
+    "arp_spoof": ("192.168.137.88", "02:00:00:00:00:88"),
+}
+ATTACKS = tuple(ATTACKERS)
+KINDS = ("benign",) + ATTACKS
+LINKTYPE_ETHERNET = 1
+PCAP_MAGIC_LE = [m for m, e in PCAP_MAGICS.items() if e == "<"][0]
+
+
+def _mac(mac):
+    return bytes.fromhex(mac.replace(":", ""))
+
+
+def _checksum(data):
+    if len(data) % 2:
+        data += b"\0"
+    s = sum(struct.unpack("!%dH" % (len(data) // 2), data))
+    s = (s >> 16) + (s & 0xFFFF)
+    s += s >> 16
+    return ~s & 0xFFFF
+
+
+def ethernet(dst, src, ethertype, payload):
+    return _mac(dst) + _mac(src) + struct.pack("!H", ethertype) + payload
+
+
+def ipv4(src, dst, proto, payload, ident=0, ttl=64):
+    header = struct.pack("!BBHHHBBH4s4s", 0x45, 0, 20 + len(payload), ident & 0xFFFF, 0x4000, ttl,
+                         proto, 0, socket.inet_aton(src), socket.inet_aton(dst))
+    header = header[:10] + struct.pack("!H", _checksum(header)) + header[12:]
+    return header + payload
+
+
+TCP_FIN, TCP_SYN, TCP_RST, TCP_PSH, TCP_ACK = 0x01, 0x02, 0x04, 0x08, 0x10
+
+
+def tcp(src, dst, sport, dport, seq, ack, flags, payload=b"", window=64240):
+    header = struct.pack("!HHIIBBHHH", sport, dport, seq & 0xFFFFFFFF, ack & 0xFFFFFFFF, 5 << 4,
+                         flags, window, 0, 0)
+    pseudo = socket.inet_aton(src) + socket.inet_aton(dst) + struct.pack("!BBH", 0, 6, len(header) + len(payload))
+    csum = _checksum(pseudo + header + payload)
+    return header[:16] + struct.pack("!H", csum) + header[18:] + payload
+
+
+def tcp_frame(src_mac, src, sport, dport, seq, ack, flags, payload=b"", ident=0):
+    segment = tcp(src, GATEWAY_IP, sport, dport, seq, ack, flags, payload)
+    return ethernet(GATEWAY_MAC, src_mac, 0x0800, ipv4(src, GATEWAY_IP, 6, segment, ident))
+
+
+def arp_frame(sender_mac, sender_ip, target_ip, op=2):
+    payload = struct.pack("!HHBBH6s4s6s4s", 1, 0x0800, 6, 4, op, _mac(sender_mac), socket.inet_aton(sender_ip),
+                          _mac(GATEWAY_MAC), socket.inet_aton(target_ip))
+    return ethernet(GATEWAY_MAC, sender_mac, 0x0806, payload)
+
+
+class PcapWriter:
+    def __init__(self, f, snaplen=65535):
+        self.f = f
+        f.write(PCAP_MAGIC_LE + struct.pack("<HHiIII", 2, 4, 0, 0, snaplen, LINKTYPE_ETHERNET))
+
+    def write(self, ts, frame):
+        sec = int(ts)
+        self.f.write(struct.pack("<IIII", sec, int((ts - sec) * 1e6), len(frame), len(frame)) + frame)
+
+
+# Packet sources. Each yields frames forever; stateful ones walk through whole conversations.
+def benign_packets(rng):
+    sport = 49152
+    while True:
+        sport = sport + 1 if sport < 65000 else 49152
+        seq = rng.getrandbits(32)
+        body = ('{"heartRate": %.1f, "spo2": %.1f, "body_temperature": %.2f, "ambient_temperature": %.2f}'
+                % (rng.uniform(60, 110), rng.uniform(94, 100), rng.uniform(36, 37.5), rng.uniform(20, 28))).encode()
+        request = (b"POST /post HTTP/1.1\r\nHost: " + GATEWAY_IP.encode() + b":8090\r\n"
+                   b"Content-Type: application/json\r\nContent-Length: " + str(len(body)).encode() + b"\r\n\r\n" + body)
+        ack = rng.getrandbits(32)
+        yield tcp_frame(ESP32_MAC, ESP32_IP, sport, 8090, seq, 0, TCP_SYN)
+        yield tcp_frame(ESP32_MAC, ESP32_IP, sport, 8090, seq + 1, ack + 1, TCP_ACK)
+        yield tcp_frame(ESP32_MAC, ESP32_IP, sport, 8090, seq + 1, ack + 1, TCP_PSH | TCP_ACK, request)
+        yield tcp_frame(ESP32_MAC, ESP32_IP, sport, 8090, seq + 1 + len(request), ack + 20, TCP_FIN | TCP_ACK)
+
+
+def syn_flood_packets(rng):
+    ip, mac = ATTACKERS["syn_flood"]
+    while True:
+        yield tcp_frame(mac, ip, rng.randint(1024, 65535), 80, rng.getrandbits(32), 0, TCP_SYN,
+                        ident=rng.getrandbits(16))
+
+
+def http_flood_packets(rng):
+    ip, mac = ATTACKERS["http_flood"]
+    request = b"GET / HTTP/1.1\r\nHost: " + GATEWAY_IP.encode() + b"\r\nUser-Agent: flood\r\n\r\n"
+    sport = 30000
+    while True:
+        sport = sport + 1 if sport < 60000 else 30000
+        seq = rng.getrandbits(32)
+        yield tcp_frame(mac, ip, sport, 8050, seq, 0, TCP_SYN)
+        yield tcp_frame(mac, ip, sport, 8050, seq + 1, 1, TCP_ACK)
+        for i in range(4):
+            yield tcp_frame(mac, ip, sport, 8050, seq + 1 + i * len(request), 1, TCP_PSH | TCP_ACK, request)
+
+
+def arp_spoof_packets(rng):
+    ip, mac = ATTACKERS["arp_spoof"]
+    while True:
+        # Unsolicited replies claiming the router's address, plus gratuitous announcements.
+        yield arp_frame(mac, ROUTER_IP, GATEWAY_IP)
+        yield arp_frame(mac, ROUTER_IP, ROUTER_IP, op=1)
+
+
+SOURCES = {
+    "benign": benign_packets,
+    "syn_flood": syn_flood_packets,
+    "http_flood": http_flood_packets,
+    "arp_spoof": arp_spoof_packets,
+}
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        kind, _, weight = part.partition("=")
+        if kind not in SOURCES:
+            raise ValueError(f"Unknown traffic kind {kind!r}; choose from {', '.join(KINDS)}")
+        mix[kind] = float(weight or 1)
+    return mix
+
+
+def generate(n_packets, pps=1000.0, mix=None, attack_start=0.0, seed=0, start_ts=1.7e9):
+    # Yields (timestamp, kind, src_ip, frame). Attack kinds only appear after attack_start
+    # seconds; before that every packet is benign.
+    mix = mix or {"benign": 1.0}
+    rng = random.Random(seed)
+    sources = {kind: SOURCES[kind](random.Random(seed + i)) for i, kind in enumerate(KINDS)}
+    kinds = list(mix)
+    weights = [mix[k] for k in kinds]
+    for i in range(n_packets):
+        t = i / pps
+        kind = "benign" if t < attack_start else rng.choices(kinds, weights)[0]
+        ip = ESP32_IP if kind == "benign" else ATTACKERS[kind][0]
+        if kind == "arp_spoof":
+            ip = ""  # ARP has no ip.src
+        yield start_ts + t, kind, ip, next(sources[kind])
+
+
+def write_pcap(path, n_packets, **kwargs):
+    labels = []
+    with open(path, "wb") as f:
+        writer = PcapWriter(f)
+        for ts, kind, ip, frame in generate(n_packets, **kwargs):
+            writer.write(ts, frame)
+            labels.append((kind, ip))
+    return labels
+
+
+def sensor_readings(n_devices=100, per_device=10, seed=0):
+    # Simulated ESP32 POST bodies for rts.py's /post_batch, one batch per device.
+    rng = random.Random(seed)
+    for d in range(n_devices):
+        device_id = f"esp32-{d:03d}"
+        yield device_id, [{
+            "heartRate": round(rng.uniform(60, 120), 1),
+            "spo2": round(rng.uniform(92, 100), 1),
+            "body_temperature": round(rng.uniform(36.0, 37.8), 2),
+            "ambient_temperature": round(rng.uniform(20, 28), 2),
+        } for _ in range(per_device)]
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Write a synthetic IoMT capture")
+    parser.add_argument("output")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--pps", type=float, default=1000)
+    parser.add_argument("--mix", type=parse_mix, default={"benign": 0.7, "syn_flood": 0.3})
+    parser.add_argument("--attack-start", type=float, default=0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    labels = write_pcap(args.output, int(args.seconds * args.pps), pps=args.pps, mix=args.mix,
+                        attack_start=args.attack_start, seed=args.seed)
+    counts = {kind: sum(1 for k, _ in labels if k == kind) for kind in KINDS}
+    print(f"Wrote {len(labels)} packets to {args.output}: {counts}")
@@ -0,0 +1,80 @@
+import os
+
+
+# Follows a growing text file like `tail -f`, returning only complete lines written since
+# the previous call. With header=True the first line is kept in .header instead of being
+# returned. A new inode or a file shorter than the saved offset restarts from the top.
+class FileTail:
+    def __init__(self, path, header=False, offset=0, inode=None):
+        self.path = path
+        self.has_header = header
+        self.header = None
+        self.offset = offset
+        self.inode = inode
+        self.resets = 0
+        self.skipping = False  # inside a line longer than max_bytes, dropped up to its newline
+
+    def reset(self):
+        self.offset = 0
+        self.header = None
+        self.skipping = False
+        self.resets += 1
+
+    def seek_end(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        self.inode = st.st_ino
+        if self.has_header and self.header is None:
+            with open(self.path, "rb") as f:
+                self.header = f.readline().decode(errors="replace").rstrip("\r\n")
+        self.offset = st.st_size
+
+    def read_lines(self, max_bytes=1024 * 1024):
+        try:
+            f = open(self.path, "rb")
+        except FileNotFoundError:
+            return []
+        with f:
+            st = os.fstat(f.fileno())
+            if (self.inode is not None and st.st_ino != self.inode) or st.st_size < self.offset:
+                self.reset()
+            self.inode = st.st_ino
+            if self.has_header and self.header is None:
+                f.seek(0)
+                first = f.readline()
+                if not first.endswith(b"\n"):
+                    return []
+                self.header = first.decode(errors="replace").rstrip("\r\n")
+                self.offset = max(self.offset, len(first))
+            if st.st_size <= self.offset:
+                return []
+            f.seek(self.offset)
+            buf = f.read(min(st.st_size - self.offset, max_bytes))
+        if self.skipping:
+            start = buf.find(b"\n") + 1
+            if not start:
+                self.offset += len(buf)
+                return []
+            self.offset += start
+            buf = buf[start:]
+            self.skipping = False
+        end = buf.rfind(b"\n")
+        if end < 0:
+            if len(buf) >= max_bytes:
+                # A single line longer than max_bytes: skip it rather than stall forever.
+                self.offset += len(buf)
+                self.skipping = True
+            return []
+        self.offset += end + 1
+        return buf[:end].decode(errors="replace").splitlines()
+
+    def state(self):
+        return {"inode": self.inode, "offset": self.offset}
+
+    @classmethod
+    def from_state(cls, path, state, header=False):
+        if not state:
+            return cls(path, header)
+        return cls(path, header, state.get("offset", 0), state.get("inode"))
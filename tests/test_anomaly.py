@@ -0,0 +1,70 @@
+import os
+import sys
+
+import pytest
+
+np = pytest.importorskip('numpy')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from anomaly import RATE, VitalsAnomalyDetector, VitalsMonitor
+
+
+def feed(detector, readings, start=0.0, interval=0.5):
+    # heartRate readings for one device; returns the reason mask of each.
+    out = []
+    for i, hr in enumerate(readings):
+        x = np.array([[hr, 98.0, 36.8, 22.0]])
+        out.append(int(detector.update(['dev'], np.array([start + i * interval]), x)[0, 0]))
+    return out
+
+
+def detector():
+    # Statistical checks switched off, so only LIMIT and RATE can fire.
+    return VitalsAnomalyDetector(min_samples=10 ** 6)
+
+
+def test_single_step_between_readings_is_not_a_rate_anomaly():
+    # +15 bpm within 0.5 s would be 30 bpm/s against the previous reading.
+    reasons = feed(detector(), [70.0] * 20 + [85.0] * 20)
+    assert not any(r & RATE for r in reasons)
+
+
+def test_sustained_fast_change_is_a_rate_anomaly():
+    ramp = [70.0] * 20 + [70.0 + 12 * i for i in range(1, 7)]  # 24 bpm/s for 3 s, within LIMITS
+    reasons = feed(detector(), ramp)
+    assert not any(r & RATE for r in reasons[:20])
+    assert any(r & RATE for r in reasons[20:])
+
+
+def test_no_rate_check_across_a_long_gap():
+    d = detector()
+    feed(d, [70.0] * 10)
+    assert not feed(d, [140.0], start=100.0)[0] & RATE
+
+
+class Recorder(VitalsMonitor):
+    def __init__(self):
+        self.writes = 0
+        super().__init__(alerts_file=None, interval=3600)
+
+    def _write_alerts(self):
+        self.writes += 1
+
+
+def test_alerts_are_rewritten_when_their_value_or_reason_changes():
+    monitor = Recorder()
+    row = {'device_id': 'dev', 'spo2': 98, 'body_temperature': 36.8, 'ambient_temperature': 22}
+    writes = monitor.writes
+    monitor.submit([dict(row, heartRate=30, ts=1.0)])
+    monitor.check(now=1.0)
+    assert monitor.writes == writes + 1
+    assert monitor.alerts()[0]['value'] == 30.0
+
+    monitor.submit([dict(row, heartRate=30, ts=1.5)])  # same alert, only `last` moves
+    monitor.check(now=1.5)
+    assert monitor.writes == writes + 1
+
+    monitor.submit([dict(row, heartRate=25, ts=2.0)])
+    monitor.check(now=2.0)
+    assert monitor.writes == writes + 2
+    assert monitor.alerts()[0]['value'] == 25.0
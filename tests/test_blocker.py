@@ -0,0 +1,89 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from blocker import Blocker, DryRunBackend
+from eventstore import EventStore
+
+
+def dry_run_blocker(tmp_path, **kwargs):
+    backend = DryRunBackend(verbose=False)
+    kwargs.setdefault('blocked_file', str(tmp_path / 'blocked_ips.txt'))
+    return backend, Blocker(backend, batch_interval=0.0, persist_debounce=0.0, **kwargs)
+
+
+def blocked_file(tmp_path):
+    with open(tmp_path / 'blocked_ips.txt') as f:
+        return sorted(line.strip() for line in f)
+
+
+def test_block_and_unblock_are_batched(tmp_path):
+    backend, blocker = dry_run_blocker(tmp_path)
+    blocker.block('10.0.0.1')
+    blocker.block('10.0.0.2')
+    blocker.block('10.0.0.3')
+    blocker.unblock('10.0.0.3')
+    blocker._apply_pending()
+    assert backend.calls == [('apply', [('10.0.0.1', 0), ('10.0.0.2', 0)], ['10.0.0.3'])]
+    assert backend.blocked == {'10.0.0.1', '10.0.0.2'}
+    assert blocker.is_blocked('10.0.0.1') and not blocker.is_blocked('10.0.0.3')
+    assert blocked_file(tmp_path) == ['10.0.0.1', '10.0.0.2']
+
+    blocker.unblock('10.0.0.1')
+    blocker.block('10.0.0.2')  # already blocked for good: nothing to re-add
+    blocker._apply_pending()
+    assert backend.calls[-1] == ('apply', [], ['10.0.0.1'])
+    assert blocked_file(tmp_path) == ['10.0.0.2']
+
+
+def test_ttl_blocks_expire(tmp_path):
+    backend, blocker = dry_run_blocker(tmp_path, default_ttl=0.05)
+    blocker.block('10.0.0.1')
+    blocker.block('10.0.0.2', ttl=0)
+    blocker._apply_pending()
+    assert blocker.blocked['10.0.0.1'] is not None and blocker.blocked['10.0.0.2'] is None
+    time.sleep(0.06)
+    blocker._apply_pending()
+    assert backend.calls[-1] == ('apply', [], ['10.0.0.1'])
+    assert list(blocker.blocked) == ['10.0.0.2']
+    assert blocked_file(tmp_path) == ['10.0.0.2']
+
+
+def test_worker_applies_blocks_and_persists_on_stop(tmp_path):
+    backend, blocker = dry_run_blocker(tmp_path)
+    blocker.start()
+    blocker.block('10.0.0.1')
+    deadline = time.monotonic() + 2.0
+    while not blocker.is_blocked('10.0.0.1') and time.monotonic() < deadline:
+        time.sleep(0.01)
+    blocker.stop()
+    assert backend.blocked == {'10.0.0.1'}
+    assert backend.calls[0] == ('setup',) and ('persist',) in backend.calls
+
+
+def test_start_restores_blocks_with_their_remaining_ttl(tmp_path):
+    store = EventStore(str(tmp_path / 'events.db'))
+    now = time.time()
+    store.update_blocks({'10.0.0.1': None, '10.0.0.2': now + 100, '10.0.0.3': now - 1}, (), now)
+    backend, blocker = dry_run_blocker(tmp_path, blocked_file=None, store=store)
+    assert set(blocker.blocked) == {'10.0.0.1', '10.0.0.2'}
+    blocker.start()
+    blocker.stop()
+    store.close()
+    assert backend.calls[0] == ('setup',)
+    _, adds, removes = backend.calls[1]
+    adds = dict(adds)
+    assert set(adds) == {'10.0.0.1', '10.0.0.2'} and removes == []
+    assert adds['10.0.0.1'] == 0
+    assert 99 < adds['10.0.0.2'] <= 100
+
+
+def test_start_restores_the_blocked_file(tmp_path):
+    (tmp_path / 'blocked_ips.txt').write_text('10.0.0.1\n10.0.0.2\n')
+    backend, blocker = dry_run_blocker(tmp_path)
+    blocker.start()
+    blocker.stop()
+    assert backend.calls[1] == ('apply', [('10.0.0.1', 0), ('10.0.0.2', 0)], [])
+    assert backend.blocked == {'10.0.0.1', '10.0.0.2'}
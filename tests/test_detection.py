@@ -0,0 +1,95 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from detection import DetectionEngine
+
+
+def engine(**kwargs):
+    settings = dict(window_seconds=10.0, window_size=100, min_count=10, min_ratio=0.9, min_rate=0.0)
+    settings.update(kwargs)
+    return DetectionEngine(**settings)
+
+
+def feed(e, ip, n, malicious=True, start=0.0, interval=0.01, weight=1):
+    # Returns the number of times ip crossed the thresholds.
+    return sum(e.update(ip, malicious, now=start + i * interval, weight=weight) for i in range(n))
+
+
+def test_flags_once_at_min_count():
+    e = engine()
+    assert [e.update('a', True, now=i * 0.01) for i in range(12)] == [False] * 9 + [True, False, False]
+    assert e.flagged() == ['a']
+    assert e.stats('a') == {'count': 12, 'malicious': 12, 'flagged': True}
+
+
+def test_ratio_threshold():
+    e = engine()
+    assert not feed(e, 'a', 10, malicious=False)
+    assert not feed(e, 'a', 80, start=1.0)  # 80 of 90 < 0.9
+    assert feed(e, 'a', 10, start=2.0) == 1  # 90 of 100, benign ones expiring by count
+
+
+def test_rate_threshold():
+    e = engine(min_rate=2.0)
+    assert not feed(e, 'a', 19, interval=0.1)  # 19 malicious in a 10 s window < 2/s
+    assert feed(e, 'a', 1, start=1.9) == 1
+
+
+def test_flow_weight_counts_as_packets():
+    e = engine()
+    assert e.update('a', True, now=0.0, weight=10)
+    assert e.stats('a')['count'] == 10
+
+
+def test_window_expires_old_events():
+    e = engine()
+    feed(e, 'a', 9, interval=0.1)
+    # 20 s later the first nine have left the window, so this is one prediction, not ten.
+    assert not e.update('a', True, now=20.0)
+    assert e.stats('a')['count'] == 1
+
+
+def test_window_size_bounds_the_events_kept():
+    e = engine(window_size=20)
+    feed(e, 'a', 50)
+    assert e.stats('a')['count'] == 20
+    assert len(e.sources['a'].events) == 20
+
+
+def test_dropping_below_threshold_allows_a_new_flag():
+    e = engine(window_size=10)
+    assert feed(e, 'a', 10) == 1
+    feed(e, 'a', 5, malicious=False, start=1.0)
+    assert e.flagged() == []
+    assert feed(e, 'a', 10, start=2.0) == 1
+
+
+def test_forget_excludes_unless_asked_not_to():
+    e = engine()
+    feed(e, 'a', 10)
+    feed(e, 'b', 10)
+    e.forget('a')
+    e.forget('b', exclude=False)
+    assert e.stats('a') is None and e.stats('b') is None
+    assert not feed(e, 'a', 20, start=1.0)
+    assert feed(e, 'b', 20, start=1.0) == 1
+
+
+def test_excluded_and_empty_sources_are_ignored():
+    e = engine(exclude=['192.168.1.1'])
+    assert not feed(e, '192.168.1.1', 20)
+    assert not feed(e, '', 20)
+    assert e.sources == {}
+
+
+def test_idle_and_excess_sources_are_evicted():
+    e = engine(idle_timeout=5.0, max_sources=3)
+    for i, ip in enumerate(['a', 'b', 'c', 'd']):
+        e.update(ip, True, now=float(i))
+    assert list(e.sources) == ['b', 'c', 'd'] and e.evicted == 1
+    e.update('b', True, now=4.0)  # b is now the most recently seen
+    assert e.evict_idle(now=8.5) == 2
+    assert list(e.sources) == ['b']
+    assert e.evicted == 3
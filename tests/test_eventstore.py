@@ -0,0 +1,20 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from eventstore import EventStore
+
+
+def test_prune_applies_the_retention_to_predictions_and_alerts(tmp_path):
+    store = EventStore(str(tmp_path / 'events.db'), retention=100)
+    store.add_alert('10.0.0.1', 'attack', now=1000.0)
+    store.add_alert('10.0.0.1', 'blocked', now=1950.0)
+    store.add_predictions([('10.0.0.1', True, 1), ('10.0.0.2', False, 1)], now=1000.0)
+    store.add_predictions([('10.0.0.1', True, 1)], now=1950.0)  # prunes as it inserts
+
+    assert [row[1] for row in store.predictions(0, 3000)] == [1950.0]
+    assert [row[3] for row in store.alerts(0, 3000)] == ['blocked']
+    # The rollups keep the pruned history.
+    assert dict((ip, (m, b)) for ip, m, b in store.top_sources(0, 3000)) == {'10.0.0.1': (2, 0), '10.0.0.2': (0, 1)}
+    store.close()
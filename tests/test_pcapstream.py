@@ -0,0 +1,80 @@
+import os
+import struct
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pcapstream import GLOBAL_HEADER_LEN, PcapTail
+
+HEADER = struct.pack('<IHHiIII', 0xa1b2c3d4, 2, 4, 0, 0, 65535, 1)
+
+
+def record(i, size=60):
+    payload = bytes([i % 256]) * size
+    return struct.pack('<IIII', 1700000000 + i, i * 1000, size, size) + payload
+
+
+def payloads(chunk):
+    # First payload byte of every record in a chunk.
+    out, pos = [], GLOBAL_HEADER_LEN
+    while pos < len(chunk):
+        size = struct.unpack_from('<I', chunk, pos + 8)[0]
+        out.append(chunk[pos + 16])
+        pos += 16 + size
+    return out
+
+
+def read_all(tail):
+    out = []
+    while True:
+        chunk, n = tail.read_new()
+        if chunk is None:
+            return out
+        assert len(payloads(chunk)) == n
+        out += payloads(chunk)
+
+
+def test_reads_only_new_records(tmp_path):
+    path = tmp_path / 'capture.pcap'
+    path.write_bytes(HEADER + record(0) + record(1) + record(2)[:30])
+    tail = PcapTail(str(path))
+    assert read_all(tail) == [0, 1]
+    with open(path, 'ab') as f:
+        f.write(record(2)[30:] + record(3))
+    assert read_all(tail) == [2, 3]
+    assert tail.packets == 4
+
+
+def test_corrupt_record_resyncs_instead_of_restarting(tmp_path):
+    path = tmp_path / 'capture.pcap'
+    garbage = b'\xff' * 37
+    path.write_bytes(HEADER + record(0) + record(1) + garbage + b''.join(record(i) for i in range(2, 6)))
+    tail = PcapTail(str(path))
+    assert read_all(tail) == [0, 1, 2, 3, 4, 5]
+    assert tail.resets == 0
+    assert tail.skipped_bytes == len(garbage)
+    with open(path, 'ab') as f:
+        f.write(record(6))
+    assert read_all(tail) == [6]
+
+
+def test_resync_waits_for_a_confirming_record(tmp_path):
+    path = tmp_path / 'capture.pcap'
+    path.write_bytes(HEADER + record(0) + b'\xff' * 5 + record(1))
+    tail = PcapTail(str(path))
+    assert read_all(tail) == [0]
+    with open(path, 'ab') as f:
+        f.write(record(2))
+    assert read_all(tail) == [1, 2]
+    assert tail.resets == 0
+
+
+def test_rewritten_file_restarts(tmp_path):
+    path = tmp_path / 'capture.pcap'
+    path.write_bytes(HEADER + record(0) + record(1))
+    tail = PcapTail(str(path))
+    assert read_all(tail) == [0, 1]
+    other = HEADER[:8] + struct.pack('<i', 3600) + HEADER[12:]
+    path.write_bytes(other + record(7) + record(8) + record(9))
+    assert read_all(tail) == [7, 8, 9]
+    assert tail.resets == 1
@@ -0,0 +1,70 @@
+import os
+import sys
+import time
+
+import pytest
+
+np = pytest.importorskip('numpy')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hotswap import ModelSwapper
+from predcache import CachedModel, PredictionCache
+
+
+class Linear:
+    def __init__(self, offset):
+        self.offset = offset
+
+    def predict(self, X, **kwargs):
+        s = np.asarray(X, dtype=np.float32).sum(axis=1)
+        return np.stack([s + self.offset, -s], axis=1)
+
+
+class FailsAfter(Linear):
+    def __init__(self, offset, calls):
+        super().__init__(offset)
+        self.calls = calls
+
+    def predict(self, X, **kwargs):
+        if self.calls <= 0:
+            raise RuntimeError("model broke")
+        self.calls -= 1
+        return super().predict(X, **kwargs)
+
+
+def swapped_in(old, new):
+    swapper = ModelSwapper(old, '/nonexistent/model.h5', loader=None)
+    swapper.last_warmup_s = 0.0
+    swapper._pending = (new, time.monotonic())
+    cache = PredictionCache(max_entries=16)
+    model = CachedModel(swapper, cache)
+    swapper.on_swap.append(cache.invalidate)
+    assert swapper.poll()
+    return swapper, cache, model
+
+
+def test_rollback_during_cached_batch_rescores_with_previous_model():
+    old = Linear(0.0)
+    swapper, cache, model = swapped_in(old, FailsAfter(100.0, calls=1))
+    a, b, c = [1, 2], [3, 4], [5, 6]
+    first = model.predict(np.array([a, b], dtype=np.float32))
+    assert first[0, 0] == 103.0
+
+    # a is a cache hit from the new model, c is a miss that makes the new model fail.
+    X = np.array([a, c, a], dtype=np.float32)
+    out = model.predict(X)
+    np.testing.assert_array_equal(out, old.predict(X))
+    assert swapper.rollbacks == 1 and swapper.current is old
+
+    out = model.predict(np.array([b, c], dtype=np.float32))
+    np.testing.assert_array_equal(out, old.predict(np.array([b, c], dtype=np.float32)))
+    assert cache.stats()["entries"] == 3
+
+
+def test_cache_hits_skip_the_model():
+    model = Linear(1.0)
+    cache = PredictionCache(max_entries=4)
+    X = np.array([[1, 1], [1, 1], [2, 2]], dtype=np.float32)
+    np.testing.assert_array_equal(cache.predict(model, X), model.predict(X))
+    np.testing.assert_array_equal(cache.predict(model, X[:1]), model.predict(X[:1]))
+    assert cache.stats()["model_rows"] == 2
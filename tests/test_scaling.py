@@ -0,0 +1,68 @@
+import os
+import sys
+
+import pytest
+
+np = pytest.importorskip('numpy')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scaling import RunningScaler
+
+
+def batches(X, sizes):
+    start = 0
+    for size in sizes:
+        yield X[start:start + size]
+        start += size
+
+
+def test_batch_merge_matches_numpy():
+    rng = np.random.default_rng(0)
+    # Large offsets with small spread: the naive sum-of-squares formula loses this variance.
+    X = rng.normal(loc=[1e6, -3.0, 0.0, 5e3], scale=[0.5, 2.0, 1e-3, 40.0], size=(1000, 4))
+    scaler = RunningScaler(4)
+    for batch in batches(X, [1, 2, 0, 97, 300, 1, 599]):
+        scaler.partial_fit(batch)
+    assert scaler.count == 1000
+    np.testing.assert_allclose(scaler.mean, X.mean(axis=0), rtol=1e-12)
+    np.testing.assert_allclose(scaler.var, X.var(axis=0), rtol=1e-9)
+
+
+def test_single_rows_match_one_batch():
+    X = np.random.default_rng(1).normal(size=(200, 3))
+    one_by_one, at_once = RunningScaler(3), RunningScaler(3).partial_fit(X)
+    for row in X:
+        one_by_one.partial_fit(row[None])
+    np.testing.assert_allclose(one_by_one.mean, at_once.mean)
+    np.testing.assert_allclose(one_by_one.m2, at_once.m2)
+
+
+def test_transform_standardises_and_centres_constant_columns():
+    X = np.column_stack([np.arange(10.0), np.full(10, 7.0)])
+    scaler = RunningScaler(2).partial_fit(X)
+    out = scaler.transform(X)
+    assert out.dtype == np.float32
+    np.testing.assert_allclose(out[:, 0], (X[:, 0] - 4.5) / X[:, 0].std(), rtol=1e-6)
+    np.testing.assert_array_equal(out[:, 1], 0.0)
+    buf = np.empty((10, 2), np.float32)
+    assert scaler.transform(X, out=buf) is buf
+    np.testing.assert_allclose(buf, out)
+
+
+def test_frozen_statistics_are_not_updated():
+    scaler = RunningScaler.from_dict({'mode': 'frozen', 'mean': [1.0, 2.0], 'var': [4.0, 9.0]})
+    scaler.partial_fit(np.ones((5, 2)))
+    np.testing.assert_array_equal(scaler.mean, [1.0, 2.0])
+    np.testing.assert_array_equal(scaler.scale, [2.0, 3.0])
+
+
+def test_save_and_load_round_trip(tmp_path):
+    path = str(tmp_path / 'scaler.json')
+    scaler = RunningScaler(3).partial_fit(np.random.default_rng(2).normal(size=(50, 3)))
+    scaler.save(path)
+    loaded = RunningScaler.load(path, 3)
+    assert loaded.count == 50
+    np.testing.assert_array_equal(loaded.mean, scaler.mean)
+    np.testing.assert_array_equal(loaded.m2, scaler.m2)
+    with pytest.raises(ValueError):
+        RunningScaler.load(path, 4)
@@ -0,0 +1,51 @@
+import os
+import struct
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from segments import SegmentWriter, completed_segments, load_segment_state, save_segment_state
+
+HEADER = struct.pack('<IHHiIII', 0xa1b2c3d4, 2, 4, 0, 0, 65535, 1)
+
+
+def record(payload=b'x' * 60):
+    return struct.pack('<IIII', 0, 0, len(payload), len(payload)) + payload
+
+
+def write_segments(writer, count):
+    writer.feed(HEADER, now=0.0)
+    for i in range(count):
+        writer.feed(record(), now=float(i))
+        writer.tick(now=i + 10.0)
+    writer.close()
+
+
+def test_segments_rotate_on_age(tmp_path):
+    writer = SegmentWriter(str(tmp_path / 'seg'), max_seconds=1.0, state_path=str(tmp_path / 'state'))
+    write_segments(writer, 3)
+    segments = completed_segments(str(tmp_path / 'seg'))
+    assert [seq for seq, _ in segments] == [0, 1, 2]
+    with open(segments[0][1], 'rb') as f:
+        assert f.read() == HEADER + record()
+
+
+def test_restart_with_empty_directory_continues_after_extracted_segments(tmp_path):
+    directory, state = str(tmp_path / 'seg'), str(tmp_path / 'state')
+    write_segments(SegmentWriter(directory, state_path=state), 3)
+    # rtf.py extracts and deletes everything, recording the last segment it emitted.
+    for seq, path in completed_segments(directory):
+        os.remove(path)
+        save_segment_state(seq, state)
+    assert load_segment_state(state) == 2
+
+    write_segments(SegmentWriter(directory, state_path=state), 2)
+    assert [seq for seq, _ in completed_segments(directory)] == [3, 4]
+
+
+def test_restart_continues_after_segments_on_disk(tmp_path):
+    directory, state = str(tmp_path / 'seg'), str(tmp_path / 'state')
+    write_segments(SegmentWriter(directory, state_path=state), 3)
+    save_segment_state(0, state)
+    write_segments(SegmentWriter(directory, state_path=state), 1)
+    assert [seq for seq, _ in completed_segments(directory)] == [0, 1, 2, 3]
@@ -0,0 +1,99 @@
+import itertools
+import multiprocessing
+import os
+import sys
+
+import pytest
+
+np = pytest.importorskip('numpy')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shmring import ShmRing, ip_to_u32, u32_to_ip
+
+_names = itertools.count()
+
+
+@pytest.fixture
+def ring():
+    ring = ShmRing.create(f'ids_test_{os.getpid()}_{next(_names)}', capacity=8, n_features=3)
+    yield ring
+    ring.close()
+
+
+def rows(start, n):
+    return np.arange(start * 3, (start + n) * 3, dtype=np.float32).reshape(n, 3)
+
+
+def read_all(ring, max_n=None):
+    out = []
+    while True:
+        views = ring.read(max_n, timeout=0)
+        if views is None:
+            return np.concatenate(out) if out else np.empty((0, 3), np.float32)
+        out.append(views[0].copy())
+        ring.release(len(views[0]))
+
+
+def test_records_wrap_around_the_end(ring):
+    expected, got = [], []
+    for i in range(0, 60, 5):
+        X = rows(i, 5)
+        assert ring.write(X, [ip_to_u32('10.0.0.1')] * 5, ts=np.full(5, float(i))) == 5
+        expected.append(X)
+        # A read never crosses the end of the ring, so a wrapped batch comes back in two parts.
+        views = ring.read(timeout=0)
+        assert len(views[0]) <= 8 - ring.consumed % 8
+        got.append(views[0].copy())
+        assert u32_to_ip(int(views[1][0])) == '10.0.0.1' and views[3][0] == float(i)
+        ring.release(len(views[0]))
+        got.append(read_all(ring))
+    np.testing.assert_array_equal(np.concatenate(got), np.concatenate(expected))
+    assert ring.written == ring.consumed == 60
+
+
+def test_full_ring_blocks_the_writer(ring):
+    assert ring.write(rows(0, 12), [0] * 12, timeout=0.01) == 8
+    assert ring.free == 0 and len(ring) == 8
+    assert ring.reserve(1, timeout=0) is None
+    views = ring.read(max_n=3)
+    ring.release(len(views[0]))
+    assert ring.write(rows(8, 4), [0] * 4, timeout=0.01) == 3
+    np.testing.assert_array_equal(read_all(ring), np.concatenate([rows(3, 5), rows(8, 3)]))
+
+
+def test_reader_sees_remaining_records_then_close():
+    writer = ShmRing.create(f'ids_test_{os.getpid()}_{next(_names)}', capacity=8, n_features=3)
+    reader = ShmRing.attach(writer.name)
+    writer.write(rows(0, 2), [0, 0])
+    writer.close()
+    assert reader.closed
+    np.testing.assert_array_equal(read_all(reader), rows(0, 2))
+    assert reader.read(timeout=None) is None  # closed and drained: no wait
+    reader.close()
+    assert reader.closed
+
+
+def _produce(name, n, batch):
+    ring = ShmRing.attach(name, timeout=5)
+    for start in range(0, n, batch):
+        count = min(batch, n - start)
+        ring.write(rows(start, count), np.arange(start, start + count, dtype=np.uint32))
+    ring.close()
+
+
+def test_second_process_attaches_and_writes(ring):
+    n = 1000
+    ctx = multiprocessing.get_context('spawn')  # own resource tracker, like a pipeline stage
+    child = ctx.Process(target=_produce, args=(ring.name, n, 7))
+    child.start()
+    X, ips = [], []
+    while sum(len(x) for x in X) < n:
+        views = ring.read(timeout=10)
+        assert views is not None, "producer stalled"
+        X.append(views[0].copy())
+        ips.append(views[1].copy())
+        ring.release(len(views[0]))
+    child.join(10)
+    assert child.exitcode == 0
+    np.testing.assert_array_equal(np.concatenate(X), rows(0, n))
+    np.testing.assert_array_equal(np.concatenate(ips), np.arange(n))
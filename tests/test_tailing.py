@@ -0,0 +1,72 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tailing import FileTail
+
+
+def test_returns_only_complete_new_lines(tmp_path):
+    path = tmp_path / 'log.csv'
+    path.write_text('a,b\n1,2\n3,')
+    tail = FileTail(str(path), header=True)
+    assert tail.read_lines() == ['1,2']
+    assert tail.header == 'a,b'
+    assert tail.read_lines() == []
+    with open(path, 'a') as f:
+        f.write('4\n5,6\n')
+    assert tail.read_lines() == ['3,4', '5,6']
+
+
+def test_rotation_to_a_new_file_starts_from_the_top(tmp_path):
+    path = tmp_path / 'log.csv'
+    path.write_text('a,b\n1,2\n')
+    tail = FileTail(str(path), header=True)
+    assert tail.read_lines() == ['1,2']
+    os.rename(path, tmp_path / 'log.csv.1')
+    path.write_text('c,d\n3,4\n5,6\n7,8\n')  # new inode, and longer than the old offset
+    assert tail.read_lines() == ['3,4', '5,6', '7,8']
+    assert tail.header == 'c,d' and tail.resets == 1
+
+
+def test_truncation_starts_from_the_top(tmp_path):
+    path = tmp_path / 'log.txt'
+    path.write_text('one\ntwo\nthree\n')
+    tail = FileTail(str(path))
+    assert tail.read_lines() == ['one', 'two', 'three']
+    with open(path, 'w') as f:  # truncated in place: same inode, shorter file
+        f.write('four\n')
+    assert tail.read_lines() == ['four']
+    assert tail.resets == 1
+
+
+def test_state_resumes_after_restart(tmp_path):
+    path = tmp_path / 'log.txt'
+    path.write_text('one\ntwo\n')
+    tail = FileTail(str(path))
+    tail.read_lines()
+    with open(path, 'a') as f:
+        f.write('three\n')
+    resumed = FileTail.from_state(str(path), tail.state())
+    assert resumed.read_lines() == ['three']
+
+
+def test_seek_end_skips_existing_lines(tmp_path):
+    path = tmp_path / 'log.txt'
+    path.write_text('old\n')
+    tail = FileTail(str(path))
+    tail.seek_end()
+    with open(path, 'a') as f:
+        f.write('new\n')
+    assert tail.read_lines() == ['new']
+
+
+def test_missing_file_and_overlong_lines(tmp_path):
+    path = tmp_path / 'log.txt'
+    tail = FileTail(str(path))
+    assert tail.read_lines() == []
+    path.write_text('x' * 120 + '\nshort\n')
+    # The long line is skipped, not waited on, and none of it comes back as a line.
+    assert tail.read_lines(max_bytes=50) == []
+    assert tail.read_lines(max_bytes=50) == []
+    assert tail.read_lines(max_bytes=50) == ['short']
@@ -0,0 +1,128 @@
+import os
+import sys
+
+import pytest
+
+np = pytest.importorskip('numpy')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import tfliteinfer
+from tfliteinfer import TFLiteModel, dequantize, quantize
+
+
+@pytest.fixture(scope='module')
+def tf():
+    return pytest.importorskip('tensorflow')
+
+
+@pytest.fixture(scope='module')
+def keras_model(tf):
+    tf.keras.utils.set_random_seed(0)
+    return tf.keras.Sequential([
+        tf.keras.Input(shape=(21,)),
+        tf.keras.layers.Dense(8, activation='relu'),
+        tf.keras.layers.Dense(5, activation='softmax'),
+    ])
+
+
+@pytest.fixture(scope='module')
+def model_files(tf, keras_model, tmp_path_factory):
+    path = tmp_path_factory.mktemp('tflite') / 'model.float16.tflite'
+    converter = tf.lite.TFLiteConverter.from_keras_model(keras_model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.target_spec.supported_types = [tf.float16]
+    path.write_bytes(converter.convert())
+    return keras_model, str(path)
+
+
+def test_empty_batch_keeps_the_output_width(model_files):
+    _, path = model_files
+    model = TFLiteModel(path)
+    assert model.predict(np.zeros((0, 21), np.float32)).shape == (0, 5)
+
+
+def test_matches_keras_across_batch_buckets(model_files):
+    keras_model, path = model_files
+    model = TFLiteModel(path, max_batch=16)
+    X = np.random.default_rng(0).normal(size=(37, 21)).astype(np.float32)
+    out = model.predict(X)
+    assert out.shape == (37, 5)
+    np.testing.assert_allclose(out, keras_model.predict(X, verbose=0), atol=1e-2)
+
+
+@pytest.mark.parametrize('integer_io', [False, True])
+def test_int8_round_trip_matches_keras(keras_model, tmp_path, integer_io):
+    from quantize import convert
+    h5 = tmp_path / 'model.h5'
+    keras_model.save(h5)
+    X = np.random.default_rng(1).normal(size=(200, 21)).astype(np.float32)
+    path = tmp_path / 'model.int8.tflite'
+    path.write_bytes(convert(str(h5), 'int8', X, integer_io=integer_io))
+
+    model = TFLiteModel(str(path), max_batch=64)
+    assert (model.input_quant is not None) == integer_io
+    out = model.predict(X)
+    assert out.dtype == np.float32 and out.shape == (200, 5)
+    expected = keras_model.predict(X, verbose=0)
+    np.testing.assert_allclose(out, expected, atol=0.05)
+    assert (out.argmax(axis=1) == expected.argmax(axis=1)).mean() > 0.9
+
+
+def test_quantize_rounds_and_saturates():
+    q = quantize([-100.0, -1.26, 0.0, 0.24, 0.26, 100.0], 0.5, 3, np.int8)
+    assert q.dtype == np.int8
+    assert q.tolist() == [-128, 0, 3, 3, 4, 127]
+    np.testing.assert_array_equal(dequantize(q, 0.5, 3), [-65.5, -1.5, 0.0, 0.0, 0.5, 62.0])
+
+
+def test_dequantize_inverts_quantize_within_half_a_step():
+    X = np.random.default_rng(2).uniform(-30, 30, size=1000).astype(np.float32)
+    back = dequantize(quantize(X, 0.25, -7, np.int8), 0.25, -7)
+    assert back.dtype == np.float32
+    assert np.abs(back - X).max() <= 0.125 + 1e-6
+
+
+class IntegerIdentity:
+    # Stand-in interpreter for a model with int8 input and output tensors that passes its
+    # (dequantised) input through, so predict's (de)quantisation is checked without TensorFlow.
+    IN, OUT = (0.5, 3), (0.25, -1)
+
+    def __init__(self, model_content=None, num_threads=None):
+        self.shape = [1, 4]
+
+    def get_input_details(self):
+        return [{'index': 0, 'shape': np.array(self.shape), 'dtype': np.int8, 'quantization': self.IN}]
+
+    def get_output_details(self):
+        return [{'index': 1, 'shape': np.array(self.shape), 'dtype': np.int8, 'quantization': self.OUT}]
+
+    def resize_tensor_input(self, index, shape):
+        self.shape = list(shape)
+
+    def allocate_tensors(self):
+        pass
+
+    def set_tensor(self, index, value):
+        assert value.dtype == np.int8 and list(value.shape) == self.shape
+        self.value = value
+
+    def invoke(self):
+        self.result = quantize(dequantize(self.value, *self.IN), *self.OUT, np.int8)
+
+    def get_tensor(self, index):
+        return self.result
+
+
+def test_predict_quantizes_integer_io_tensors(tmp_path, monkeypatch):
+    monkeypatch.setattr(tfliteinfer, '_interpreter_class', lambda: IntegerIdentity)
+    path = tmp_path / 'model.int8.tflite'
+    path.write_bytes(b'')
+    model = TFLiteModel(str(path), max_batch=8)
+    assert model.input_quant == (0.5, 3) and model.output_quant == (0.25, -1)
+
+    X = np.random.default_rng(3).uniform(-20, 20, size=(19, 4)).astype(np.float32)
+    out = model.predict(X)
+    assert out.dtype == np.float32 and out.shape == (19, 4)
+    # Input rounding (half of 0.5) plus output rounding (half of 0.25).
+    assert np.abs(out - X).max() <= 0.25 + 0.125 + 1e-6
+    assert model.predict(np.zeros((0, 4), np.float32)).shape == (0, 4)
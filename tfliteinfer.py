@@ -0,0 +1,100 @@
+import os
+import numpy as np
+
+# Reduced-precision inference through TensorFlow Lite (IDS_MODEL_BACKEND=int8 or float16).
+# quantize.py converts dbn_iomt_ids.h5 into dbn_iomt_ids.<mode>.tflite; this module only needs
+# the interpreter, from the small tflite-runtime wheel if installed, TensorFlow otherwise.
+# rtp.py always feeds it the same float32 scaled rows as the other backends. The default int8
+# model quantises them internally with the calibrated scales; a model converted with
+# --integer-io has int8 input/output tensors instead, which TFLiteModel (de)quantises here
+# with the tensors' (scale, zero_point).
+
+MODES = ('int8', 'float16')
+
+
+def quantized_path(path, mode):
+    if path.endswith('.tflite'):
+        return path
+    return f"{os.path.splitext(path)[0]}.{mode}.tflite"
+
+
+def quantize(X, scale, zero_point, dtype):
+    info = np.iinfo(dtype)
+    q = np.round(np.asarray(X, dtype=np.float32) / np.float32(scale)) + zero_point
+    return np.clip(q, info.min, info.max).astype(dtype)
+
+
+def dequantize(q, scale, zero_point):
+    return (np.asarray(q, dtype=np.float32) - np.float32(zero_point)) * np.float32(scale)
+
+
+def _quantization(detail):
+    # (scale, zero_point) of an integer tensor, None for a float one.
+    if np.issubdtype(detail['dtype'], np.floating):
+        return None
+    scale, zero_point = detail['quantization']
+    return float(scale), int(zero_point)
+
+
+def _interpreter_class():
+    try:
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:
+        import tensorflow as tf
+        Interpreter = tf.lite.Interpreter
+    return Interpreter
+
+
+class TFLiteModel:
+    # Batches are padded to the next power of two and each size gets its own interpreter, so
+    # tensors are allocated once per size rather than on every call with a new batch size.
+    def __init__(self, path, num_threads=None, max_batch=1024):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.content = f.read()
+        self.num_threads = num_threads
+        self.max_batch = max_batch
+        self._Interpreter = _interpreter_class()
+        self._interpreters = {}
+        probe = self._new_interpreter()
+        detail = probe.get_input_details()[0]
+        self.input_dim = int(detail['shape'][-1])
+        self.input_dtype = detail['dtype']
+        self.input_quant = _quantization(detail)
+        detail = probe.get_output_details()[0]
+        self.output_dim = int(detail['shape'][-1])
+        self.output_quant = _quantization(detail)
+
+    def _new_interpreter(self):
+        return self._Interpreter(model_content=self.content, num_threads=self.num_threads)
+
+    def _interpreter(self, n):
+        bucket = 1 << max(0, n - 1).bit_length()
+        entry = self._interpreters.get(bucket)
+        if entry is None:
+            interp = self._new_interpreter()
+            inp = interp.get_input_details()[0]['index']
+            interp.resize_tensor_input(inp, [bucket, self.input_dim])
+            interp.allocate_tensors()
+            entry = self._interpreters[bucket] = (interp, inp, interp.get_output_details()[0]['index'], bucket)
+        return entry
+
+    def predict(self, X, batch_size=None, verbose=0):
+        X = np.asarray(X, dtype=np.float32)
+        step = min(batch_size or self.max_batch, self.max_batch)
+        out = []
+        for start in range(0, len(X), step):
+            chunk = X[start:start + step]
+            interp, inp, outp, bucket = self._interpreter(len(chunk))
+            if len(chunk) < bucket:
+                chunk = np.concatenate([chunk, np.zeros((bucket - len(chunk), self.input_dim), np.float32)])
+            if self.input_quant is not None:
+                chunk = quantize(chunk, *self.input_quant, self.input_dtype)
+            interp.set_tensor(inp, chunk)
+            interp.invoke()
+            result = interp.get_tensor(outp)[:min(step, len(X) - start)]
+            out.append(result.copy() if self.output_quant is None else dequantize(result, *self.output_quant))
+        return np.concatenate(out) if out else np.empty((0, self.output_dim), np.float32)
+
+    def __call__(self, X):
+        return self.predict(X)
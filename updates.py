@@ -0,0 +1,178 @@
+import socket
+import socketserver
+import struct
+import threading
+import numpy as np
+
+# Wire format for federated model updates. A client sends the difference between its locally
+# trained weights and the global model it started from, optionally compressed:
+#   float32 / float16   every value
+#   int8                every value, linearly quantised with one scale per tensor
+#   topk / topk-int8    only the largest |values| (a fraction of each tensor) with their indices
+# Lossy codecs are meant to be used with error feedback: what a message failed to carry is
+# added to the client's next delta, so nothing is dropped for good, only delayed.
+#
+# Message: b"IDSU" | version u16 | round u32 | n_samples u32 | n_tensors u16 | tensors
+# Tensor:  codec u8 | ndim u8 | shape u32[ndim] | payload
+
+MAGIC = b"IDSU"
+VERSION = 1
+HEADER_FMT = "<HIIH"
+CODECS = ("float32", "float16", "int8", "topk", "topk-int8")
+_CODEC_IDS = {name: i for i, name in enumerate(CODECS)}
+
+
+def _quantise(x):
+    scale = float(np.abs(x).max()) / 127.0 if x.size else 0.0
+    q = np.zeros(x.shape, dtype=np.int8) if scale == 0 else np.clip(np.rint(x / scale), -127, 127).astype(np.int8)
+    return struct.pack("<f", scale) + q.tobytes()
+
+
+def _encode_tensor(x, codec, topk):
+    x = np.asarray(x, dtype=np.float32)
+    out = [struct.pack("<BB", _CODEC_IDS[codec], x.ndim), struct.pack(f"<{x.ndim}I", *x.shape)]
+    flat = x.ravel()
+    if codec == "float32":
+        out.append(flat.astype("<f4").tobytes())
+    elif codec == "float16":
+        out.append(flat.astype("<f2").tobytes())
+    elif codec == "int8":
+        out.append(_quantise(flat))
+    else:
+        k = min(flat.size, max(1, int(np.ceil(topk * flat.size))))
+        idx = np.sort(np.argpartition(np.abs(flat), flat.size - k)[flat.size - k:]).astype("<u4")
+        out.append(struct.pack("<I", k) + idx.tobytes())
+        values = flat[idx]
+        out.append(values.astype("<f4").tobytes() if codec == "topk" else _quantise(values))
+    return b"".join(out)
+
+
+def encode(tensors, n_samples, codec="float32", topk=0.01, round_no=0):
+    if codec not in _CODEC_IDS:
+        raise ValueError(f"Unknown update codec: {codec}")
+    parts = [MAGIC, struct.pack(HEADER_FMT, VERSION, round_no, n_samples, len(tensors))]
+    parts += [_encode_tensor(t, codec, topk) for t in tensors]
+    return b"".join(parts)
+
+
+def _dequantise(buf, pos, n):
+    scale = struct.unpack_from("<f", buf, pos)[0]
+    q = np.frombuffer(buf, dtype=np.int8, count=n, offset=pos + 4)
+    return q.astype(np.float32) * scale, pos + 4 + n
+
+
+def decode(data):
+    # Returns (tensors as float32 arrays, n_samples, round).
+    if data[:4] != MAGIC:
+        raise ValueError("Not a model update message")
+    version, round_no, n_samples, n_tensors = struct.unpack_from(HEADER_FMT, data, 4)
+    if version != VERSION:
+        raise ValueError(f"Unsupported update version {version}")
+    pos = 4 + struct.calcsize(HEADER_FMT)
+    tensors = []
+    for _ in range(n_tensors):
+        codec_id, ndim = struct.unpack_from("<BB", data, pos)
+        shape = struct.unpack_from(f"<{ndim}I", data, pos + 2)
+        pos += 2 + 4 * ndim
+        size = int(np.prod(shape))
+        codec = CODECS[codec_id]
+        if codec == "float32":
+            flat = np.frombuffer(data, dtype="<f4", count=size, offset=pos).astype(np.float32)
+            pos += 4 * size
+        elif codec == "float16":
+            flat = np.frombuffer(data, dtype="<f2", count=size, offset=pos).astype(np.float32)
+            pos += 2 * size
+        elif codec == "int8":
+            flat, pos = _dequantise(data, pos, size)
+        else:
+            k = struct.unpack_from("<I", data, pos)[0]
+            idx = np.frombuffer(data, dtype="<u4", count=k, offset=pos + 4)
+            pos += 4 + 4 * k
+            if codec == "topk":
+                values = np.frombuffer(data, dtype="<f4", count=k, offset=pos)
+                pos += 4 * k
+            else:
+                values, pos = _dequantise(data, pos, k)
+            flat = np.zeros(size, dtype=np.float32)
+            flat[idx] = values
+        tensors.append(flat.reshape(shape))
+    return tensors, n_samples, round_no
+
+
+def compress(delta, codec="float32", topk=0.01, residual=None, n_samples=0, round_no=0):
+    # Encodes delta (+ the residual carried over from earlier rounds); returns the message and
+    # the new residual, i.e. whatever the message does not reproduce.
+    corrected = delta if residual is None else [d + r for d, r in zip(delta, residual)]
+    message = encode(corrected, n_samples, codec, topk, round_no)
+    decoded, _, _ = decode(message)
+    return message, [c - d for c, d in zip(corrected, decoded)]
+
+
+def send_update(address, message, timeout=30):
+    with socket.create_connection(address, timeout=timeout) as sock:
+        sock.sendall(struct.pack("<I", len(message)) + message)
+        if sock.recv(1) != b"\x01":
+            raise ConnectionError("Update was not acknowledged")
+
+
+def _recv_exact(sock, n):
+    chunks = []
+    while n:
+        chunk = sock.recv(min(n, 1 << 20))
+        if not chunk:
+            raise ConnectionError("Connection closed mid-message")
+        chunks.append(chunk)
+        n -= len(chunk)
+    return b"".join(chunks)
+
+
+# Stand-in for the aggregation server, listening on loopback. Clients send length-prefixed
+# update messages; each is decoded on arrival and folded into a sample-weighted running sum, so
+# only one model's worth of memory is held however many clients report.
+class LoopbackServer:
+    def __init__(self, host="127.0.0.1", port=0):
+        self.lock = threading.Lock()
+        self.sum = None
+        self.samples = 0
+        self.bytes = 0
+        self.messages = 0
+        server = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                size = struct.unpack("<I", _recv_exact(self.request, 4))[0]
+                server.receive(_recv_exact(self.request, size))
+                self.request.sendall(b"\x01")
+
+        self.tcp = socketserver.ThreadingTCPServer((host, port), Handler)
+        self.tcp.daemon_threads = True
+        self.thread = threading.Thread(target=self.tcp.serve_forever, daemon=True)
+        self.thread.start()
+
+    @property
+    def address(self):
+        return self.tcp.server_address
+
+    def receive(self, message):
+        tensors, n_samples, _ = decode(message)
+        with self.lock:
+            if self.sum is None:
+                self.sum = [np.zeros(t.shape, dtype=np.float64) for t in tensors]
+            for acc, t in zip(self.sum, tensors):
+                acc += n_samples * t.astype(np.float64)
+            self.samples += n_samples
+            self.bytes += len(message) + 4
+            self.messages += 1
+
+    def aggregate(self):
+        # Weighted mean of the deltas received since the last call (FedAvg), plus the bytes and
+        # messages that carried them.
+        with self.lock:
+            mean = None if not self.samples else [acc / self.samples for acc in self.sum]
+            stats = {"bytes": self.bytes, "messages": self.messages}
+            self.sum, self.samples, self.bytes, self.messages = None, 0, 0, 0
+        return mean, stats
+
+    def close(self):
+        self.tcp.shutdown()
+        self.tcp.server_close()
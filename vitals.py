@@ -0,0 +1,240 @@
+import math
+import os
+import re
+import threading
+from collections import OrderedDict
+import numpy as np
+
+# Vitals history for the dashboard charts. Each device keeps two fixed-size, time-ordered ring
+# buffers: the last HISTORY_SAMPLES raw readings, and per-minute min/mean/max for the last
+# MINUTE_SAMPLES minutes, so memory per device is bounded however long the gateway runs.
+# A query for a window reads the raw ring when it still covers the window and the minute ring
+# otherwise, then downsamples to at most `points` points per signal: LTTB (largest triangle
+# three buckets) keeps the visual shape of a line, min/max buckets keep every spike. Payloads
+# therefore stay a few KB whatever the window or the amount of history.
+
+SIGNALS = ['heartRate', 'spo2', 'body_temperature', 'ambient_temperature']
+HISTORY_SAMPLES = int(os.environ.get('IDS_VITALS_SAMPLES', '16384'))
+MINUTE_SAMPLES = int(os.environ.get('IDS_VITALS_MINUTES', str(7 * 24 * 60)))
+MAX_POINTS = 2000
+# Devices with history kept; past this the one that posted least recently is dropped.
+MAX_DEVICES = int(os.environ.get('IDS_VITALS_DEVICES', '64'))
+RING_INITIAL = 256
+# Device ids are chosen by the sensors and end up in the dashboard, so only short plain ones
+# are accepted (rts.py falls back to the sender's address otherwise).
+DEVICE_ID = re.compile(r'^[A-Za-z0-9_.:-]{1,64}$')
+
+
+def valid_device_id(device_id):
+    return isinstance(device_id, str) and DEVICE_ID.match(device_id) is not None
+
+
+class Ring:
+    # Arrays start small and double as samples arrive, up to capacity; they only wrap once full,
+    # so a device that posted a handful of readings costs a few KB rather than the whole ring.
+    def __init__(self, capacity, width, initial=RING_INITIAL):
+        self.capacity = capacity
+        self.width = width
+        self.size = min(initial, capacity)
+        self.ts = np.zeros(self.size, dtype=np.float64)
+        self.values = np.full((self.size, width), np.nan, dtype=np.float32)
+        self.head = 0  # next slot to write
+        self.count = 0
+
+    def _grow(self, n):
+        size = min(self.capacity, max(2 * self.size, self.count + n))
+        ts = np.zeros(size, dtype=np.float64)
+        values = np.full((size, self.width), np.nan, dtype=np.float32)
+        ts[:self.count] = self.ts[:self.count]  # not wrapped yet: samples are in [0, count)
+        values[:self.count] = self.values[:self.count]
+        self.ts, self.values, self.size = ts, values, size
+        self.head = self.count % size
+
+    def append(self, ts, values):
+        n = len(ts)
+        if n > self.capacity:
+            ts, values, n = ts[-self.capacity:], values[-self.capacity:], self.capacity
+        if self.count + n > self.size and self.size < self.capacity:
+            self._grow(n)
+        idx = (self.head + np.arange(n)) % self.size
+        self.ts[idx] = ts
+        self.values[idx] = values
+        self.head = (self.head + n) % self.size
+        self.count = min(self.count + n, self.size)
+
+    def oldest(self):
+        return self.ts[(self.head - self.count) % self.size] if self.count else math.inf
+
+    def window(self, start, end):
+        # Copies of the samples with start <= ts < end, oldest first; the ring is at most two
+        # sorted runs, each cut with a binary search.
+        first = (self.head - self.count) % self.size
+        runs = [(first, min(first + self.count, self.size))]
+        if first + self.count > self.size:
+            runs.append((0, self.head))
+        ts, values = [], []
+        for lo, hi in runs:
+            seg = self.ts[lo:hi]
+            a, b = np.searchsorted(seg, start), np.searchsorted(seg, end)
+            ts.append(seg[a:b])
+            values.append(self.values[lo + a:lo + b])
+        return np.concatenate(ts), np.concatenate(values)
+
+
+class DeviceHistory:
+    def __init__(self, n_signals, samples=HISTORY_SAMPLES, minutes=MINUTE_SAMPLES):
+        self.n = n_signals
+        self.raw = Ring(samples, n_signals)
+        self.minutes = Ring(minutes, 3 * n_signals)  # min | mean | max per signal
+        self.minute = None  # minute being accumulated
+        self._reset_minute()
+        self.last_ts = -math.inf
+        self.last = np.full(n_signals, np.nan, dtype=np.float32)
+
+    def _reset_minute(self):
+        self.m_count = np.zeros(self.n)
+        self.m_sum = np.zeros(self.n)
+        self.m_min = np.full(self.n, np.nan)
+        self.m_max = np.full(self.n, np.nan)
+
+    def _minute_row(self):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(self.m_count > 0, self.m_sum / self.m_count, np.nan)
+        return np.concatenate([self.m_min, mean, self.m_max])
+
+    def add(self, ts, values):
+        # Readings older than the newest one stored are dropped: the rings must stay sorted.
+        keep = ts >= self.last_ts
+        if not keep.all():
+            ts, values = ts[keep], values[keep]
+        if not len(ts):
+            return
+        self.raw.append(ts, values)
+        self.last_ts = ts[-1]
+        self.last = values[-1]
+        minutes = (ts // 60).astype(np.int64)
+        for m in np.unique(minutes).tolist():
+            sel = values[minutes == m].astype(np.float64)
+            if m != self.minute:
+                if self.minute is not None:
+                    self.minutes.append(np.array([self.minute * 60.0]), self._minute_row()[None])
+                self.minute = m
+                self._reset_minute()
+            valid = ~np.isnan(sel)
+            self.m_count += valid.sum(axis=0)
+            self.m_sum += np.where(valid, sel, 0.0).sum(axis=0)
+            self.m_min = np.fmin(self.m_min, np.fmin.reduce(sel, axis=0))
+            self.m_max = np.fmax(self.m_max, np.fmax.reduce(sel, axis=0))
+
+    def window(self, start, end):
+        # ('raw', ts, values) or ('minute', ts, [min | mean | max]) covering [start, end); the
+        # minute ring is only read once raw samples from start have been overwritten.
+        if self.raw.count < self.raw.capacity or start >= self.raw.oldest():
+            ts, values = self.raw.window(start, end)
+            return 'raw', ts, values
+        ts, values = self.minutes.window(start, end)
+        if self.minute is not None and start <= self.minute * 60.0 < end:
+            ts = np.append(ts, self.minute * 60.0)
+            values = np.vstack([values, self._minute_row()[None].astype(np.float32)])
+        return 'minute', ts, values
+
+
+def lttb(t, v, n_out):
+    # Largest-Triangle-Three-Buckets: keeps the first and last point and, from each bucket in
+    # between, the point forming the largest triangle with the previous pick and the next
+    # bucket's average.
+    n = len(t)
+    if n <= n_out or n_out < 3:
+        return t, v
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    picks = np.empty(n_out, dtype=np.int64)
+    picks[0], picks[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        nlo, nhi = hi, edges[i + 2] if i + 2 < len(edges) else n
+        avg_t, avg_v = t[nlo:nhi].mean(), v[nlo:nhi].mean()
+        area = np.abs((t[a] - avg_t) * (v[lo:hi] - v[a]) - (t[a] - t[lo:hi]) * (avg_v - v[a]))
+        a = lo + int(np.argmax(area))
+        picks[i + 1] = a
+    return t[picks], v[picks]
+
+
+def minmax(t, lows, highs, n_buckets):
+    # (bucket start, min, max) over n_buckets buckets of equal sample count.
+    n = len(t)
+    if n <= n_buckets:
+        return t, lows, highs
+    idx = np.linspace(0, n, n_buckets + 1).astype(np.int64)[:-1]
+    return t[idx], np.fmin.reduceat(lows, idx), np.fmax.reduceat(highs, idx)
+
+
+class VitalsStore:
+    def __init__(self, signals=SIGNALS, samples=HISTORY_SAMPLES, minutes=MINUTE_SAMPLES, max_devices=MAX_DEVICES):
+        self.signals = list(signals)
+        self.samples = samples
+        self.minutes = minutes
+        self.max_devices = max_devices
+        self.devices = OrderedDict()  # least recently updated first
+        self.evicted = 0
+        self.lock = threading.Lock()
+
+    def add(self, device, ts, values):
+        # ts: (n,) epoch seconds; values: (n, len(signals)) with NaN for missing readings.
+        # '' is the single sensor of files written before rows carried a device_id.
+        if device and not valid_device_id(device):
+            return False
+        ts = np.asarray(ts, dtype=np.float64)
+        order = np.argsort(ts, kind='stable')  # concurrent requests can land slightly out of order
+        values = np.asarray(values, dtype=np.float32).reshape(len(ts), len(self.signals))[order]
+        with self.lock:
+            history = self.devices.get(device)
+            if history is None:
+                while len(self.devices) >= self.max_devices:
+                    self.devices.popitem(last=False)
+                    self.evicted += 1
+                history = self.devices[device] = DeviceHistory(len(self.signals), self.samples, self.minutes)
+            else:
+                self.devices.move_to_end(device)
+            history.add(ts[order], values)
+        return True
+
+    def summary(self):
+        with self.lock:
+            return [{"device": device, "last_ts": h.last_ts, "samples": h.raw.count,
+                     "latest": dict(zip(self.signals, _rounded(h.last)))}
+                    for device, h in sorted(self.devices.items(), key=lambda d: -d[1].last_ts)]
+
+    def series(self, device, start, end, points=300, method='lttb', signals=None):
+        points = max(3, min(points, MAX_POINTS))
+        with self.lock:
+            history = self.devices.get(device)
+            if history is None:
+                return None
+            resolution, ts, values = history.window(start, end)
+        out = {"device": device, "start": start, "end": end, "resolution": resolution,
+               "method": method, "signals": {}}
+        n = len(self.signals)
+        for name in signals or self.signals:
+            i = self.signals.index(name)
+            if resolution == 'raw':
+                lows = mids = highs = values[:, i]
+            else:
+                lows, mids, highs = values[:, i], values[:, n + i], values[:, 2 * n + i]
+            valid = ~np.isnan(mids)
+            t = ts[valid]
+            if method == 'minmax':
+                t, lo, hi = minmax(t, lows[valid], highs[valid], points // 2)
+                out["signals"][name] = {"t": _times(t), "min": _rounded(lo), "max": _rounded(hi)}
+            else:
+                t, v = lttb(t, mids[valid].astype(np.float64), points)
+                out["signals"][name] = {"t": _times(t), "v": _rounded(v)}
+        return out
+
+
+def _times(t):
+    return np.round(t, 1).tolist()
+
+
+def _rounded(v):
+    return [None if x != x else x for x in np.round(np.asarray(v, dtype=np.float64), 2).tolist()]